@@ -7,6 +7,7 @@ API_URL = os.getenv('API_URL', '')
 USER_EXISTS_ENDPOINT = 'users/{telegram_id}/exists'
 CREATE_USER_ENDPOINT = 'users'
 CREATE_BOX_ENDPOINT = 'users/{telegram_id}/boxes'
+BOX_JOB_ENDPOINT = 'users/{telegram_id}/boxes/jobs/{job_id}'
 DOMAIN_LIST_ENDPOINT = 'services'
 GET_BOXES_ENDPOINT = 'users/{telegram_id}/boxes'
 GET_BOX_ENDPOINT = 'users/{telegram_id}/boxes/{box_id}'
@@ -14,4 +15,7 @@ PAUSE_BOX_ENDPOINT = 'users/{telegram_id}/boxes/{box_id}/pause'
 RESUME_BOX_ENDPOINT = 'users/{telegram_id}/boxes/{box_id}/resume'
 DELETE_BOX_ENDPOINT = 'users/{telegram_id}/boxes/{box_id}'
 
+BOX_JOB_POLL_INTERVAL = 1  # in seconds
+BOX_JOB_POLL_TIMEOUT = 90  # in seconds
+
 API_ERROR = 'В настоящее время бот недоступен 😞'
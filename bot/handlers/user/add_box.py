@@ -11,8 +11,11 @@ from utils.api_client import APIClient
 from utils.exceptions import (
     APIInternalError,
     AvailableServicesNotFound,
+    EmailBoxAlreadyExists,
     EmailCredsInvalid,
+    EmailServerUnavailable,
 )
+from utils.schemas import APIResponse
 from utils.validators import validate_email
 
 
@@ -105,6 +108,12 @@ async def handle_add_more_filters_decision(query: types.CallbackQuery, state: FS
     elif query.data == 'no_more_filters':
         data = await state.get_data()
         create_box_response = await api.create_box(query.from_user.id, data)
+        if not create_box_response.error:
+            await query.message.edit_text(add_email_mg.email_box_verification(), reply_markup=None)
+            if (job_id := create_box_response.data) is not None:
+                create_box_response = await api.wait_box_created(query.from_user.id, job_id)
+            else:
+                create_box_response = APIResponse(data=None, error=APIInternalError)
         if not create_box_response.error:
             await query.message.answer(
                 add_email_mg.email_box_created(),
@@ -117,7 +126,19 @@ async def handle_add_more_filters_decision(query: types.CallbackQuery, state: FS
                 reply_markup=user_reply.bot_main_keyboard()
             )
             await query.message.delete()
-        elif create_box_response.error is APIInternalError:
+        elif create_box_response.error is EmailServerUnavailable:
+            await query.message.answer(
+                add_email_mg.email_server_unavailable(),
+                reply_markup=user_reply.bot_main_keyboard()
+            )
+            await query.message.delete()
+        elif create_box_response.error is EmailBoxAlreadyExists:
+            await query.message.answer(
+                add_email_mg.email_box_already_exists(),
+                reply_markup=user_reply.bot_main_keyboard()
+            )
+            await query.message.delete()
+        else:
             await query.message.answer(
                 text=API_ERROR,
                 reply_markup=user_reply.bot_main_keyboard()
@@ -78,6 +78,21 @@ def incorrect_email_creds() -> str:
     return 'Вы неправильно ввели логин или пароль от почты. Попробуйте еще раз!'
 
 
+def email_server_unavailable() -> str:
+    """Сообщение, которое отправляется, если почтовый сервер не ответил при проверке подключения."""
+    return 'Почтовый сервер сейчас не отвечает 📡 Попробуйте добавить почтовый ящик немного позже.'
+
+
+def email_box_already_exists() -> str:
+    """Сообщение, которое отправляется при повторном добавлении почтового ящика."""
+    return 'Этот почтовый ящик уже отслеживается 📬'
+
+
+def email_box_verification() -> str:
+    """Сообщение, которое отправляется на время проверки подключения к почтовому ящику."""
+    return 'Проверяю подключение к почтовому ящику, это может занять до минуты ⏳'
+
+
 def email_box_created() -> str:
     """Сообщение, которое добавляется, когда почттовый ящик создан."""
     return 'Почтовый ящик успешно создан!💥'
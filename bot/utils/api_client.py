@@ -1,9 +1,14 @@
+import asyncio
 import logging
+import time
 from http import HTTPStatus
 from typing import Any
 
 from aiogram.dispatcher.handler import CancelHandler
 from config.config import (
+    BOX_JOB_ENDPOINT,
+    BOX_JOB_POLL_INTERVAL,
+    BOX_JOB_POLL_TIMEOUT,
     CREATE_BOX_ENDPOINT,
     CREATE_USER_ENDPOINT,
     DELETE_BOX_ENDPOINT,
@@ -19,12 +24,21 @@ from utils.exceptions import (
     APIInternalError,
     AvailableServicesNotFound,
     BotUserNotFound,
+    EmailBoxAlreadyExists,
     EmailBoxNotFound,
     EmailCredsInvalid,
+    EmailServerUnavailable,
     UserBoxesNotFound,
 )
 from utils.schemas import APIResponse
 
+BOX_JOB_ERRORS: dict[str, type[Exception]] = {
+    'user_not_found': BotUserNotFound,
+    'invalid_credentials': EmailCredsInvalid,
+    'imap_timeout': EmailServerUnavailable,
+    'already_exists': EmailBoxAlreadyExists,
+}
+
 
 class APIClient:
     """Клиент для взаимодействия с API"""
@@ -73,13 +87,33 @@ class APIClient:
             'filters': state_data.get('filters', [])
         }
         response = await self.request('POST', CREATE_BOX_ENDPOINT.format(telegram_id=telegram_id), data=data)
-        if response.status_code == HTTPStatus.CREATED:
-            return APIResponse(data=True, error=None)
-        elif response.status_code == HTTPStatus.BAD_REQUEST:
-            return APIResponse(data=None, error=EmailCredsInvalid)
+        if response.status_code == HTTPStatus.ACCEPTED:
+            return APIResponse(data=response.json()['job_id'], error=None)
         else:
             return APIResponse(data=None, error=APIInternalError)
 
+    async def get_box_job(self, telegram_id: int, job_id: str) -> APIResponse:
+        """GET запрос на получение состояния создания почтового ящика."""
+        response = await self.request('GET', BOX_JOB_ENDPOINT.format(telegram_id=telegram_id, job_id=job_id))
+        if response.status_code == HTTPStatus.OK:
+            return APIResponse(data=response.json(), error=None)
+        else:
+            return APIResponse(data=None, error=APIInternalError)
+
+    async def wait_box_created(self, telegram_id: int, job_id: str) -> APIResponse:
+        """Ожидание завершения создания почтового ящика с опросом состояния задачи."""
+        deadline = time.monotonic() + BOX_JOB_POLL_TIMEOUT
+        while time.monotonic() < deadline:
+            job_response = await self.get_box_job(telegram_id, job_id)
+            if job_response.error or job_response.data is None:
+                return job_response
+            if job_response.data['status'] == 'done':
+                return APIResponse(data=job_response.data['box_id'], error=None)
+            if job_response.data['status'] == 'failed':
+                return APIResponse(data=None, error=BOX_JOB_ERRORS.get(job_response.data['error'], APIInternalError))
+            await asyncio.sleep(BOX_JOB_POLL_INTERVAL)
+        return APIResponse(data=None, error=APIInternalError)
+
     async def get_services(self) -> APIResponse:
         """GET запрос на получение доступных сервисов."""
         response = await self.request('GET', DOMAIN_LIST_ENDPOINT)
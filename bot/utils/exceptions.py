@@ -14,6 +14,14 @@ class EmailCredsInvalid(Exception):
     """Неверные учетные данные электронной почты."""
 
 
+class EmailServerUnavailable(Exception):
+    """Почтовый сервер не отвечает."""
+
+
+class EmailBoxAlreadyExists(Exception):
+    """Почтовый ящик уже добавлен."""
+
+
 class AvailableServicesNotFound(Exception):
     """Доступные почтовые сервисы не найдены."""
 
@@ -33,15 +33,42 @@ class LifespanApp:
             send: Callable[[dict], Awaitable[None]]
     ) -> None:
         """Обработка событий жизненного цикла."""
-        message = await receive()
-        if message['type'] == 'lifespan.startup':
-            await self.startup()
-            await send({'type': 'lifespan.startup.complete'})
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await self.startup()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
 
     async def startup(self) -> None:
-        """Обработчик события запуска жизненного цикла. Перезапускает клиенты IMAP."""
-        from infrastructure.utils.restart_imap_clients import restart_imap_clients
-        await restart_imap_clients()
+        """
+        Обработчик события запуска жизненного цикла.
+        Открывает асинхронный пул БД. Клиенты IMAP работают в отдельном процессе (manage.py run_listeners),
+        а в процессе веб-сервера запускаются только при IMAP_LISTENERS_IN_WEB (локальная разработка).
+        """
+        from django.conf import settings
+        from infrastructure.gateways.async_db import async_db
+        if async_db.enabled:
+            await async_db.open()
+        if settings.IMAP_LISTENERS_IN_WEB:
+            from infrastructure.gateways.imap_listeners import listener_node
+            listener_node.start()
+
+    async def shutdown(self) -> None:
+        """
+        Обработчик события остановки жизненного цикла.
+        Передает ящики клиентов IMAP другим узлам с LOGOUT (при IMAP_LISTENERS_IN_WEB) и закрывает пул БД.
+        """
+        from django.conf import settings
+        from infrastructure.gateways.async_db import async_db
+        if settings.IMAP_LISTENERS_IN_WEB:
+            from infrastructure.gateways.imap_listeners import listener_node
+            await listener_node.stop()
+        if async_db.enabled:
+            await async_db.close()
 
 
 django_asgi_app = ASGIStaticFilesHandler(get_asgi_application())
@@ -1,6 +1,7 @@
 import os
 
 from celery import Celery
+from celery.signals import worker_init, worker_process_shutdown
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
@@ -9,3 +10,19 @@ app = Celery('core')
 app.config_from_object('django.conf:settings', namespace='CELERY')
 
 app.autodiscover_tasks()
+
+
+@worker_init.connect
+def start_metrics_server(**kwargs) -> None:
+    """Запуск сервера метрик Prometheus в главном процессе worker."""
+    from infrastructure.utils.metrics import start_worker_metrics_server
+    start_worker_metrics_server()
+
+
+@worker_process_shutdown.connect
+def mark_metrics_process_dead(pid: int, **kwargs) -> None:
+    """Очистка метрик и выгрузка спанов завершившегося дочернего процесса worker."""
+    from infrastructure.utils.metrics import mark_worker_process_dead
+    from infrastructure.utils.tracing import span_exporter
+    mark_worker_process_dead(pid)
+    span_exporter.flush()
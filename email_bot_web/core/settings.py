@@ -1,5 +1,6 @@
 import operator
 import os
+import socket
 from functools import reduce
 
 from pathlib import Path
@@ -40,7 +41,7 @@ ROOT_URLCONF = 'core.urls'
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
-        'DIRS': [],
+        'DIRS': [BASE_DIR / 'infrastructure' / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
@@ -62,10 +63,21 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD'),
         'HOST': os.getenv('POSTGRES_HOST'),
-        'PORT': os.getenv('POSTGRES_PORT')
+        'PORT': os.getenv('POSTGRES_PORT'),
+        # in seconds, 0 - new connection per request. Must stay 0 in the ASGI process: sync ORM calls run in
+        # per-request executor threads there, so kept connections are never reused or closed (Django #33497).
+        # Reuse for the web comes from the async pool (ASYNC_DB_POOL_ENABLED) or an external pooler (PgBouncer);
+        # entrypoint.sh sets DB_WORKER_CONN_MAX_AGE for the Celery and IMAP listener processes.
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 0)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+ASYNC_DB_POOL_ENABLED = os.getenv('ASYNC_DB_POOL_ENABLED') == 'true'
+ASYNC_DB_POOL_MIN_SIZE = int(os.getenv('ASYNC_DB_POOL_MIN_SIZE', 1))
+ASYNC_DB_POOL_MAX_SIZE = int(os.getenv('ASYNC_DB_POOL_MAX_SIZE', 10))
+ASYNC_DB_POOL_TIMEOUT = float(os.getenv('ASYNC_DB_POOL_TIMEOUT', 30))  # in seconds
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -110,6 +122,10 @@ TELEGRAM_SEND_MESSAGE_URL = os.path.join(TELEGRAM_HOST, 'bot' + BOT_TOKEN, 'send
 TELEGRAM_SEND_PHOTO_URL = os.path.join(TELEGRAM_HOST, 'bot' + BOT_TOKEN, 'sendPhoto')
 
 CACHE_TIMEOUT = int(os.getenv('CACHE_TIMEOUT', 3600))  # in seconds
+CACHE_TIMEOUT_JITTER = float(os.getenv('CACHE_TIMEOUT_JITTER', 0.1))  # fraction of CACHE_TIMEOUT
+CACHE_NEGATIVE_TIMEOUT = int(os.getenv('CACHE_NEGATIVE_TIMEOUT', 30))  # in seconds
+REPOSITORY_CACHE_ALIAS = 'repository'
+CACHE_SCHEMA_VERSION = 3  # bump on any change of infrastructure.dto or cache_serializer layout
 BOT_USER_KEY_FORMAT = 'bot_user_{telegram_id}'
 ACTIVE_USERS_KEY_FORMAT = 'active_users'
 USER_EXISTS_KEY_FORMAT = 'bot_user_exists_{telegram_id}'
@@ -117,15 +133,84 @@ EMAIL_SERVICE_KEY_FORMAT = 'email_service_{service_id}'
 EMAIL_SERVICES_KEY_FORMAT = 'email_services'
 BOX_FILTERS_KEY_FORMAT = 'box_filters_{box_id}'
 EMAIL_BOX_KEY_FORMAT = 'email_box_{box_id}'
+USER_EMAIL_BOX_KEY_FORMAT = 'bot_user_{telegram_id}_email_box_{box_id}'
 USER_EMAIL_BOXES_KEY_FORMAT = 'bot_user_{telegram_id}_email_boxes'
 IMAP_CLIENT_STATUS_KEY_FORMAT = 'imap_client_status_{telegram_id}_{box_id}'
+IMAP_CLIENT_CHECKPOINT_KEY_FORMAT = 'imap_client_checkpoint_{telegram_id}_{box_id}'
+BOT_USER_GENERATION_KEY_FORMAT = 'generation_bot_user_{telegram_id}'
+BOT_USERS_GENERATION_KEY_FORMAT = 'generation_bot_users'
+EMAIL_BOX_GENERATION_KEY_FORMAT = 'generation_email_box_{box_id}'
+EMAIL_SERVICES_GENERATION_KEY_FORMAT = 'generation_email_services'
+IMAP_CONTROL_CHANNEL = 'imap_control'
+IMAP_SHARD_NODES_KEY = 'imap_listener_nodes'
+IMAP_SHARD_LEASE_KEY_FORMAT = 'imap_box_lease_{box_id}'
+IMAP_SHARD_HEARTBEAT_INTERVAL = int(os.getenv('IMAP_SHARD_HEARTBEAT_INTERVAL', 5))  # in seconds
+IMAP_SHARD_NODE_TTL = int(os.getenv('IMAP_SHARD_NODE_TTL', 15))  # in seconds without heartbeat
+IMAP_SHARD_LEASE_TTL = int(os.getenv('IMAP_SHARD_LEASE_TTL', 30))  # in seconds
+IMAP_SHARD_VIRTUAL_NODES = 64  # points per node on the hash ring
+IMAP_SHARD_ACQUIRE_BATCH = int(os.getenv('IMAP_SHARD_ACQUIRE_BATCH', 200))  # new boxes started per heartbeat
+IMAP_SHARD_BOXES_GENERATION_KEY = 'imap_shard_boxes_generation'
+IMAP_SHARD_NEW_BOXES_KEY = 'imap_shard_new_boxes'
+IMAP_SHARD_NEW_BOXES_LOG_SIZE = 1000  # boxes created between rebalance steps applied without a full rescan
+IMAP_SHARD_LEASE_RENEW_INTERVAL = IMAP_SHARD_LEASE_TTL / 6  # in seconds, renewed by a separate task
+IMAP_SHARD_RELEASE_TIMEOUT = IMAP_SHARD_LEASE_TTL / 3  # in seconds, well under the lease TTL
+NODE_ID = os.getenv('NODE_ID', f'{socket.gethostname()}-{os.getpid()}')
+IMAP_LISTENER_PROCESSES = int(os.getenv('IMAP_LISTENER_PROCESSES', 1))  # 0 - one process per CPU core
+IMAP_LISTENERS_IN_WEB = os.getenv('IMAP_LISTENERS_IN_WEB') == 'true'  # run listeners in the ASGI process (dev)
+IMAP_SHUTDOWN_TIMEOUT = int(os.getenv('IMAP_SHUTDOWN_TIMEOUT', 25))  # in seconds for handover and LOGOUT
+IMAP_SESSION_ADOPTION_TIMEOUT = int(os.getenv('IMAP_SESSION_ADOPTION_TIMEOUT', 15))  # in seconds
+IMAP_RESYNC_MAX_MESSAGES = int(os.getenv('IMAP_RESYNC_MAX_MESSAGES', 50))  # missed emails sent after reconnect
+IMAP_IDLE_SILENCE_TIMEOUT = int(os.getenv('IMAP_IDLE_SILENCE_TIMEOUT', 600))  # in seconds before NOOP probe
+IMAP_TCP_KEEPALIVE_IDLE = int(os.getenv('IMAP_TCP_KEEPALIVE_IDLE', 60))  # in seconds of silence before probes
+IMAP_TCP_KEEPALIVE_INTERVAL = int(os.getenv('IMAP_TCP_KEEPALIVE_INTERVAL', 15))  # in seconds between probes
+IMAP_TCP_KEEPALIVE_COUNT = int(os.getenv('IMAP_TCP_KEEPALIVE_COUNT', 4))  # unanswered probes before reset
+IMAP_POLL_MIN_INTERVAL = int(os.getenv('IMAP_POLL_MIN_INTERVAL', 30))  # in seconds between polls of a busy box
+IMAP_POLL_MAX_INTERVAL = int(os.getenv('IMAP_POLL_MAX_INTERVAL', 600))  # in seconds between polls of a quiet box
+IMAP_POLL_BACKOFF = float(os.getenv('IMAP_POLL_BACKOFF', 1.5))  # interval growth after an empty poll
+IMAP_RECONNECT_BASE_DELAY = float(os.getenv('IMAP_RECONNECT_BASE_DELAY', 1))  # in seconds, doubled per attempt
+IMAP_RECONNECT_MAX_DELAY = float(os.getenv('IMAP_RECONNECT_MAX_DELAY', 300))  # in seconds
+IMAP_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('IMAP_CIRCUIT_FAILURE_THRESHOLD', 5))  # connect failures in a row
+IMAP_CIRCUIT_OPEN_TIMEOUT = float(os.getenv('IMAP_CIRCUIT_OPEN_TIMEOUT', 30))  # in seconds before a probe
+IMAP_CIRCUIT_MAX_OPEN_TIMEOUT = float(os.getenv('IMAP_CIRCUIT_MAX_OPEN_TIMEOUT', 600))  # in seconds
+IMAP_DNS_CACHE_TTL = int(os.getenv('IMAP_DNS_CACHE_TTL', 300))  # in seconds to reuse resolved server addresses
+BOX_PROVISIONING_QUEUE_KEY = 'box_provisioning_queue'
+BOX_PROVISIONING_JOB_KEY_FORMAT = 'box_provisioning_job_{job_id}'
+BOX_PROVISIONING_JOB_TIMEOUT = 60 * 60  # in seconds
+BOX_PROVISIONING_CONCURRENCY = int(os.getenv('BOX_PROVISIONING_CONCURRENCY', 20))  # jobs per listener node
+IMAP_FLEET_NODE_KEY_FORMAT = 'imap_fleet_node_{node_id}'
+IMAP_FLEET_NODES_KEY = 'imap_fleet_nodes'
+IMAP_FLEET_FLUSH_INTERVAL = int(os.getenv('IMAP_FLEET_FLUSH_INTERVAL', 5))  # in seconds
+IMAP_FLEET_NODE_TTL = int(os.getenv('IMAP_FLEET_NODE_TTL', 60))  # in seconds
+IMAP_FLEET_STUCK_AFTER = int(os.getenv('IMAP_FLEET_STUCK_AFTER', 900))  # in seconds without IDLE liveness mark
+IMAP_FLEET_FLAPPING_RECONNECTS = int(os.getenv('IMAP_FLEET_FLAPPING_RECONNECTS', 5))  # within IMAP_FLEET_FLAPPING_WINDOW
+IMAP_FLEET_FLAPPING_WINDOW = int(os.getenv('IMAP_FLEET_FLAPPING_WINDOW', 3600))  # in seconds
+IMAP_FLEET_PROBLEM_BOXES_LIMIT = 200
+IMAP_FLEET_DASHBOARD_REFRESH = 10  # in seconds
+WORKER_METRICS_PORT = int(os.getenv('WORKER_METRICS_PORT', 9808))  # 0 disables the Celery worker metrics server
+TRACING_EXPORTER = os.getenv('TRACING_EXPORTER', '')  # '', 'file' or 'otlp'
+TRACING_SERVICE_NAME = os.getenv('TRACING_SERVICE_NAME', 'email_tracking_bot')
+TRACING_FILE_PATH = os.getenv('TRACING_FILE_PATH', 'traces.jsonl')
+TRACING_OTLP_ENDPOINT = os.getenv('TRACING_OTLP_ENDPOINT', 'http://otel-collector:4318/v1/traces')
+TRACING_EXPORT_BATCH_SIZE = 512
+TRACING_EXPORT_INTERVAL = 5  # in seconds
+TRACING_QUEUE_SIZE = 10_000
+ADMIN_BULK_JOB_KEY_FORMAT = 'admin_bulk_job_{job_id}'
+ADMIN_BULK_JOB_TIMEOUT = 24 * 60 * 60  # in seconds
+ADMIN_BULK_ACTION_SYNC_LIMIT = int(os.getenv('ADMIN_BULK_ACTION_SYNC_LIMIT', 1000))  # larger selections run in Celery
+ADMIN_BULK_ACTION_CHUNK_SIZE = 500
+ADMIN_ESTIMATED_COUNT_THRESHOLD = int(os.getenv('ADMIN_ESTIMATED_COUNT_THRESHOLD', 100_000))  # rows
 
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
+    'filters': {
+        'trace_context': {
+            '()': 'infrastructure.utils.tracing.TraceContextFilter',
+        },
+    },
     'formatters': {
         'verbose': {
-            'format': '{levelname} {asctime} {module} {message}',
+            'format': '{levelname} {asctime} {module} trace_id={trace_id} span_id={span_id} {message}',
             'style': '{',
         },
         'simple': {
@@ -137,6 +222,7 @@ LOGGING = {
         'console': {
             'class': 'logging.StreamHandler',
             'formatter': 'verbose',
+            'filters': ['trace_context'],
         },
     },
     'loggers': {
@@ -171,5 +257,15 @@ CACHES = {
         'OPTIONS': {
             'CLIENT_CLASS': 'django_redis.client.DefaultClient',
         }
+    },
+    REPOSITORY_CACHE_ALIAS: {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': f'redis://{os.getenv("REDIS_HOST")}:{os.getenv("REDIS_PORT")}/0',
+        'KEY_PREFIX': 'repository',
+        'VERSION': CACHE_SCHEMA_VERSION,
+        'OPTIONS': {
+            'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+            'SERIALIZER': 'infrastructure.gateways.cache_serializer.MsgpackSerializer',
+        }
     }
 }
@@ -2,20 +2,42 @@ from typing import Any
 
 from django.conf import settings
 from django.contrib import admin, messages
-from django.core.cache import cache
+from django.contrib.admin import helpers
+from django.contrib.admin.views.main import (
+    ERROR_FLAG,
+    IGNORED_PARAMS,
+    PAGE_VAR,
+    SEARCH_VAR,
+)
+from django.core.exceptions import PermissionDenied
 from django.db.models import ProtectedError, QuerySet
-from django.forms import ModelForm
-from django.http import HttpRequest
+from django.forms import Media, ModelForm
+from django.http import Http404, HttpRequest, JsonResponse
+from django.template.response import TemplateResponse
+from django.urls import URLPattern, path, reverse
+from django.utils.html import format_html
 from email_service.models import BoxFilter, EmailBox, EmailService
+from email_service.services import EmailBoxBulkService
 from infrastructure.gateways.imap_client import IMAPStatuses
+from infrastructure.gateways.imap_fleet import get_fleet_snapshot
+from infrastructure.gateways.redis_client import redis_client
+from infrastructure.utils.admin_tools import (
+    AutocompleteListFilter,
+    EstimatedCountPaginator,
+    NumericSearchMixin,
+)
 
 
 @admin.register(EmailService)
 class EmailServiceAdmin(admin.ModelAdmin):
     """Админ-панель модели почтового сервиса."""
 
-    fields = ('title', 'slug', 'address', 'port')
-    list_display = ('id', 'title', 'address')
+    fieldsets = (
+        (None, {'fields': ('title', 'slug', 'address', 'port')}),
+        ('Профиль сервера', {'fields': ('idle_renewal_interval', 'command_timeout', 'max_connections',
+                                        'connect_rate', 'use_compression', 'capabilities')}),
+    )
+    list_display = ('id', 'title', 'address', 'port', 'max_connections', 'connect_rate')
     list_editable = ('title', 'address')
     search_fields = ('title',)
     search_help_text = 'Поиск по названию'
@@ -33,21 +55,13 @@ class EmailServiceAdmin(admin.ModelAdmin):
     def save_model(self, request: HttpRequest, obj: EmailService, form: ModelForm, change: bool) -> None:
         """Сохраняет изменения в модели почтового сервиса и очищает кэш."""
         super().save_model(request, obj, form, change)
-        cache_keys = [
-            settings.EMAIL_SERVICES_KEY_FORMAT,
-            settings.EMAIL_SERVICE_KEY_FORMAT.format(service_id=obj.id)
-        ]
-        cache.delete_many(cache_keys)
+        redis_client.bump_generations_on_commit([settings.EMAIL_SERVICES_GENERATION_KEY_FORMAT])
 
     def delete_model(self, request: HttpRequest, obj: EmailService) -> None:
         """Удаляет модель почтового сервиса и очищает кэш, если удаление было успешным."""
         try:
             super().delete_model(request, obj)
-            cache_keys = [
-                settings.EMAIL_SERVICES_KEY_FORMAT,
-                settings.EMAIL_SERVICE_KEY_FORMAT.format(service_id=obj.id)
-            ]
-            cache.delete_many(cache_keys)
+            redis_client.bump_generations_on_commit([settings.EMAIL_SERVICES_GENERATION_KEY_FORMAT])
         except ProtectedError:
             self.message_user(
                 request,
@@ -62,32 +76,32 @@ class EmailServiceAdmin(admin.ModelAdmin):
             try:
                 obj.delete()
                 deleted_count += 1
-                cache_keys = [
-                    settings.EMAIL_SERVICES_KEY_FORMAT,
-                    settings.EMAIL_SERVICE_KEY_FORMAT.format(service_id=obj.id)
-                ]
-                cache.delete_many(cache_keys)
             except ProtectedError:
                 self.message_user(request, f'Невозможно удалить {obj.title}, так как есть связанные почтовые ящики.',
                                   messages.ERROR)
         if deleted_count:
+            redis_client.bump_generations_on_commit([settings.EMAIL_SERVICES_GENERATION_KEY_FORMAT])
             self.message_user(request, f'{deleted_count} почтовых сервисов было успешно удалено.', messages.SUCCESS)
 
     delete_services.short_description = 'Удалить выбранные почтовые сервисы и инвалидировать кэш'  # type: ignore
 
 
 @admin.register(EmailBox)
-class EmailBoxAdmin(admin.ModelAdmin):
+class EmailBoxAdmin(NumericSearchMixin, admin.ModelAdmin):
     """Админ-панель модели почтового ящика."""
 
     fields = ('is_active',)
     list_display = ('id', 'user_id', 'email_username', 'email_service', 'is_active')
     list_editable = ('is_active',)
-    search_fields = ('user_id',)
+    list_select_related = ('user_id', 'email_service')
+    search_fields = ('user_id', 'id')
     list_filter = ('email_service',)
     actions = ['delete_boxes', 'activate_boxes', 'deactivate_boxes']
-    search_help_text = 'Поиск по telegram id пользователя'
+    search_help_text = 'Поиск по telegram id пользователя или id почтового ящика'
+    ordering = ('-id',)
     list_per_page = 50
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
     def get_actions(self, request: HttpRequest) -> dict[str, Any]:
         """Возвращает список доступных действий для модели. Удаляет стандартное действие "delete_selected"."""
@@ -100,55 +114,106 @@ class EmailBoxAdmin(admin.ModelAdmin):
         """Проверяет, есть ли у пользователя разрешение на добавление объектов модели EmailBox."""
         return False
 
+    def get_urls(self) -> list[URLPattern]:
+        """Добавляет адреса просмотра прогресса фоновых массовых действий и состояния клиентов IMAP."""
+        return [
+            path(
+                'bulk-jobs/<str:job_id>/',
+                self.admin_site.admin_view(self.bulk_job_view),
+                name='email_service_emailbox_bulk_job'
+            ),
+            path(
+                'imap-fleet/',
+                self.admin_site.admin_view(self.imap_fleet_view),
+                name='email_service_emailbox_imap_fleet'
+            ),
+            *super().get_urls()
+        ]
+
+    def imap_fleet_view(self, request: HttpRequest) -> TemplateResponse:
+        """Сводка по состоянию клиентов IMAP на всех узлах с автообновлением."""
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Состояние клиентов IMAP',
+            'opts': self.model._meta,
+            'fleet': get_fleet_snapshot(redis_client.client),
+            'refresh_interval': settings.IMAP_FLEET_DASHBOARD_REFRESH,
+            'stuck_after': settings.IMAP_FLEET_STUCK_AFTER,
+            'flapping_window': settings.IMAP_FLEET_FLAPPING_WINDOW,
+        }
+        return TemplateResponse(request, 'admin/imap_fleet.html', context)
+
+    def bulk_job_view(self, request: HttpRequest, job_id: str) -> JsonResponse:
+        """Возвращает состояние фоновой задачи массового действия."""
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+        if job := EmailBoxBulkService.get_job(job_id):
+            return JsonResponse(job)
+        raise Http404
+
+    @staticmethod
+    def update_box_state(obj: EmailBox, status: str) -> None:
+        """Обновляет статус клиента IMAP ящика и кэш после фиксации транзакции."""
+        redis_client.update_boxes_state_on_commit(
+            {settings.IMAP_CLIENT_STATUS_KEY_FORMAT.format(telegram_id=obj.user_id_id, box_id=obj.id): status},
+            [
+                settings.BOT_USER_GENERATION_KEY_FORMAT.format(telegram_id=obj.user_id_id),
+                settings.EMAIL_BOX_GENERATION_KEY_FORMAT.format(box_id=obj.id)
+            ],
+            {'status': status, 'box_ids': [obj.id]}
+        )
+
     def save_model(self, request: HttpRequest, obj: EmailBox, form: ModelForm, change: bool) -> None:
         """Сохраняет изменения в модели почтового ящика и обновляет кэш."""
-        if change:
-            old_obj = EmailBox.objects.get(id=obj.id)
-            if old_obj.is_active != obj.is_active:
-                cache_status_key = settings.IMAP_CLIENT_STATUS_KEY_FORMAT.format(
-                    telegram_id=obj.user_id,
-                    box_id=obj.id
-                )
-                if obj.is_active:
-                    cache.set(cache_status_key, IMAPStatuses.ACTIVE.value)
-                else:
-                    cache.set(cache_status_key, IMAPStatuses.PAUSED.value)
-            cache_keys = [
-                settings.EMAIL_BOX_KEY_FORMAT.format(box_id=obj.id),
-                settings.USER_EMAIL_BOXES_KEY_FORMAT.format(telegram_id=obj.user_id)
-            ]
-            cache.delete_many(keys=cache_keys)
         super().save_model(request, obj, form, change)
+        if change and 'is_active' in form.changed_data:
+            self.update_box_state(obj, IMAPStatuses.ACTIVE.value if obj.is_active else IMAPStatuses.PAUSED.value)
 
     def delete_model(self, request: HttpRequest, obj: EmailBox) -> None:
         """Удаляет модель почтового ящика и обновляет кэш."""
-        cache_status_key = settings.IMAP_CLIENT_STATUS_KEY_FORMAT.format(
-            telegram_id=obj.user_id,
-            box_id=obj.id
-        )
-        cache.set(cache_status_key, IMAPStatuses.STOPPED.value)
-        cache_keys = [
-            settings.EMAIL_BOX_KEY_FORMAT.format(box_id=obj.id),
-            settings.USER_EMAIL_BOXES_KEY_FORMAT.format(telegram_id=obj.user_id)
-        ]
-        cache.delete_many(keys=cache_keys)
+        self.update_box_state(obj, IMAPStatuses.STOPPED.value)
         super().delete_model(request, obj)
 
+    def get_bulk_selection(self, request: HttpRequest) -> dict[str, Any]:
+        """
+        Сериализуемое описание выделенных ящиков для фоновой задачи: фильтры и поиск списка изменений,
+        а без выбора всех объектов списка - еще и идентификаторы отмеченных на странице ящиков.
+        """
+        ignored_params = {*IGNORED_PARAMS, PAGE_VAR, ERROR_FLAG}
+        lookups: dict[str, Any] = {key: value for key, value in request.GET.items() if key not in ignored_params}
+        if request.POST.get('select_across') != '1':
+            lookups['id__in'] = [int(box_id) for box_id in request.POST.getlist(helpers.ACTION_CHECKBOX_NAME)]
+        search_lookups = self.get_search_lookups(request, request.GET.get(SEARCH_VAR, ''))
+        if search_lookups is None:
+            lookups['id__in'] = []
+        return {'lookups': lookups, 'search_lookups': search_lookups or {}}
+
+    def run_bulk_action(self, request: HttpRequest, queryset: QuerySet, action: str, success_message: str) -> None:
+        """
+        Выполняет массовое действие одним запросом к БД и одним конвейером Redis.
+        Слишком большие выборки обрабатываются фоновой задачей Celery с отчетом о прогрессе.
+        """
+        total = queryset.count()
+        if total > settings.ADMIN_BULK_ACTION_SYNC_LIMIT:
+            job_id = EmailBoxBulkService.start_job(action, self.get_bulk_selection(request), total)
+            self.message_user(
+                request,
+                format_html(
+                    'Запущена фоновая обработка {} почтовых ящиков. <a href="{}">Прогресс задачи</a>',
+                    total,
+                    reverse('admin:email_service_emailbox_bulk_job', args=[job_id])
+                ),
+                messages.INFO
+            )
+            return
+        processed_count = EmailBoxBulkService.apply(action, list(queryset.values_list('id', flat=True)))
+        self.message_user(request, success_message.format(processed_count), messages.SUCCESS)
+
     def delete_boxes(self, request: HttpRequest, queryset: QuerySet[EmailBox]) -> None:
         """Удаляет выбранные ящики и инвалидирует кэш."""
-        for obj in queryset:
-            cache_status_key = settings.IMAP_CLIENT_STATUS_KEY_FORMAT.format(
-                telegram_id=obj.user_id,
-                box_id=obj.id
-            )
-            cache.set(cache_status_key, IMAPStatuses.STOPPED.value)
-            cache_keys = [
-                settings.EMAIL_BOX_KEY_FORMAT.format(box_id=obj.id),
-                settings.USER_EMAIL_BOXES_KEY_FORMAT.format(telegram_id=obj.user_id)
-            ]
-            cache.delete_many(keys=cache_keys)
-            obj.delete()
-        self.message_user(request, f'{queryset.count()} почтовых ящиков были успешно удалены.', messages.SUCCESS)
+        self.run_bulk_action(request, queryset, 'delete', '{} почтовых ящиков были успешно удалены.')
 
     delete_boxes.short_description = 'Удалить почтовые ящики и инвалидировать кэш'  # type: ignore
 
@@ -156,20 +221,7 @@ class EmailBoxAdmin(admin.ModelAdmin):
         """
         Активирует выбранные ящики и инвалидирует кэш.
         """
-        for obj in queryset:
-            obj.is_active = True
-            obj.save()
-            cache_status_key = settings.IMAP_CLIENT_STATUS_KEY_FORMAT.format(
-                telegram_id=obj.user_id,
-                box_id=obj.id
-            )
-            cache.set(cache_status_key, IMAPStatuses.ACTIVE.value)
-            cache_keys = [
-                settings.EMAIL_BOX_KEY_FORMAT.format(box_id=obj.id),
-                settings.USER_EMAIL_BOXES_KEY_FORMAT.format(telegram_id=obj.user_id)
-            ]
-            cache.delete_many(keys=cache_keys)
-        self.message_user(request, f'{queryset.count()} ящиков было успешно активировано.', messages.SUCCESS)
+        self.run_bulk_action(request, queryset, 'activate', '{} ящиков было успешно активировано.')
 
     activate_boxes.short_description = 'Активировать выбранные ящики и инвалидировать кэш'  # type: ignore
 
@@ -177,34 +229,29 @@ class EmailBoxAdmin(admin.ModelAdmin):
         """
         Деактивирует выбранные ящики и инвалидирует кэш.
         """
-        for obj in queryset:
-            obj.is_active = False
-            obj.save()
-            cache_status_key = settings.IMAP_CLIENT_STATUS_KEY_FORMAT.format(
-                telegram_id=obj.user_id,
-                box_id=obj.id
-            )
-            cache.set(cache_status_key, IMAPStatuses.PAUSED.value)
-            cache_keys = [
-                settings.EMAIL_BOX_KEY_FORMAT.format(box_id=obj.id),
-                settings.USER_EMAIL_BOXES_KEY_FORMAT.format(telegram_id=obj.user_id)
-            ]
-            cache.delete_many(keys=cache_keys)
-        self.message_user(request, f'{queryset.count()} ящиков было успешно деактивировано.', messages.SUCCESS)
+        self.run_bulk_action(request, queryset, 'deactivate', '{} ящиков было успешно деактивировано.')
 
     deactivate_boxes.short_description = 'Деактивировать выбранные ящики и инвалидировать кэш'  # type: ignore
 
 
 @admin.register(BoxFilter)
-class BoxFilterAdmin(admin.ModelAdmin):
+class BoxFilterAdmin(NumericSearchMixin, admin.ModelAdmin):
     """Админ-панель модели фильтра почтового ящика."""
 
     list_display = ('id', 'box_id', 'filter_value', 'filter_name')
     list_editable = ('box_id', 'filter_value', 'filter_name')
+    list_select_related = ('box_id',)
     search_fields = ('box_id',)
-    list_filter = ('box_id',)
+    list_filter = (('box_id', AutocompleteListFilter),)
     search_help_text = 'Поиск по id почтового ящика'
     list_per_page = 50
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    @property
+    def media(self) -> Media:
+        """Подключает скрипты поля автодополнения для фильтра по почтовому ящику."""
+        return super().media + AutocompleteListFilter.get_media(BoxFilter._meta.get_field('box_id'), self.admin_site)
 
     def has_add_permission(self, request: HttpRequest) -> bool:
         """Проверяет, есть ли у пользователя разрешение на добавление объектов модели BoxFilter."""
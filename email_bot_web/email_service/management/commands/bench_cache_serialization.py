@@ -0,0 +1,53 @@
+import pickle
+import timeit
+from typing import Any, Callable
+
+from django.core.management.base import BaseCommand, CommandParser
+from email_service.models import BoxFilter, EmailBox, EmailService
+from infrastructure.dto import BoxFilterDTO, EmailBoxDTO, EmailServiceDTO
+from infrastructure.gateways.cache_serializer import MsgpackSerializer
+from user.models import BotUser
+
+
+class Command(BaseCommand):
+    """Сравнение pickle моделей Django и msgpack DTO для значений кеша репозиториев."""
+
+    help = 'Сравнивает размер и скорость (де)сериализации значений кеша: pickle моделей против msgpack DTO'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        """Аргументы командной строки."""
+        parser.add_argument('--boxes', type=int, default=20, help='Количество ящиков в списке пользователя')
+        parser.add_argument('--filters', type=int, default=10, help='Количество фильтров ящика')
+        parser.add_argument('--rounds', type=int, default=2000, help='Количество повторов каждого замера')
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        """Запуск замеров."""
+        rounds = options['rounds']
+        service = EmailService(id=1, title='Gmail', slug='gmail', address='imap.gmail.com', port=993)
+        user = BotUser(telegram_id=123456789, is_active=True)
+        boxes = [
+            EmailBox(id=i, user_id_id=user.telegram_id, email_service_id=service.id,
+                     email_username=f'user{i}@gmail.com', email_password=f'gAAAAA{i:0>94}', is_active=True)
+            for i in range(options['boxes'])
+        ]
+        box_filters = [
+            BoxFilter(id=i, box_id_id=boxes[0].id, filter_value=f'sender{i}@example.com', filter_name=f'Sender {i}')
+            for i in range(options['filters'])
+        ]
+        samples = {
+            'email_service': (service, EmailServiceDTO.from_model(service)),
+            'user_email_boxes': (boxes, [EmailBoxDTO.from_model(box) for box in boxes]),
+            'box_filters': (box_filters, [BoxFilterDTO.from_model(box_filter) for box_filter in box_filters]),
+        }
+        serializer = MsgpackSerializer(options={})
+        self.stdout.write(f'{"value":<18}{"codec":<9}{"bytes":>8}{"dumps, us":>12}{"loads, us":>12}')
+        for name, (model_value, dto_value) in samples.items():
+            self._report(name, 'pickle', model_value, pickle.dumps, pickle.loads, rounds)
+            self._report(name, 'msgpack', dto_value, serializer.dumps, serializer.loads, rounds)
+
+    def _report(self, name: str, codec: str, value: Any, dumps: Callable, loads: Callable, rounds: int) -> None:
+        """Замер одной пары (значение, кодек) и вывод строки отчета."""
+        encoded = dumps(value)
+        dumps_us = timeit.timeit(lambda: dumps(value), number=rounds) / rounds * 1e6
+        loads_us = timeit.timeit(lambda: loads(encoded), number=rounds) / rounds * 1e6
+        self.stdout.write(f'{name:<18}{codec:<9}{len(encoded):>8}{dumps_us:>12.2f}{loads_us:>12.2f}')
@@ -0,0 +1,131 @@
+import asyncio
+import time
+import uuid
+from typing import Any
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from django.test import override_settings
+from infrastructure.benchmarks.memory_cache import TimeoutRecordingCache
+from infrastructure.gateways.redis_client import redis_client
+from user.models import BotUser
+
+
+class Command(BaseCommand):
+    """
+    Проверка защиты кеша репозиториев от лавины промахов на кеше в памяти процесса:
+    одновременные промахи по ключу выполняют загрузку один раз, отсутствие объекта кешируется
+    на CACHE_NEGATIVE_TIMEOUT, а время жизни записей разбросано в пределах CACHE_TIMEOUT_JITTER.
+    """
+
+    help = 'Проверяет одновременные промахи кеша репозиториев: одна загрузка, негативный кеш, разброс TTL'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        """Аргументы командной строки."""
+        parser.add_argument('--concurrency', type=int, default=1000, help='Количество одновременных промахов')
+        parser.add_argument('--load-delay', type=float, default=0.05, help='Длительность загрузки из источника, с')
+        parser.add_argument('--keys', type=int, default=200, help='Количество ключей для проверки разброса TTL')
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        """Запуск проверок на кеше в памяти вместо Redis."""
+        memory_caches = {
+            **settings.CACHES,
+            settings.REPOSITORY_CACHE_ALIAS: {
+                'BACKEND': 'infrastructure.benchmarks.memory_cache.TimeoutRecordingCache',
+                'LOCATION': f'bench-cache-stampede-{uuid.uuid4().hex}',
+                'TIMEOUT': None,
+            },
+        }
+        with override_settings(CACHES=memory_caches):
+            asyncio.run(self._run(options))
+
+    async def _run(self, options: dict[str, Any]) -> None:
+        """Последовательный запуск проверок."""
+        key_prefix = f'bench_stampede_{uuid.uuid4().hex}'
+        await self._check_single_load(key_prefix, options['concurrency'], options['load_delay'])
+        await self._check_negative_cache(key_prefix, options['concurrency'], options['load_delay'])
+        await self._check_jitter(key_prefix, options['keys'])
+        if redis_client._inflight:
+            raise CommandError(f'{len(redis_client._inflight)} loads left in flight')
+
+    async def _check_single_load(self, key_prefix: str, concurrency: int, load_delay: float) -> None:
+        """Одновременные промахи по одному ключу ожидают одну загрузку, следующий вызов читает кеш."""
+        calls = 0
+
+        @redis_client.cache_result(key_format=f'{key_prefix}_value_{{telegram_id}}')
+        async def load(telegram_id: int) -> list[int]:
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(load_delay)
+            return [telegram_id]
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(load(1) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        if calls != 1:
+            raise CommandError(f'{concurrency} concurrent misses ran the loader {calls} times')
+        if any(result != [1] for result in results):
+            raise CommandError('Concurrent misses returned different values')
+        await load(1)
+        if calls != 1:
+            raise CommandError('Value was not read from the cache after the load')
+        self.stdout.write(f'single load: {concurrency} misses, loader calls {calls}, {elapsed * 1000:.1f} ms')
+
+    async def _check_negative_cache(self, key_prefix: str, concurrency: int, load_delay: float) -> None:
+        """Отсутствие объекта загружается один раз и кешируется на CACHE_NEGATIVE_TIMEOUT."""
+        calls = 0
+        key_format = f'{key_prefix}_missing_{{telegram_id}}'
+
+        @redis_client.cache_result(key_format=key_format)
+        async def load(telegram_id: int) -> None:
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(load_delay)
+            raise BotUser.DoesNotExist
+
+        results = await asyncio.gather(*(load(2) for _ in range(concurrency)), return_exceptions=True)
+        if calls != 1:
+            raise CommandError(f'{concurrency} concurrent misses of a missing object ran the loader {calls} times')
+        if not all(isinstance(result, BotUser.DoesNotExist) for result in results):
+            raise CommandError('Concurrent misses of a missing object did not raise DoesNotExist')
+        try:
+            await load(2)
+        except BotUser.DoesNotExist:
+            pass
+        else:
+            raise CommandError('Cached missing object did not raise DoesNotExist')
+        if calls != 1:
+            raise CommandError('Missing object was not read from the negative cache')
+        timeout = self._recorded_timeout(key_format.format(telegram_id=2))
+        if timeout != settings.CACHE_NEGATIVE_TIMEOUT:
+            raise CommandError(f'Negative cache TTL {timeout} s, expected {settings.CACHE_NEGATIVE_TIMEOUT} s')
+        self.stdout.write(f'negative cache: loader calls {calls}, TTL {timeout:.0f} s')
+
+    async def _check_jitter(self, key_prefix: str, keys: int) -> None:
+        """Время жизни записей разных ключей лежит в пределах CACHE_TIMEOUT ± CACHE_TIMEOUT_JITTER и различается."""
+        key_format = f'{key_prefix}_jitter_{{telegram_id}}'
+
+        @redis_client.cache_result(key_format=key_format)
+        async def load(telegram_id: int) -> int:
+            return telegram_id
+
+        await asyncio.gather(*(load(telegram_id) for telegram_id in range(keys)))
+        timeouts = [self._recorded_timeout(key_format.format(telegram_id=telegram_id)) for telegram_id in range(keys)]
+        spread = int(settings.CACHE_TIMEOUT * settings.CACHE_TIMEOUT_JITTER)
+        lowest, highest = settings.CACHE_TIMEOUT - spread, settings.CACHE_TIMEOUT + spread
+        if not all(lowest <= timeout <= highest for timeout in timeouts):
+            raise CommandError(f'TTL out of range {lowest}..{highest} s: {min(timeouts):.0f}..{max(timeouts):.0f} s')
+        if spread and keys > 1 and len(set(timeouts)) == 1:
+            raise CommandError(f'All {keys} keys got the same TTL {timeouts[0]:.0f} s')
+        self.stdout.write(f'TTL jitter: {keys} keys, TTL {min(timeouts):.0f}..{max(timeouts):.0f} s, '
+                          f'{len(set(timeouts))} distinct values, allowed {lowest}..{highest} s')
+
+    @staticmethod
+    def _recorded_timeout(key: str) -> float:
+        """Время жизни последней записи ключа в кеше в памяти, с."""
+        if key not in TimeoutRecordingCache.timeouts:
+            raise CommandError(f'Key {key} was not written to the cache')
+        timeout = TimeoutRecordingCache.timeouts[key]
+        if timeout is None:
+            raise CommandError(f'Key {key} was written to the cache without TTL')
+        return timeout
@@ -0,0 +1,84 @@
+import asyncio
+import random
+import statistics
+import time
+from typing import Any
+
+from asgiref.sync import sync_to_async
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from django.db import connection
+from django.test import override_settings
+from email_service.models import EmailBox
+from email_service.repositories import EmailBoxRepository
+from infrastructure.gateways.async_db import async_db
+
+MODES = ('orm-per-request', 'orm-persistent', 'async-pool')
+
+
+@sync_to_async
+def close_connection() -> None:
+    """Закрытие подключения ORM в потоке, где выполняются запросы (как при CONN_MAX_AGE = 0)."""
+    connection.close()
+
+
+class Command(BaseCommand):
+    """
+    Сравнение путей доступа к БД для горячих запросов: ORM через sync_to_async и пул psycopg 3.
+    Режим orm-persistent соответствует процессам Celery и клиентов IMAP: в процессе ASGI запросы
+    выполняются в разных потоках, и постоянные подключения там не переиспользуются.
+    """
+
+    help = 'Измеряет запросы/с и задержки проверки владельца ящика и загрузки ящиков при старте для каждого режима'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        """Аргументы командной строки."""
+        parser.add_argument('--requests', type=int, default=2000, help='Количество проверок владельца ящика')
+        parser.add_argument('--concurrency', type=int, default=50, help='Количество одновременных запросов')
+        parser.add_argument('--sample', type=int, default=1000, help='Количество случайных ящиков для запросов')
+        parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES), help='Режимы доступа к БД')
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        """Запуск замеров во всех выбранных режимах."""
+        if 'async-pool' in options['modes'] and connection.vendor != 'postgresql':
+            raise CommandError('async-pool mode requires PostgreSQL')
+        targets = list(EmailBox.objects.order_by('?').values_list('id', 'user_id')[:options['sample']])
+        if not targets:
+            raise CommandError('No email boxes found, seed data first (e.g. manage.py bench_repository_queries)')
+        connection.close()
+        self.stdout.write(f'{"mode":<18}{"req/s":>10}{"p50, ms":>10}{"p95, ms":>10}{"p99, ms":>10}{"startup, ms":>14}')
+        for mode in options['modes']:
+            with override_settings(ASYNC_DB_POOL_ENABLED=mode == 'async-pool'):
+                asyncio.run(self._run(mode, targets, options['requests'], options['concurrency']))
+
+    async def _run(self, mode: str, targets: list[tuple[int, int]], requests: int, concurrency: int) -> None:
+        """Замер одного режима: конкурентные проверки владельца ящика и однократная загрузка при старте."""
+        load_box = EmailBoxRepository.get_user_box_with_filters.__wrapped__
+        semaphore = asyncio.Semaphore(concurrency)
+        timings = []
+
+        async def check_owner(box_id: int, telegram_id: int) -> None:
+            async with semaphore:
+                started = time.perf_counter()
+                await load_box(telegram_id, box_id)
+                if mode == 'orm-per-request':
+                    await close_connection()
+                timings.append((time.perf_counter() - started) * 1000)
+
+        if mode == 'async-pool':
+            await async_db.open()
+        await load_box(*reversed(targets[0]))
+        started = time.perf_counter()
+        await asyncio.gather(*(check_owner(*random.choice(targets)) for _ in range(requests)))
+        elapsed = time.perf_counter() - started
+
+        startup_started = time.perf_counter()
+        await EmailBoxRepository.get_active_users_boxes_with_filters()
+        startup_ms = (time.perf_counter() - startup_started) * 1000
+        await close_connection()
+        await async_db.close()
+
+        percentiles = statistics.quantiles(timings, n=100)
+        self.stdout.write(
+            f'{mode:<18}{requests / elapsed:>10.0f}{percentiles[49]:>10.2f}{percentiles[94]:>10.2f}'
+            f'{percentiles[98]:>10.2f}{startup_ms:>14.1f}'
+        )
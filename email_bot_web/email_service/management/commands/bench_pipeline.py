@@ -0,0 +1,247 @@
+import asyncio
+import logging
+import resource
+import time
+from collections import defaultdict
+from typing import Any
+from unittest import mock
+
+import aioimaplib
+from core.celery import app
+from django.core.management.base import BaseCommand, CommandParser
+from django.test import override_settings
+from email_service import tasks
+from email_service.management.commands.bench_repository_queries import (
+    BENCH_TELEGRAM_ID_OFFSET,
+)
+from infrastructure.benchmarks.fake_imap_server import CAPABILITIES, FakeIMAPServer
+from infrastructure.benchmarks.fake_telegram_api import FakeTelegramAPI
+from infrastructure.dto import EmailServiceDTO
+from infrastructure.gateways.imap_client import IMAPClient, IMAPStatuses
+from infrastructure.gateways.redis_client import redis_client
+from infrastructure.utils.tracing import Span, span_exporter
+from PIL import Image, ImageDraw
+from prometheus_client import REGISTRY
+
+DRAIN_IDLE_SECONDS = 3
+STAGE_SPANS = ('email.imap_fetch_headers', 'email.filter', 'email.imap_fetch_body', 'email.decode', 'email.render',
+               'email.telegram_send', 'email.process')
+
+
+class StubHtml2Image:
+    """Замена Html2Image без Chromium: рисует изображение средствами Pillow."""
+
+    def screenshot(self, html_str: str, save_as: str, size: tuple[int, int]) -> None:
+        """Сохранение изображения вместо снимка страницы."""
+        image = Image.new('RGB', size, 'white')
+        ImageDraw.Draw(image).text((10, 10), html_str[:200], fill='black')
+        image.save(save_as)
+
+
+def percentile(values: list[float], quantile: float) -> float:
+    """Перцентиль по ближайшему рангу."""
+    ordered = sorted(values)
+    return ordered[min(int(quantile * len(ordered)), len(ordered) - 1)]
+
+
+def fake_email_service(host: str, port: int) -> EmailServiceDTO:
+    """Профиль почтового сервиса поддельного сервера IMAP (расширения известны заранее, без записи в базу)."""
+    return EmailServiceDTO(id=0, title='Fake IMAP', slug='fake-imap', address=host, port=port,
+                           idle_renewal_interval=600, command_timeout=30, max_connections=None, connect_rate=None,
+                           use_compression=False, capabilities=CAPABILITIES.split())
+
+
+def get_rss_mb() -> float:
+    """Текущий RSS процесса, МБ (Linux)."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize() / 2 ** 20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Command(BaseCommand):
+    """
+    Сквозной замер пропускной способности: поддельный сервер IMAP в процессе, настоящие IMAPClient, декодер,
+    задачи Celery и отправка в поддельный Telegram Bot API.
+    """
+
+    help = 'Измеряет писем/с, перцентили задержек этапов и сквозную задержку, CPU и RSS процесса'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        """Аргументы командной строки."""
+        parser.add_argument('--boxes', type=int, default=50, help='Количество почтовых ящиков (сессий IDLE)')
+        parser.add_argument('--rate', type=float, default=20, help='Частота поступления писем, писем/с')
+        parser.add_argument('--duration', type=float, default=30, help='Длительность подачи писем, с')
+        parser.add_argument('--body-size', type=int, default=2000, help='Размер тела письма, байт')
+        parser.add_argument('--rate-limit-ratio', type=float, default=0.0, help='Доля ответов 429 Telegram')
+        parser.add_argument('--server-error-ratio', type=float, default=0.0, help='Доля ответов 502 Telegram')
+        parser.add_argument('--telegram-latency', type=float, default=0.0, help='Задержка ответа Telegram, с')
+        parser.add_argument('--telegram-port', type=int, default=0, help='Порт поддельного Telegram (0 - любой)')
+        parser.add_argument('--drain-timeout', type=float, default=30,
+                            help='Максимальное ожидание доставки после подачи, с (прекращается раньше, '
+                                 'если запросов в Telegram нет DRAIN_IDLE_SECONDS)')
+        parser.add_argument('--celery', choices=('eager', 'worker'), default='eager',
+                            help='eager - задачи в процессе; worker - через брокер в запущенный worker '
+                                 '(TELEGRAM_HOST worker должен указывать на поддельный Telegram)')
+        parser.add_argument('--render', choices=('stub', 'chromium'), default='stub',
+                            help='stub - изображение средствами Pillow, chromium - настоящий Html2Image')
+        parser.add_argument('--compress', action='store_true', help='Сжатие сессий IMAP COMPRESS=DEFLATE')
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        """Запуск замера."""
+        if options['verbosity'] < 2:
+            logging.getLogger('infrastructure').setLevel(logging.WARNING)
+        telegram_api = FakeTelegramAPI(
+            port=options['telegram_port'],
+            rate_limit_ratio=options['rate_limit_ratio'],
+            server_error_ratio=options['server_error_ratio'],
+            latency=options['telegram_latency']
+        )
+        telegram_api.start()
+        spans: list[Span] = []
+        eager = options['celery'] == 'eager'
+        previous_eager = app.conf.task_always_eager
+        app.conf.task_always_eager = eager
+        if not eager:
+            self.stdout.write(f'Fake Telegram API: {telegram_api.url} (start the worker with TELEGRAM_HOST set to it)')
+        try:
+            with override_settings(TELEGRAM_SEND_PHOTO_URL=telegram_api.method_url('sendPhoto')), \
+                    mock.patch.object(span_exporter, 'export', spans.append):
+                if options['render'] == 'stub':
+                    with mock.patch.object(tasks, 'Html2Image', StubHtml2Image):
+                        report = asyncio.run(self._run(options, telegram_api))
+                else:
+                    report = asyncio.run(self._run(options, telegram_api))
+        finally:
+            app.conf.task_always_eager = previous_eager
+            telegram_api.stop()
+        self._report(report, spans, telegram_api)
+
+    async def _run(self, options: dict[str, Any], telegram_api: FakeTelegramAPI) -> dict[str, Any]:
+        """Подключение клиентов, подача писем с заданной частотой и ожидание доставки."""
+        imap_server = FakeIMAPServer()
+        await imap_server.start()
+        clients = []
+        service = fake_email_service(imap_server.host, imap_server.port)
+        service.use_compression = options['compress']
+        for index in range(options['boxes']):
+            client = IMAPClient(service=service, user=f'bench{index}@fake.imap', password='password',
+                                telegram_id=BENCH_TELEGRAM_ID_OFFSET + index, box_id=BENCH_TELEGRAM_ID_OFFSET + index,
+                                whitelist=set())
+            client.connection_manager.client = aioimaplib.IMAP4(host=imap_server.host, port=imap_server.port,
+                                                                timeout=30)
+            clients.append(client)
+        connect_started = time.perf_counter()
+        loops = [asyncio.create_task(client.imap_loop()) for client in clients]
+        while imap_server.idle_sessions_count < len(clients):
+            if any(loop.done() for loop in loops):
+                await asyncio.gather(*loops)
+            await asyncio.sleep(0.05)
+        connect_seconds = time.perf_counter() - connect_started
+
+        users = [client.connection_manager.user for client in clients]
+        rss_before = get_rss_mb()
+        usage_before = resource.getrusage(resource.RUSAGE_SELF)
+        started_at = time.time()
+        injected = await imap_server.inject_at_rate(users, options['rate'], options['duration'], options['body_size'])
+        drain_deadline = time.time() + options['drain_timeout']
+        last_progress_at, requests_count = time.time(), len(telegram_api.requests)
+        while requests_count < injected and time.time() < drain_deadline:
+            await asyncio.sleep(0.1)
+            if len(telegram_api.requests) != requests_count:
+                last_progress_at, requests_count = time.time(), len(telegram_api.requests)
+            elif time.time() - last_progress_at > DRAIN_IDLE_SECONDS:
+                break
+        finished_at = max([request.received_at for request in telegram_api.requests] + [started_at + 1e-3])
+        usage_after = resource.getrusage(resource.RUSAGE_SELF)
+        rss_after = get_rss_mb()
+
+        for client in clients:
+            await client.redis_ops.set_status(IMAPStatuses.STOPPED.value)
+            await client.wake_up()
+        await asyncio.wait(loops, timeout=10)
+        for loop in loops:
+            loop.cancel()
+        await imap_server.close()
+        for client in clients:
+            await redis_client.delete(f'telegram_id_{client.redis_ops.telegram_id}_failed_photos')
+        compressed_bytes = {
+            (direction, layer): REGISTRY.get_sample_value(
+                'imap_compressed_bytes_total', {'host': imap_server.host, 'direction': direction, 'layer': layer}
+            ) or 0
+            for direction in ('received', 'sent') for layer in ('payload', 'wire')
+        }
+        injected_at = {
+            (BENCH_TELEGRAM_ID_OFFSET + index, message.uid): message.internal_date
+            for index, user in enumerate(users)
+            for message in imap_server.get_mailbox(user).messages
+        }
+        return {
+            'injected': injected,
+            'elapsed': finished_at - started_at,
+            'connect_seconds': connect_seconds,
+            'cpu_seconds': usage_after.ru_utime + usage_after.ru_stime - usage_before.ru_utime - usage_before.ru_stime,
+            'rss_before': rss_before,
+            'rss_after': rss_after,
+            'max_rss': usage_after.ru_maxrss / 1024,
+            'injected_at': injected_at,
+            'eager': app.conf.task_always_eager,
+            'compressed_bytes': compressed_bytes,
+        }
+
+    def _report(self, report: dict[str, Any], spans: list[Span], telegram_api: FakeTelegramAPI) -> None:
+        """Вывод результатов замера."""
+        statuses: dict[int, int] = defaultdict(int)
+        for request in telegram_api.requests:
+            statuses[int(request.status)] += 1
+        delivered = statuses.get(200, 0)
+        self.stdout.write(
+            f'boxes connected in {report["connect_seconds"]:.2f} s; injected {report["injected"]}, '
+            f'telegram requests {len(telegram_api.requests)} {dict(statuses)}, delivered {delivered}'
+        )
+        self.stdout.write(
+            f'throughput {delivered / report["elapsed"]:.1f} msg/s over {report["elapsed"]:.1f} s; '
+            f'CPU {report["cpu_seconds"]:.2f} s ({report["cpu_seconds"] / report["elapsed"] * 100:.0f}%), '
+            f'RSS {report["rss_before"]:.1f} -> {report["rss_after"]:.1f} MB (max {report["max_rss"]:.1f} MB)'
+        )
+        compressed_bytes = report['compressed_bytes']
+        if compressed_bytes['received', 'wire']:
+            self.stdout.write(
+                f'IMAP COMPRESS=DEFLATE: received {compressed_bytes["received", "payload"] / 2 ** 20:.2f} MB '
+                f'as {compressed_bytes["received", "wire"] / 2 ** 20:.2f} MB '
+                f'({compressed_bytes["received", "payload"] / compressed_bytes["received", "wire"]:.1f}x), '
+                f'sent {compressed_bytes["sent", "payload"] / 1024:.1f} KB '
+                f'as {compressed_bytes["sent", "wire"] / 1024:.1f} KB'
+            )
+
+        durations: dict[str, list[float]] = defaultdict(list)
+        process_spans = {}
+        send_ends: dict[str, int] = {}
+        for span in spans:
+            durations[span.name].append((span.end_ns - span.start_ns) / 1e6)
+            if span.name == 'email.process':
+                process_spans[span.context.trace_id] = span
+            elif span.name == 'email.telegram_send' and span.attributes.get('http.status_code') == 200:
+                send_ends[span.context.trace_id] = span.end_ns
+        end_to_end = []
+        for trace_id, end_ns in send_ends.items():
+            process_span = process_spans.get(trace_id)
+            if process_span:
+                key = (process_span.attributes['box_id'], process_span.attributes['uid'])
+                if key in report['injected_at']:
+                    end_to_end.append((end_ns / 1e9 - report['injected_at'][key]) * 1000)
+        if end_to_end:
+            durations['end_to_end'] = end_to_end
+
+        self.stdout.write(f'{"stage":<26}{"count":>8}{"p50, ms":>10}{"p95, ms":>10}{"p99, ms":>10}{"max, ms":>10}')
+        for name in (*STAGE_SPANS, 'end_to_end'):
+            values = durations.get(name)
+            if not values:
+                continue
+            self.stdout.write(
+                f'{name:<26}{len(values):>8}{percentile(values, 0.5):>10.2f}{percentile(values, 0.95):>10.2f}'
+                f'{percentile(values, 0.99):>10.2f}{max(values):>10.2f}'
+            )
+        if not report['eager']:
+            self.stdout.write('render/send stages run in the worker: see its metrics and traces')
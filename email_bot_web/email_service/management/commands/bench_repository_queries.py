@@ -0,0 +1,134 @@
+import re
+import statistics
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from django.db import connection
+from django.db.models import QuerySet
+from email_service.models import BoxFilter, EmailBox, EmailService
+from user.models import BotUser
+
+BENCH_TELEGRAM_ID_OFFSET = 9_000_000_000_000
+BENCH_SERVICE_SLUG = 'benchmark'
+BENCH_USERNAME_PREFIX = 'bench'
+EXECUTION_TIME = re.compile(r'Execution Time: (?P<ms>[\d.]+) ms')
+
+
+class Command(BaseCommand):
+    """Нагрузочная проверка запросов репозиториев на больших таблицах через EXPLAIN ANALYZE (только PostgreSQL)."""
+
+    help = 'Заполняет БД тестовыми ящиками и выводит время выполнения и план каждого запроса репозиториев'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        """Аргументы командной строки."""
+        parser.add_argument('--boxes', type=int, default=1_000_000, help='Количество тестовых почтовых ящиков')
+        parser.add_argument('--boxes-per-user', type=int, default=5, help='Среднее количество ящиков у пользователя')
+        parser.add_argument('--filters-per-box', type=int, default=3, help='Количество фильтров у каждого ящика')
+        parser.add_argument('--runs', type=int, default=5, help='Количество запусков EXPLAIN ANALYZE на запрос')
+        parser.add_argument('--skip-seed', action='store_true', help='Не заполнять БД, использовать прошлые данные')
+        parser.add_argument('--cleanup', action='store_true', help='Удалить тестовые данные после замеров')
+        parser.add_argument('--plans', action='store_true', help='Выводить полный план каждого запроса')
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        """Заполнение данных, замеры и (опционально) очистка."""
+        if connection.vendor != 'postgresql':
+            raise CommandError('EXPLAIN ANALYZE benchmark requires PostgreSQL')
+        users_count = max(options['boxes'] // options['boxes_per_user'], 1)
+        if not options['skip_seed']:
+            self._seed(options['boxes'], users_count, options['filters_per_box'])
+        telegram_id = BENCH_TELEGRAM_ID_OFFSET + users_count // 2
+        box = EmailBox.objects.filter(user_id=telegram_id).only('id', 'email_service_id', 'email_username').first()
+        if box is None:
+            raise CommandError('Benchmark data not found, run without --skip-seed')
+        queries: dict[str, QuerySet] = {
+            'get_user': BotUser.objects.filter(telegram_id=telegram_id),
+            'user_exists': BotUser.objects.filter(telegram_id=telegram_id).values('pk')[:1],
+            'get_active_users': BotUser.objects.filter(is_active=True),
+            'get_services': EmailService.objects.all(),
+            'get_box': EmailBox.objects.filter(id=box.id),
+            'get_user_box': EmailBox.objects.filter(id=box.id, user_id=telegram_id),
+            'get_user_boxes': EmailBox.objects.filter(user_id=telegram_id),
+            'get_active_users_box_ids': EmailBox.objects.filter(user_id__is_active=True).values_list('id', flat=True),
+            'get_active_users_boxes': EmailBox.objects.filter(user_id__is_active=True, id__in=[box.id]),
+            'get_filters': BoxFilter.objects.filter(box_id=box.id),
+            'box_duplicate_check': EmailBox.objects.filter(
+                user_id=telegram_id,
+                email_service_id=box.email_service_id,
+                email_username=box.email_username
+            ),
+        }
+        self.stdout.write(f'{"query":<24}{"median, ms":>12}{"max, ms":>10}  plan')
+        for name, queryset in queries.items():
+            self._report(name, queryset, options['runs'], options['plans'])
+        if options['cleanup']:
+            self._cleanup()
+
+    def _seed(self, boxes_count: int, users_count: int, filters_per_box: int) -> None:
+        """Массовое заполнение таблиц средствами PostgreSQL (generate_series) и обновление статистики."""
+        self.stdout.write(f'Seeding {users_count} users, {boxes_count} boxes, {filters_per_box} filters per box...')
+        service, _ = EmailService.objects.get_or_create(
+            slug=BENCH_SERVICE_SLUG,
+            defaults={'title': 'Benchmark', 'address': 'imap.example.com', 'port': 993}
+        )
+        box_user_column = EmailBox._meta.get_field('user_id').column
+        box_service_column = EmailBox._meta.get_field('email_service').column
+        filter_box_column = BoxFilter._meta.get_field('box_id').column
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {BotUser._meta.db_table} (telegram_id, is_active) '
+                f'SELECT %s + g, g %% 10 <> 0 FROM generate_series(0, %s) AS g '
+                f'ON CONFLICT DO NOTHING',
+                [BENCH_TELEGRAM_ID_OFFSET, users_count - 1]
+            )
+            cursor.execute(
+                f'INSERT INTO {EmailBox._meta.db_table} '
+                f'({box_user_column}, {box_service_column}, email_username, email_password, is_active) '
+                f'SELECT %s + g %% %s, %s, %s || g || \'@example.com\', \'benchmark\', g %% 7 <> 0 '
+                f'FROM generate_series(0, %s) AS g '
+                f'ON CONFLICT DO NOTHING',
+                [BENCH_TELEGRAM_ID_OFFSET, users_count, service.id, BENCH_USERNAME_PREFIX, boxes_count - 1]
+            )
+            cursor.execute(
+                f'INSERT INTO {BoxFilter._meta.db_table} ({filter_box_column}, filter_value, filter_name) '
+                f'SELECT box.id, \'sender\' || s || \'@example.com\', NULL '
+                f'FROM {EmailBox._meta.db_table} AS box CROSS JOIN generate_series(1, %s) AS s '
+                f'WHERE box.{box_service_column} = %s '
+                f'AND NOT EXISTS (SELECT 1 FROM {BoxFilter._meta.db_table} f WHERE f.{filter_box_column} = box.id)',
+                [filters_per_box, service.id]
+            )
+            for db_table in (BotUser._meta.db_table, EmailBox._meta.db_table, BoxFilter._meta.db_table):
+                cursor.execute(f'ANALYZE {db_table}')
+
+    def _report(self, name: str, queryset: QuerySet, runs: int, show_plan: bool) -> None:
+        """Несколько прогонов EXPLAIN ANALYZE одного запроса и вывод строки отчета."""
+        timings = []
+        plan = ''
+        for _ in range(runs):
+            plan = queryset.explain(analyze=True, buffers=True)
+            match = EXECUTION_TIME.search(plan)
+            if match:
+                timings.append(float(match.group('ms')))
+        top_node = plan.splitlines()[0].split('  (')[0] if plan else ''
+        self.stdout.write(f'{name:<24}{statistics.median(timings):>12.3f}{max(timings):>10.3f}  {top_node}')
+        if show_plan:
+            self.stdout.write(plan)
+
+    def _cleanup(self) -> None:
+        """Удаление тестовых данных одним запросом на таблицу, без загрузки объектов в память."""
+        self.stdout.write('Removing benchmark data...')
+        service = EmailService.objects.filter(slug=BENCH_SERVICE_SLUG).first()
+        box_service_column = EmailBox._meta.get_field('email_service').column
+        filter_box_column = BoxFilter._meta.get_field('box_id').column
+        with connection.cursor() as cursor:
+            if service:
+                cursor.execute(
+                    f'DELETE FROM {BoxFilter._meta.db_table} WHERE {filter_box_column} IN '
+                    f'(SELECT id FROM {EmailBox._meta.db_table} WHERE {box_service_column} = %s)',
+                    [service.id]
+                )
+                cursor.execute(f'DELETE FROM {EmailBox._meta.db_table} WHERE {box_service_column} = %s', [service.id])
+                cursor.execute(f'DELETE FROM {EmailService._meta.db_table} WHERE id = %s', [service.id])
+            cursor.execute(
+                f'DELETE FROM {BotUser._meta.db_table} WHERE telegram_id >= %s',
+                [BENCH_TELEGRAM_ID_OFFSET]
+            )
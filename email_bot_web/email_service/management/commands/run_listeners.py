@@ -0,0 +1,103 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import time
+from multiprocessing.connection import wait
+from typing import Any
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandParser
+
+logger = logging.getLogger('infrastructure')
+
+RESTART_DELAY = 1  # in seconds
+SHUTDOWN_GRACE = 5  # in seconds over IMAP_SHUTDOWN_TIMEOUT
+
+
+def run_listener_process(node_id: str) -> None:
+    """
+    Точка входа дочернего процесса-слушателя (spawn): свой идентификатор узла и свой цикл событий.
+    Django настраивается заново, поэтому модули приложения импортируются только здесь.
+    """
+    os.environ['NODE_ID'] = node_id
+    import django
+    django.setup()
+    from infrastructure.gateways.imap_listeners import listener_node
+    try:
+        asyncio.run(listener_node.run())
+    except KeyboardInterrupt:
+        pass
+
+
+class Command(BaseCommand):
+    """
+    Процесс-слушатель IMAP, отдельный от веб-сервера: все клиенты IMAP работают здесь,
+    а веб-узлы только публикуют команды в канал управления.
+    Каждый процесс - отдельный узел распределения ящиков со своим циклом событий.
+    """
+
+    help = 'Запускает клиенты IMAP почтовых ящиков в отдельных от веб-сервера процессах'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        """Аргументы командной строки."""
+        parser.add_argument('--processes', type=int, default=settings.IMAP_LISTENER_PROCESSES,
+                            help='Количество процессов-слушателей (0 - по числу ядер)')
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        """Запуск одного узла в текущем процессе или нескольких дочерних процессов под наблюдением."""
+        from infrastructure.utils.metrics import start_worker_metrics_server
+        start_worker_metrics_server()
+        processes = options['processes'] or os.cpu_count() or 1
+        if processes == 1:
+            from infrastructure.gateways.imap_listeners import listener_node
+            asyncio.run(listener_node.run())
+            return
+        self._supervise(processes)
+
+    def _supervise(self, processes_count: int) -> None:
+        """
+        Запуск дочерних процессов, перезапуск упавших и их остановка по SIGTERM/SIGINT:
+        процессы получают SIGTERM и передают ящики сами, по истечении IMAP_SHUTDOWN_TIMEOUT завершаются принудительно.
+        """
+        from infrastructure.utils.metrics import mark_worker_process_dead
+        context = multiprocessing.get_context('spawn')
+        stopping = False
+
+        def stop(signum: int, frame: Any) -> None:
+            nonlocal stopping
+            stopping = True
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        processes = {index: self._start_process(context, index) for index in range(processes_count)}
+        while not stopping:
+            wait([process.sentinel for process in processes.values()], timeout=RESTART_DELAY)
+            for index, process in processes.items():
+                if not process.is_alive() and not stopping:
+                    logger.error(f'IMAP listener process {process.name} exited with code {process.exitcode}, '
+                                 f'restarting')
+                    if process.pid is not None:
+                        mark_worker_process_dead(process.pid)
+                    processes[index] = self._start_process(context, index)
+        for process in processes.values():
+            process.terminate()
+        deadline = time.monotonic() + settings.IMAP_SHUTDOWN_TIMEOUT + SHUTDOWN_GRACE
+        for process in processes.values():
+            process.join(max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                logger.error(f'IMAP listener process {process.name} did not stop in time, killing')
+                process.kill()
+                process.join()
+            if process.pid is not None:
+                mark_worker_process_dead(process.pid)
+
+    @staticmethod
+    def _start_process(context: multiprocessing.context.SpawnContext, index: int) -> multiprocessing.context.SpawnProcess:
+        """Запуск дочернего процесса-слушателя с идентификатором узла '<NODE_ID>-<номер>'."""
+        node_id = f'{settings.NODE_ID}-{index}'
+        process = context.Process(target=run_listener_process, args=(node_id,), name=f'imap-listener-{node_id}')
+        process.start()
+        logger.info(f'IMAP listener process {process.name} started with pid {process.pid}')
+        return process
@@ -0,0 +1,159 @@
+import asyncio
+import gc
+import logging
+import multiprocessing
+import resource
+import time
+import tracemalloc
+from typing import Any
+
+import aioimaplib
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from email_service.management.commands.bench_pipeline import (
+    fake_email_service,
+    get_rss_mb,
+    percentile,
+)
+from email_service.management.commands.bench_repository_queries import (
+    BENCH_TELEGRAM_ID_OFFSET,
+)
+from infrastructure.benchmarks.fake_imap_server import serve_in_process
+from infrastructure.gateways.imap_client import IMAPClient, IMAPStatuses
+from infrastructure.gateways.imap_fleet import BoxConnectionStates, imap_fleet
+
+
+class EventLoopLagMonitor:
+    """Замер задержки цикла событий: насколько позже запланированного просыпается sleep(interval)."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.samples: list[float] = []
+
+    async def run(self) -> None:
+        """Периодический замер задержки до отмены задачи."""
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append((loop.time() - started - self.interval) * 1000)
+
+
+class Command(BaseCommand):
+    """
+    Нагрузочный тест долгоживущих сессий IDLE: N настоящих IMAPClient против поддельного сервера IMAP
+    в отдельном процессе. Отчет: RSS на сессию, задержка цикла событий и CPU в установившемся режиме.
+    """
+
+    help = 'Открывает N сессий IDLE и измеряет RSS на сессию, задержку цикла событий и CPU процесса'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        """Аргументы командной строки."""
+        parser.add_argument('--sessions', type=int, default=1000, help='Количество сессий IDLE')
+        parser.add_argument('--duration', type=float, default=180, help='Длительность установившегося режима, с')
+        parser.add_argument('--connect-rate', type=float, default=500, help='Частота подключений, сессий/с')
+        parser.add_argument('--connect-timeout', type=float, default=300, help='Ожидание подключения всех сессий, с')
+        parser.add_argument('--lag-interval', type=float, default=0.1, help='Интервал замера задержки цикла, с')
+        parser.add_argument('--tracemalloc', type=int, default=0,
+                            help='Показать N мест с наибольшим выделением памяти на подключенные сессии')
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        """Запуск сервера в отдельном процессе и замер."""
+        if options['verbosity'] < 2:
+            logging.getLogger('infrastructure').setLevel(logging.WARNING)
+        soft_limit, hard_limit = resource.getrlimit(resource.RLIMIT_NOFILE)
+        required = options['sessions'] + 1024
+        if soft_limit < required:
+            if hard_limit != resource.RLIM_INFINITY and hard_limit < required:
+                raise CommandError(f'Open files limit {hard_limit} is too low for {options["sessions"]} sessions')
+            resource.setrlimit(resource.RLIMIT_NOFILE, (required, hard_limit))
+        port_queue: multiprocessing.Queue = multiprocessing.Queue()
+        server_process = multiprocessing.Process(target=serve_in_process, args=(port_queue,), daemon=True)
+        server_process.start()
+        try:
+            port = port_queue.get(timeout=30)
+            asyncio.run(self._run(port, options))
+        finally:
+            server_process.terminate()
+            server_process.join()
+
+    async def _run(self, port: int, options: dict[str, Any]) -> None:
+        """Подключение сессий, замер установившегося режима и остановка клиентов."""
+        sessions = options['sessions']
+        gc.collect()
+        rss_baseline = get_rss_mb()
+        if options['tracemalloc']:
+            tracemalloc.start()
+            snapshot_before = tracemalloc.take_snapshot()
+
+        clients = []
+        loops = []
+        service = fake_email_service('127.0.0.1', port)
+        connect_started = time.perf_counter()
+        for index in range(sessions):
+            await asyncio.sleep(max(connect_started + index / options['connect_rate'] - time.perf_counter(), 0))
+            client = IMAPClient(service=service, user=f'soak{index}@fake.imap', password='password',
+                                telegram_id=BENCH_TELEGRAM_ID_OFFSET + index, box_id=BENCH_TELEGRAM_ID_OFFSET + index,
+                                whitelist=set())
+            client.connection_manager.client = aioimaplib.IMAP4(host='127.0.0.1', port=port, timeout=30)
+            clients.append(client)
+            loops.append(asyncio.create_task(client.imap_loop()))
+        connect_deadline = time.perf_counter() + options['connect_timeout']
+        while self._idle_count(clients) < sessions:
+            failed = [loop for loop in loops if loop.done()]
+            if failed or time.perf_counter() > connect_deadline:
+                await self._stop(clients, loops)
+                raise CommandError(f'Only {self._idle_count(clients)}/{sessions} sessions reached IDLE '
+                                   f'({len(failed)} client loops failed)')
+            await asyncio.sleep(0.1)
+        connect_seconds = time.perf_counter() - connect_started
+        gc.collect()
+        rss_connected = get_rss_mb()
+        if options['tracemalloc']:
+            top_allocations = tracemalloc.take_snapshot().compare_to(snapshot_before, 'lineno')[:options['tracemalloc']]
+            tracemalloc.stop()
+
+        lag_monitor = EventLoopLagMonitor(options['lag_interval'])
+        lag_task = asyncio.create_task(lag_monitor.run())
+        usage_before = resource.getrusage(resource.RUSAGE_SELF)
+        await asyncio.sleep(options['duration'])
+        usage_after = resource.getrusage(resource.RUSAGE_SELF)
+        lag_task.cancel()
+        rss_steady = get_rss_mb()
+        idle_after = self._idle_count(clients)
+        await self._stop(clients, loops)
+
+        cpu_seconds = usage_after.ru_utime + usage_after.ru_stime - usage_before.ru_utime - usage_before.ru_stime
+        lag = lag_monitor.samples or [0.0]
+        self.stdout.write(f'sessions {sessions}: connected in {connect_seconds:.1f} s, '
+                          f'in IDLE after steady state {idle_after}')
+        self.stdout.write(f'RSS baseline {rss_baseline:.1f} MB, connected {rss_connected:.1f} MB, '
+                          f'after {options["duration"]:.0f} s {rss_steady:.1f} MB, '
+                          f'per session {(rss_connected - rss_baseline) * 1024 / sessions:.1f} KB')
+        self.stdout.write(f'event loop lag p50 {percentile(lag, 0.5):.2f} ms, p99 {percentile(lag, 0.99):.2f} ms, '
+                          f'max {max(lag):.2f} ms')
+        self.stdout.write(f'CPU {cpu_seconds:.2f} s over {options["duration"]:.0f} s '
+                          f'({cpu_seconds / options["duration"] * 100:.1f}% of one core)')
+        if options['tracemalloc']:
+            self.stdout.write('top allocations while connecting:')
+            for statistic in top_allocations:
+                self.stdout.write(f'  {statistic}')
+
+    @staticmethod
+    def _idle_count(clients: list[IMAPClient]) -> int:
+        """Количество клиентов, хотя бы раз вошедших в IDLE."""
+        idle_count = 0
+        for client in clients:
+            box_state = imap_fleet.boxes.get(client.redis_ops.box_id)
+            if box_state and box_state.last_idle_at is not None and box_state.state != BoxConnectionStates.ERROR.value:
+                idle_count += 1
+        return idle_count
+
+    @staticmethod
+    async def _stop(clients: list[IMAPClient], loops: list[asyncio.Task]) -> None:
+        """Остановка клиентов статусом 'stopped' с выходом из IDLE."""
+        for client in clients:
+            await client.redis_ops.set_status(IMAPStatuses.STOPPED.value)
+            await client.wake_up()
+        await asyncio.wait(loops, timeout=30)
+        for loop in loops:
+            loop.cancel()
@@ -0,0 +1,44 @@
+# Generated by Django 4.1 on 2026-10-19 00:51
+
+from django.db import migrations
+from django.db.models import Count
+
+
+def check_duplicate_boxes(apps, schema_editor):
+    """
+    Останавливает миграцию, если у пользователя есть повторяющиеся ящики (пользователь/сервис/имя),
+    на которые не создастся ограничение уникальности. Какие из них удалить, решает оператор.
+    """
+    EmailBox = apps.get_model('email_service', 'EmailBox')
+    duplicates = (
+        EmailBox.objects
+        .values('user_id', 'email_service', 'email_username')
+        .annotate(boxes_count=Count('id'))
+        .filter(boxes_count__gt=1)
+    )
+    groups = []
+    for duplicate in duplicates:
+        box_ids = list(EmailBox.objects.filter(
+            user_id=duplicate['user_id'],
+            email_service=duplicate['email_service'],
+            email_username=duplicate['email_username'],
+        ).order_by('id').values_list('id', flat=True))
+        groups.append(f'user {duplicate["user_id"]}, service {duplicate["email_service"]}, '
+                      f'{duplicate["email_username"]}: boxes {box_ids}')
+    if groups:
+        raise RuntimeError(
+            f'{len(groups)} (user, service, username) combinations have several email boxes. '
+            f'Delete the extra boxes (their filters are deleted with them) and run migrate again:\n'
+            + '\n'.join(groups)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('email_service', '0002_emailbox_is_active'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_boxes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.1 on 2026-10-19 00:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('email_service', '0003_check_duplicate_email_boxes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='boxfilter',
+            index=models.Index(fields=['box_id', 'filter_value'], name='box_filter_box_value_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='emailbox',
+            constraint=models.UniqueConstraint(fields=('user_id', 'email_service', 'email_username'), name='email_box_unique_user_service_username'),
+        ),
+    ]
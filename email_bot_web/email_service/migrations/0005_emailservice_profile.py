@@ -0,0 +1,39 @@
+# Generated by Django 4.1 on 2026-10-19 01:40
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('email_service', '0004_emailbox_unique_and_box_filter_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailservice',
+            name='capabilities',
+            field=models.JSONField(blank=True, help_text='Определяются по ответу CAPABILITY при первом подключении; очистите для повторного определения', null=True, verbose_name='Поддерживаемые расширения IMAP'),
+        ),
+        migrations.AddField(
+            model_name='emailservice',
+            name='command_timeout',
+            field=models.PositiveIntegerField(default=30, verbose_name='Таймаут команд IMAP, с'),
+        ),
+        migrations.AddField(
+            model_name='emailservice',
+            name='connect_rate',
+            field=models.FloatField(blank=True, help_text='Пусто - без ограничения', null=True, validators=[django.core.validators.MinValueValidator(0.01)], verbose_name='Частота новых подключений с узла, подключений/с'),
+        ),
+        migrations.AddField(
+            model_name='emailservice',
+            name='idle_renewal_interval',
+            field=models.PositiveIntegerField(default=600, validators=[django.core.validators.MinValueValidator(30), django.core.validators.MaxValueValidator(1740)], verbose_name='Интервал перезапуска IDLE, с'),
+        ),
+        migrations.AddField(
+            model_name='emailservice',
+            name='max_connections',
+            field=models.PositiveIntegerField(blank=True, help_text='Пусто - без ограничения', null=True, verbose_name='Максимум подключений к серверу с узла'),
+        ),
+    ]
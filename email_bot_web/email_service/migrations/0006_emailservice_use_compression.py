@@ -0,0 +1,18 @@
+# Generated by Django 4.1 on 2026-10-19 01:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('email_service', '0005_emailservice_profile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailservice',
+            name='use_compression',
+            field=models.BooleanField(default=False, help_text='Используется, если сервер поддерживает расширение; память сессии увеличивается примерно на 40 КБ', verbose_name='Сжатие трафика COMPRESS=DEFLATE'),
+        ),
+    ]
@@ -1,6 +1,10 @@
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 from user.models import BotUser
 
+# RFC 2177: клиент должен перезапускать IDLE не реже чем раз в 29 минут.
+MAX_IDLE_RENEWAL_INTERVAL = 29 * 60
+
 
 class EmailService(models.Model):
     """Модель почтового сервера."""
@@ -9,6 +13,28 @@ class EmailService(models.Model):
     slug = models.SlugField(verbose_name='Slug сервиса', unique=True)
     address = models.CharField(max_length=256, verbose_name='Адрес сервера')
     port = models.PositiveIntegerField(verbose_name='Порт сервера')
+    idle_renewal_interval = models.PositiveIntegerField(
+        default=600,
+        validators=[MinValueValidator(30), MaxValueValidator(MAX_IDLE_RENEWAL_INTERVAL)],
+        verbose_name='Интервал перезапуска IDLE, с'
+    )
+    command_timeout = models.PositiveIntegerField(default=30, verbose_name='Таймаут команд IMAP, с')
+    max_connections = models.PositiveIntegerField(
+        null=True, blank=True, verbose_name='Максимум подключений к серверу с узла',
+        help_text='Пусто - без ограничения'
+    )
+    connect_rate = models.FloatField(
+        null=True, blank=True, validators=[MinValueValidator(0.01)],
+        verbose_name='Частота новых подключений с узла, подключений/с', help_text='Пусто - без ограничения'
+    )
+    use_compression = models.BooleanField(
+        default=False, verbose_name='Сжатие трафика COMPRESS=DEFLATE',
+        help_text='Используется, если сервер поддерживает расширение; память сессии увеличивается примерно на 40 КБ'
+    )
+    capabilities = models.JSONField(
+        null=True, blank=True, verbose_name='Поддерживаемые расширения IMAP',
+        help_text='Определяются по ответу CAPABILITY при первом подключении; очистите для повторного определения'
+    )
 
     class Meta:
         verbose_name = 'Почтовый сервис'
@@ -31,6 +57,12 @@ class EmailBox(models.Model):
     class Meta:
         verbose_name = 'Почтовый ящик'
         verbose_name_plural = 'Почтовые ящики'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user_id', 'email_service', 'email_username'],
+                name='email_box_unique_user_service_username'
+            ),
+        ]
 
     def __str__(self) -> str:
         return self.email_username
@@ -46,6 +78,9 @@ class BoxFilter(models.Model):
     class Meta:
         verbose_name = 'Фильтр'
         verbose_name_plural = 'Фильтры'
+        indexes = [
+            models.Index(fields=['box_id', 'filter_value'], name='box_filter_box_value_idx'),
+        ]
 
     def __str__(self) -> str:
         return self.filter_value
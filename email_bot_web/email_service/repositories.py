@@ -1,6 +1,16 @@
+from dataclasses import fields
+
 from django.conf import settings
+from django.db.models import QuerySet
 from email_service.models import BoxFilter, EmailBox, EmailService
 from email_service.schemas import BoxFilterSchema, EmailBoxIn
+from infrastructure.dto import (
+    BoxFilterDTO,
+    EmailBoxDTO,
+    EmailBoxWithFiltersDTO,
+    EmailServiceDTO,
+)
+from infrastructure.gateways.async_db import async_db
 from infrastructure.gateways.redis_client import redis_client
 
 
@@ -8,45 +18,80 @@ class EmailDomainRepository:
     """Репозиторий для работы с моделью EmailService."""
 
     @staticmethod
-    @redis_client.cache_result(key_format=settings.EMAIL_SERVICE_KEY_FORMAT)
-    async def get_service(service_id: int) -> EmailService:
+    @redis_client.cache_result(
+        key_format=settings.EMAIL_SERVICE_KEY_FORMAT,
+        generation_format_list=[settings.EMAIL_SERVICES_GENERATION_KEY_FORMAT]
+    )
+    async def get_service(service_id: int) -> EmailServiceDTO:
         """Асинхронно получает сервис электронной почты по его идентификатору."""
         service = await EmailService.objects.aget(id=service_id)
-        return service
+        return EmailServiceDTO.from_model(service)
 
     @staticmethod
-    @redis_client.cache_result(key_format=settings.EMAIL_SERVICES_KEY_FORMAT)
-    async def get_services() -> list[EmailService]:
+    @redis_client.cache_result(
+        key_format=settings.EMAIL_SERVICES_KEY_FORMAT,
+        generation_format_list=[settings.EMAIL_SERVICES_GENERATION_KEY_FORMAT]
+    )
+    async def get_services() -> list[EmailServiceDTO]:
         """Асинхронно получает список всех сервисов электронной почты."""
-        return [service async for service in EmailService.objects.all()]
+        return [EmailServiceDTO.from_model(service) async for service in EmailService.objects.all()]
+
+    @staticmethod
+    @redis_client.invalidate_cache(generation_format_list=[settings.EMAIL_SERVICES_GENERATION_KEY_FORMAT])
+    async def update_capabilities(service_id: int, capabilities: list[str]) -> None:
+        """Асинхронно сохраняет расширения IMAP, определенные по ответу сервера."""
+        await EmailService.objects.filter(id=service_id).aupdate(capabilities=capabilities)
 
 
 class BoxFilterRepository:
     """Репозиторий для работы с моделью BoxFilter."""
 
     @staticmethod
-    @redis_client.invalidate_cache(key_format_list=[settings.BOX_FILTERS_KEY_FORMAT])
+    @redis_client.invalidate_cache(generation_format_list=[settings.EMAIL_BOX_GENERATION_KEY_FORMAT])
     async def create_filters(box_id: int, box_filters_data: list[BoxFilterSchema]) -> list[BoxFilter]:
         """Асинхронно создает фильтры для указанного ящика."""
         box_filters_to_add = [BoxFilter(
-            box_id=box_id,
+            box_id_id=box_id,
             filter_value=box_filter.filter_value,
             filter_name=box_filter.filter_name
         ) for box_filter in box_filters_data]
         return await BoxFilter.objects.abulk_create(box_filters_to_add)
 
     @staticmethod
-    @redis_client.cache_result(key_format=settings.BOX_FILTERS_KEY_FORMAT)
-    async def get_filters(box_id: int) -> list[BoxFilter]:
+    @redis_client.cache_result(
+        key_format=settings.BOX_FILTERS_KEY_FORMAT,
+        generation_format_list=[settings.EMAIL_BOX_GENERATION_KEY_FORMAT]
+    )
+    async def get_filters(box_id: int) -> list[BoxFilterDTO]:
         """Асинхронно получает фильтры для указанного ящика."""
-        return [box_filter async for box_filter in BoxFilter.objects.filter(box_id=box_id)]
+        return [BoxFilterDTO.from_model(box_filter) async for box_filter in BoxFilter.objects.filter(box_id=box_id)]
 
 
 class EmailBoxRepository:
     """Репозиторий для работы с моделью EmailBox."""
 
     @staticmethod
-    @redis_client.invalidate_cache(key_format_list=[settings.USER_EMAIL_BOXES_KEY_FORMAT])
+    async def _fetch_boxes_with_filters(email_boxes: QuerySet) -> list[EmailBoxWithFiltersDTO]:
+        """
+        Асинхронно получает ящики вместе с фильтрами одним запросом (LEFT JOIN) через пул psycopg 3.
+        Строки ящика повторяются для каждого его фильтра и группируются по идентификатору ящика.
+        """
+        box_fields = [field.name for field in fields(EmailBoxDTO)]
+        filter_fields = [f'filters__{field.name}' for field in fields(BoxFilterDTO)]
+        rows = await async_db.fetch_all(email_boxes.values_list(*box_fields, *filter_fields))
+        box_fields_count = len(box_fields)
+        boxes: dict[int, EmailBoxWithFiltersDTO] = {}
+        for row in rows:
+            box_row, filter_row = row[:box_fields_count], row[box_fields_count:]
+            box_with_filters = boxes.get(box_row[0])
+            if box_with_filters is None:
+                box_with_filters = boxes[box_row[0]] = EmailBoxWithFiltersDTO(box=EmailBoxDTO(*box_row), filters=[])
+            if filter_row[0] is not None:
+                box_with_filters.filters.append(BoxFilterDTO(*filter_row))
+        return list(boxes.values())
+
+    @staticmethod
+    @redis_client.invalidate_cache(generation_format_list=[settings.BOT_USER_GENERATION_KEY_FORMAT])
     async def create_box(
             telegram_id: int,
             email_domain_id: int,
@@ -54,54 +99,112 @@ class EmailBoxRepository:
     ) -> EmailBox:
         """Асинхронно создает почтовый ящик."""
         email_box = await EmailBox.objects.acreate(
-            user_id=telegram_id,
-            email_service=email_domain_id,
+            user_id_id=telegram_id,
+            email_service_id=email_domain_id,
             email_username=payload.email_username,
             email_password=payload.email_password
         )
         return email_box
 
     @staticmethod
-    @redis_client.cache_result(key_format=settings.EMAIL_BOX_KEY_FORMAT)
-    async def get_box(box_id: int) -> EmailBox:
+    @redis_client.cache_result(
+        key_format=settings.EMAIL_BOX_KEY_FORMAT,
+        generation_format_list=[settings.EMAIL_BOX_GENERATION_KEY_FORMAT]
+    )
+    async def get_box(box_id: int) -> EmailBoxDTO:
         """Асинхронно получает почтовый ящик по его идентификатору."""
-        return await EmailBox.objects.aget(id=box_id)
+        return EmailBoxDTO.from_model(await EmailBox.objects.aget(id=box_id))
+
+    @staticmethod
+    @redis_client.cache_result(
+        key_format=settings.USER_EMAIL_BOX_KEY_FORMAT,
+        generation_format_list=[
+            settings.BOT_USER_GENERATION_KEY_FORMAT,
+            settings.EMAIL_BOX_GENERATION_KEY_FORMAT
+        ]
+    )
+    async def get_user_box_with_filters(telegram_id: int, box_id: int) -> EmailBoxWithFiltersDTO:
+        """
+        Асинхронно получает почтовый ящик пользователя вместе с фильтрами.
+        Принадлежность ящика пользователю проверяется тем же запросом, что и выборка ящика.
+        """
+        if async_db.enabled:
+            boxes = await EmailBoxRepository._fetch_boxes_with_filters(
+                EmailBox.objects.filter(id=box_id, user_id=telegram_id)
+            )
+            if not boxes:
+                raise EmailBox.DoesNotExist()
+            return boxes[0]
+        email_box = await EmailBox.objects.prefetch_related('filters').aget(id=box_id, user_id=telegram_id)
+        return EmailBoxWithFiltersDTO.from_model(email_box)
+
+    @staticmethod
+    async def get_active_users_box_ids() -> list[int]:
+        """Асинхронно получает идентификаторы всех ящиков активных пользователей (для распределения по узлам)."""
+        box_ids = EmailBox.objects.filter(user_id__is_active=True).values_list('id', flat=True)
+        return [box_id async for box_id in box_ids]
+
+    @staticmethod
+    async def get_active_users_boxes_with_filters(box_ids: list[int] | None = None) -> list[EmailBoxWithFiltersDTO]:
+        """
+        Асинхронно получает ящики активных пользователей вместе с фильтрами (для запуска клиентов IMAP),
+        все или только перечисленные в box_ids. Заменяет отдельные запросы на каждый ящик; результат не кешируется.
+        """
+        email_boxes = EmailBox.objects.filter(user_id__is_active=True)
+        if box_ids is not None:
+            email_boxes = email_boxes.filter(id__in=box_ids)
+        if async_db.enabled:
+            return await EmailBoxRepository._fetch_boxes_with_filters(email_boxes)
+        return [
+            EmailBoxWithFiltersDTO.from_model(email_box)
+            async for email_box in email_boxes.prefetch_related('filters')
+        ]
 
     @staticmethod
     @redis_client.invalidate_cache(
-        key_format_list=[
-            settings.USER_EMAIL_BOXES_KEY_FORMAT,
-            settings.EMAIL_BOX_KEY_FORMAT
+        generation_format_list=[
+            settings.BOT_USER_GENERATION_KEY_FORMAT,
+            settings.EMAIL_BOX_GENERATION_KEY_FORMAT
         ]
     )
-    async def delete_box(box_id: int, telegram_id: int) -> None:
-        """Асинхронно удаляет почтовый ящик."""
-        await EmailBox.objects.filter(id=box_id).adelete()
+    async def delete_box(box_id: int, telegram_id: int) -> bool:
+        """Асинхронно удаляет почтовый ящик пользователя. Возвращает False, если у пользователя нет такого ящика."""
+        deleted_count, _ = await EmailBox.objects.filter(id=box_id, user_id=telegram_id).adelete()
+        return bool(deleted_count)
 
     @staticmethod
-    @redis_client.cache_result(key_format=settings.USER_EMAIL_BOXES_KEY_FORMAT)
-    async def get_user_boxes(telegram_id: int) -> list[EmailBox]:
+    @redis_client.cache_result(
+        key_format=settings.USER_EMAIL_BOXES_KEY_FORMAT,
+        generation_format_list=[settings.BOT_USER_GENERATION_KEY_FORMAT]
+    )
+    async def get_user_boxes(telegram_id: int) -> list[EmailBoxDTO]:
         """Асинхронно получает список всех ящиков, принадлежащих пользователю с указанным telegram_id."""
-        return [email_box async for email_box in EmailBox.objects.filter(user_id=telegram_id)]
+        return [EmailBoxDTO.from_model(email_box) async for email_box in EmailBox.objects.filter(user_id=telegram_id)]
 
     @staticmethod
     @redis_client.invalidate_cache(
-        key_format_list=[
-            settings.USER_EMAIL_BOXES_KEY_FORMAT,
-            settings.EMAIL_BOX_KEY_FORMAT
+        generation_format_list=[
+            settings.BOT_USER_GENERATION_KEY_FORMAT,
+            settings.EMAIL_BOX_GENERATION_KEY_FORMAT
         ]
     )
-    async def pause_box_listening(box_id: int, telegram_id: int) -> None:
-        """Асинхронно ставит на паузу прослушивание почтового ящика (устанавливает is_active в False)."""
-        await EmailBox.objects.filter(id=box_id).aupdate(is_active=False)
+    async def pause_box_listening(box_id: int, telegram_id: int) -> bool:
+        """
+        Асинхронно ставит на паузу прослушивание почтового ящика пользователя (устанавливает is_active в False).
+        Возвращает False, если у пользователя нет такого ящика.
+        """
+        return bool(await EmailBox.objects.filter(id=box_id, user_id=telegram_id).aupdate(is_active=False))
 
     @staticmethod
     @redis_client.invalidate_cache(
-        key_format_list=[
-            settings.USER_EMAIL_BOXES_KEY_FORMAT,
-            settings.EMAIL_BOX_KEY_FORMAT
+        generation_format_list=[
+            settings.BOT_USER_GENERATION_KEY_FORMAT,
+            settings.EMAIL_BOX_GENERATION_KEY_FORMAT
         ]
     )
-    async def resume_box_listening(box_id: int, telegram_id: int) -> None:
-        """Асинхронно возобновляет прослушивание почтового ящика (устанавливает is_active в True)."""
-        await EmailBox.objects.filter(id=box_id).aupdate(is_active=True)
+    async def resume_box_listening(box_id: int, telegram_id: int) -> bool:
+        """
+        Асинхронно возобновляет прослушивание почтового ящика пользователя (устанавливает is_active в True).
+        Возвращает False, если у пользователя нет такого ящика.
+        """
+        return bool(await EmailBox.objects.filter(id=box_id, user_id=telegram_id).aupdate(is_active=True))
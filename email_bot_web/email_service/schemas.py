@@ -62,3 +62,12 @@ class EmailServicesList(Schema):
     """Схема для вывода данных о поддерживаемых сервисах."""
 
     services: list[EmailServiceSchema]
+
+
+class BoxProvisioningJobOut(Schema):
+    """Схема для вывода состояния задачи создания почтового ящика."""
+
+    job_id: str
+    status: str
+    box_id: int | None
+    error: str | None
@@ -1,38 +1,77 @@
-import asyncio
+import operator
+import time
+import uuid
+from functools import reduce
+from typing import Any
 
 from django.conf import settings
-from django.db import IntegrityError
-from email_service.models import BoxFilter, EmailBox, EmailService
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Q, QuerySet
+from email_service.models import EmailBox, EmailService
 from email_service.schemas import EmailBoxIn
+from email_service.tasks import bulk_update_boxes_task
+from infrastructure.dto import (
+    BoxFilterDTO,
+    EmailBoxDTO,
+    EmailBoxWithFiltersDTO,
+    EmailServiceDTO,
+)
 from infrastructure.exceptions import (
     AppliedFiltersNotFound,
     AvailableServicesNotFound,
     BotUserNotFound,
+    BoxProvisioningJobNotFound,
     BoxUserNotEqualToRequestedTelegramUser,
     EmailBoxAlreadyExists,
     EmailBoxNotFound,
     EmailCredsInvalid,
     EmailServiceNotFound,
+    IMAPCircuitOpen,
+    IMAPServerTimeout,
     UserBoxesNotFound,
 )
-from infrastructure.gateways.imap_client import (
-    IMAPClient,
-    IMAPConnectionManager,
-    IMAPStatuses,
-)
+from infrastructure.gateways.imap_client import IMAPConnectionManager, IMAPStatuses
+from infrastructure.gateways.imap_sessions import imap_sessions
 from infrastructure.gateways.redis_client import redis_client
 from infrastructure.repositories import EmailBotWebRepository
 from infrastructure.utils.encryption_service import CryptoService
 from user.models import BotUser
 
 
+async def get_box_access_error(repo: EmailBotWebRepository, telegram_id: int, box_id: int) -> Exception:
+    """
+    Определение причины, по которой почтовый ящик не найден у пользователя.
+    Вызывается только после неудачного запроса по паре (telegram_id, box_id), поэтому не нагружает основной путь.
+    """
+    if not await repo.bot_user_repo.user_exists(telegram_id):
+        return BotUserNotFound()
+    try:
+        await repo.email_box_repo.get_box(box_id)
+    except EmailBox.DoesNotExist:
+        return EmailBoxNotFound()
+    return BoxUserNotEqualToRequestedTelegramUser()
+
+
+async def get_user_box_with_filters(
+        repo: EmailBotWebRepository,
+        telegram_id: int,
+        box_id: int
+) -> EmailBoxWithFiltersDTO:
+    """Асинхронное получение почтового ящика пользователя с фильтрами и обработка ошибок."""
+    try:
+        return await repo.email_box_repo.get_user_box_with_filters(telegram_id, box_id)
+    except EmailBox.DoesNotExist:
+        raise await get_box_access_error(repo, telegram_id, box_id)
+
+
 class EmailDomainService:
     """Сервисный слой для модели EmailService."""
 
     def __init__(self):
         self.repo = EmailBotWebRepository()
 
-    async def get_services(self) -> list[EmailService]:
+    async def get_services(self) -> list[EmailServiceDTO]:
         """Асинхронное получение списка сервисов и обработка ошибок."""
         if services := await self.repo.email_domain_repo.get_services():
             return services
@@ -46,31 +85,59 @@ class EmailBoxService:
     def __init__(self):
         self.repo = EmailBotWebRepository()
 
-    async def create_box(self, telegram_id: int, payload: EmailBoxIn) -> EmailBox:
-        """Асинхронное создание почты и обработка ошибок."""
+    PROVISIONING_ERRORS: tuple[type[Exception], ...] = (
+        BotUserNotFound,
+        EmailServiceNotFound,
+        EmailBoxAlreadyExists,
+        EmailCredsInvalid,
+        IMAPServerTimeout,
+        IMAPCircuitOpen,
+    )
+    PROVISIONING_ERROR_CODES: dict[type[Exception], str] = {
+        BotUserNotFound: 'user_not_found',
+        EmailServiceNotFound: 'service_not_found',
+        EmailBoxAlreadyExists: 'already_exists',
+        EmailCredsInvalid: 'invalid_credentials',
+        IMAPServerTimeout: 'imap_timeout',
+        IMAPCircuitOpen: 'imap_timeout',
+    }
+
+    async def create_box(
+            self,
+            telegram_id: int,
+            payload: EmailBoxIn,
+            keep_session: bool = False,
+            job: dict[str, Any] | None = None
+    ) -> EmailBox:
+        """
+        Асинхронное создание почты и обработка ошибок.
+        При keep_session проверенная сессия IMAP остается в процессе для клиента нового ящика.
+        При job идентификатор ящика сохраняется в задаче сразу после записи в базу, до публикации ящика узлам.
+        """
         try:
             crypto_service = CryptoService(settings.CRYPTO_KEY)
             bot_user = await self.repo.bot_user_repo.get_user(telegram_id)
             email_service = await self.repo.email_domain_repo.get_service(payload.email_service)
             imap_connection_manager = IMAPConnectionManager(
-                email_service.address,
+                email_service,
                 payload.email_username,
                 crypto_service.decrypt_password(payload.email_password)
             )
-            if not await imap_connection_manager.check_connection():
+            if not await imap_connection_manager.check_connection(keep_session=keep_session):
                 raise EmailCredsInvalid
-            email_box = await self.repo.email_box_repo.create_box(bot_user, email_service, payload)
-            box_filters = await self.repo.box_filter_repo.create_filters(email_box, payload.filters)
-            whitelist = {filter_obj.filter_value for filter_obj in box_filters}
-            imap_client = IMAPClient(
-                host=email_service.address,
-                user=email_box.email_username,
-                password=crypto_service.decrypt_password(email_box.email_password),
-                telegram_id=telegram_id,
-                box_id=email_box.id,
-                whitelist=whitelist
-            )
-            asyncio.create_task(imap_client.imap_loop())
+            try:
+                email_box = await self.repo.email_box_repo.create_box(bot_user.telegram_id, email_service.id, payload)
+                if job is not None:
+                    job['box_id'] = email_box.id
+                    await self._save_provisioning_job(job)
+                await self.repo.box_filter_repo.create_filters(email_box.id, payload.filters)
+            except Exception:
+                if imap_connection_manager.client:
+                    await imap_sessions.logout(imap_connection_manager.client)
+                raise
+            if imap_connection_manager.client:
+                imap_sessions.park(email_box.id, imap_connection_manager.client)
+            await redis_client.publish_new_box(email_box.id)
             return email_box
         except BotUser.DoesNotExist:
             raise BotUserNotFound
@@ -79,21 +146,98 @@ class EmailBoxService:
         except IntegrityError:
             raise EmailBoxAlreadyExists
 
-    async def get_box_with_filters(self, telegram_id: int, box_id: int) -> tuple[EmailBox, list[BoxFilter]]:
-        """Асинхронное получение почтового ящика c фильтрами и обработка ошибок."""
-        try:
-            bot_user = await self.repo.bot_user_repo.get_user(telegram_id)
-            email_box = await self.repo.email_box_repo.get_box(box_id)
-            box_filters = await self.repo.box_filter_repo.get_filters(box_id)
-        except BotUser.DoesNotExist:
+    @staticmethod
+    async def _save_provisioning_job(job: dict[str, Any]) -> None:
+        """Сохранение состояния задачи создания почтового ящика в Redis."""
+        await redis_client.set(
+            settings.BOX_PROVISIONING_JOB_KEY_FORMAT.format(job_id=job['job_id']),
+            job,
+            timeout=settings.BOX_PROVISIONING_JOB_TIMEOUT
+        )
+
+    async def start_box_provisioning(self, telegram_id: int, payload: EmailBoxIn) -> dict[str, Any]:
+        """
+        Постановка создания почтового ящика в очередь узлов-слушателей.
+        Быстрые проверки выполняются сразу, а проверка входа в IMAP и создание ящика - в фоне.
+        """
+        if not await self.repo.bot_user_repo.user_exists(telegram_id):
             raise BotUserNotFound
+        try:
+            await self.repo.email_domain_repo.get_service(payload.email_service)
+        except EmailService.DoesNotExist:
+            raise EmailServiceNotFound
+        job = {'job_id': uuid.uuid4().hex, 'telegram_id': telegram_id, 'status': 'pending', 'box_id': None,
+               'error': None, 'created_at': time.time()}
+        await self._save_provisioning_job(job)
+        await redis_client.enqueue_provisioning_job(
+            {'job_id': job['job_id'], 'telegram_id': telegram_id, 'payload': payload.dict(by_alias=True)}
+        )
+        return job
+
+    async def _resume_provisioning_job(self, job: dict[str, Any], payload: EmailBoxIn) -> int | None:
+        """
+        Повторное выполнение задачи, прерванной после записи ящика в базу: возвращает уже созданный ящик,
+        досоздавая фильтры и повторяя публикацию. None, если ящик с тех пор удален.
+        """
+        try:
+            await self.repo.email_box_repo.get_box(job['box_id'])
         except EmailBox.DoesNotExist:
-            raise EmailBoxNotFound
-        if not (email_box.user_id_id == bot_user.telegram_id):
-            raise BoxUserNotEqualToRequestedTelegramUser
-        return email_box, box_filters
+            return None
+        if payload.filters and not await self.repo.box_filter_repo.get_filters(job['box_id']):
+            await self.repo.box_filter_repo.create_filters(job['box_id'], payload.filters)
+        await redis_client.publish_new_box(job['box_id'])
+        return job['box_id']
+
+    async def run_provisioning_job(self, job_message: dict[str, Any]) -> int | None:
+        """
+        Выполнение задачи создания почтового ящика на узле-слушателе с сохранением результата.
+        Задача, не начатая за BOX_PROVISIONING_JOB_TIMEOUT, завершается ошибкой expired без создания ящика,
+        повторный запуск прерванной задачи возвращает уже созданный ящик, а завершенная ошибкой не выполняется.
+        Возвращает идентификатор созданного ящика.
+        """
+        job = await redis_client.get(settings.BOX_PROVISIONING_JOB_KEY_FORMAT.format(job_id=job_message['job_id']))
+        if not job or (
+                job['status'] == 'pending' and time.time() - job['created_at'] >= settings.BOX_PROVISIONING_JOB_TIMEOUT
+        ):
+            job = {'job_id': job_message['job_id'], 'telegram_id': job_message['telegram_id'], 'status': 'failed',
+                   'box_id': None, 'error': 'expired', 'created_at': job['created_at'] if job else None}
+            await self._save_provisioning_job(job)
+            return None
+        if job['status'] == 'failed':
+            return None
+        payload = EmailBoxIn.parse_obj(job_message['payload'])
+        if job['box_id'] and (box_id := await self._resume_provisioning_job(job, payload)):
+            job.update(status='done', box_id=box_id, error=None)
+            await self._save_provisioning_job(job)
+            return box_id
+        job.update(status='running', box_id=None, error=None)
+        await self._save_provisioning_job(job)
+        try:
+            email_box = await self.create_box(job['telegram_id'], payload, keep_session=True, job=job)
+        except self.PROVISIONING_ERRORS as error:
+            job.update(status='failed', error=self.PROVISIONING_ERROR_CODES[type(error)])
+        except Exception:
+            job.update(status='failed', error='internal_error')
+            await self._save_provisioning_job(job)
+            raise
+        else:
+            job.update(status='done', box_id=email_box.id)
+        await self._save_provisioning_job(job)
+        return job['box_id']
 
-    async def get_user_boxes(self, telegram_id: int) -> list[EmailBox]:
+    async def get_provisioning_job(self, telegram_id: int, job_id: str) -> dict[str, Any]:
+        """Асинхронное получение состояния задачи создания почтового ящика пользователя и обработка ошибок."""
+        job = await redis_client.get(settings.BOX_PROVISIONING_JOB_KEY_FORMAT.format(job_id=job_id))
+        if not job or job['telegram_id'] != telegram_id:
+            raise BoxProvisioningJobNotFound
+        return job
+
+    async def get_box_with_filters(self, telegram_id: int, box_id: int) -> tuple[EmailBoxDTO, list[BoxFilterDTO]]:
+        """Асинхронное получение почтового ящика c фильтрами и обработка ошибок."""
+        box_with_filters = await get_user_box_with_filters(self.repo, telegram_id, box_id)
+        return box_with_filters.box, box_with_filters.filters
+
+    async def get_user_boxes(self, telegram_id: int) -> list[EmailBoxDTO]:
         """Асинхронное получения почтовых ящиков пользователя и обработка ошибок."""
         try:
             await self.repo.bot_user_repo.get_user(telegram_id)
@@ -106,53 +250,132 @@ class EmailBoxService:
 
     async def delete_box(self, telegram_id: int, box_id: int) -> None:
         """Асинхронное удаление почтового ящика и обработка ошибок."""
-        try:
-            bot_user = await self.repo.bot_user_repo.get_user(telegram_id)
-            email_box = await self.repo.email_box_repo.get_box(box_id)
-            if not (email_box.user_id_id == bot_user.telegram_id):
-                raise BoxUserNotEqualToRequestedTelegramUser
-            await self.repo.email_box_repo.delete_box(box_id, telegram_id)
-            await redis_client.set(f'imap_client_status_{telegram_id}_{box_id}', IMAPStatuses.STOPPED.value)
-        except BotUser.DoesNotExist:
-            raise BotUserNotFound
-        except EmailBox.DoesNotExist:
-            raise EmailBoxNotFound
+        if not await self.repo.email_box_repo.delete_box(box_id, telegram_id):
+            raise await get_box_access_error(self.repo, telegram_id, box_id)
+        cache_key = settings.IMAP_CLIENT_STATUS_KEY_FORMAT.format(
+            telegram_id=telegram_id,
+            box_id=box_id
+        )
+        await redis_client.set(cache_key, IMAPStatuses.STOPPED.value)
 
     async def pause_box_listening(self, telegram_id: int, box_id: int) -> None:
         """Асинхронная остановка прослушивания почты и обработка ошибок."""
-        try:
-            bot_user = await self.repo.bot_user_repo.get_user(telegram_id)
-            email_box = await self.repo.email_box_repo.get_box(box_id)
-            if not (email_box.user_id_id == bot_user.telegram_id):
-                raise BoxUserNotEqualToRequestedTelegramUser
-            await self.repo.email_box_repo.pause_box_listening(box_id, telegram_id)
-            cache_key = settings.IMAP_CLIENT_STATUS_KEY_FORMAT.format(
-                telegram_id=telegram_id,
-                box_id=box_id
-            )
-            await redis_client.set(cache_key, IMAPStatuses.PAUSED.value)
-        except EmailBox.DoesNotExist:
-            raise EmailBoxNotFound
-        except BotUser.DoesNotExist:
-            raise BotUserNotFound
+        if not await self.repo.email_box_repo.pause_box_listening(box_id, telegram_id):
+            raise await get_box_access_error(self.repo, telegram_id, box_id)
+        cache_key = settings.IMAP_CLIENT_STATUS_KEY_FORMAT.format(
+            telegram_id=telegram_id,
+            box_id=box_id
+        )
+        await redis_client.set(cache_key, IMAPStatuses.PAUSED.value)
 
     async def resume_box_listening(self, telegram_id: int, box_id: int) -> None:
         """Асинхронное возобновление прослушивания почты и обработка ошибок."""
-        try:
-            bot_user = await self.repo.bot_user_repo.get_user(telegram_id)
-            email_box = await self.repo.email_box_repo.get_box(box_id)
-            if not (email_box.user_id_id == bot_user.telegram_id):
-                raise BoxUserNotEqualToRequestedTelegramUser
-            await self.repo.email_box_repo.resume_box_listening(box_id, telegram_id)
-            cache_key = settings.IMAP_CLIENT_STATUS_KEY_FORMAT.format(
-                telegram_id=telegram_id,
-                box_id=box_id
+        if not await self.repo.email_box_repo.resume_box_listening(box_id, telegram_id):
+            raise await get_box_access_error(self.repo, telegram_id, box_id)
+        cache_key = settings.IMAP_CLIENT_STATUS_KEY_FORMAT.format(
+            telegram_id=telegram_id,
+            box_id=box_id
+        )
+        await redis_client.set(cache_key, IMAPStatuses.ACTIVE.value)
+
+
+class EmailBoxBulkService:
+    """Массовые действия над почтовыми ящиками из админ-панели: запрос к БД и конвейер Redis на пакет ящиков."""
+
+    ACTION_STATUSES = {
+        'activate': IMAPStatuses.ACTIVE.value,
+        'deactivate': IMAPStatuses.PAUSED.value,
+        'delete': IMAPStatuses.STOPPED.value,
+    }
+
+    @staticmethod
+    def apply(action: str, box_ids: list[int]) -> int:
+        """
+        Синхронное применение действия к пакету ящиков одним UPDATE/DELETE.
+        Статусы клиентов IMAP, счетчики поколений кеша и команда слушателям отправляются
+        одним конвейером Redis после фиксации транзакции. Возвращает количество обработанных ящиков.
+        """
+        status = EmailBoxBulkService.ACTION_STATUSES[action]
+        email_boxes = EmailBox.objects.filter(id__in=box_ids)
+        with transaction.atomic():
+            box_owners = list(email_boxes.values_list('id', 'user_id'))
+            if action == 'delete':
+                email_boxes.delete()
+            else:
+                email_boxes.update(is_active=status == IMAPStatuses.ACTIVE.value)
+            status_keys = {
+                settings.IMAP_CLIENT_STATUS_KEY_FORMAT.format(telegram_id=telegram_id, box_id=box_id): status
+                for box_id, telegram_id in box_owners
+            }
+            telegram_ids = {telegram_id for _, telegram_id in box_owners}
+            generation_keys = [
+                *(settings.BOT_USER_GENERATION_KEY_FORMAT.format(telegram_id=user_id) for user_id in telegram_ids),
+                *(settings.EMAIL_BOX_GENERATION_KEY_FORMAT.format(box_id=box_id) for box_id, _ in box_owners)
+            ]
+            control_message = {'status': status, 'box_ids': [box_id for box_id, _ in box_owners]}
+            redis_client.update_boxes_state_on_commit(status_keys, generation_keys, control_message)
+        return len(box_owners)
+
+    @staticmethod
+    def _save_job(job_id: str, job: dict[str, Any]) -> None:
+        """Сохранение состояния фоновой задачи в Redis."""
+        redis_client.set_sync(
+            settings.ADMIN_BULK_JOB_KEY_FORMAT.format(job_id=job_id),
+            job,
+            timeout=settings.ADMIN_BULK_JOB_TIMEOUT
+        )
+
+    @staticmethod
+    def select_boxes(selection: dict[str, Any]) -> QuerySet[EmailBox]:
+        """
+        Выборка ящиков по сериализуемому описанию выделения в админ-панели:
+        lookups - условия фильтров через AND, search_lookups - условия поиска через OR.
+        """
+        email_boxes = EmailBox.objects.filter(**selection['lookups'])
+        if search_lookups := selection['search_lookups']:
+            email_boxes = email_boxes.filter(
+                reduce(operator.or_, (Q(**{field: value}) for field, value in search_lookups.items()))
             )
-            await redis_client.set(cache_key, IMAPStatuses.ACTIVE.value)
-        except EmailBox.DoesNotExist:
-            raise EmailBoxNotFound
-        except BotUser.DoesNotExist:
-            raise BotUserNotFound
+        return email_boxes
+
+    @staticmethod
+    def start_job(action: str, selection: dict[str, Any], total: int) -> str:
+        """
+        Постановка массового действия в очередь Celery. Возвращает идентификатор задачи.
+        В сообщение попадает только описание выделения, идентификаторы ящиков читает задача.
+        """
+        job_id = uuid.uuid4().hex
+        EmailBoxBulkService._save_job(job_id, {'action': action, 'status': 'pending', 'total': total, 'processed': 0})
+        bulk_update_boxes_task.delay(job_id, action, selection, total)
+        return job_id
+
+    @staticmethod
+    def run_job(job_id: str, action: str, selection: dict[str, Any], total: int) -> None:
+        """
+        Синхронное выполнение массового действия пакетами с сохранением прогресса после каждого пакета.
+        Пакеты читаются по ключу (id > последнего обработанного), поэтому ни выборка целиком,
+        ни смещение OFFSET не нужны, а деактивация или удаление ящиков не сдвигает следующий пакет.
+        """
+        job: dict[str, Any] = {'action': action, 'status': 'running', 'total': total, 'processed': 0}
+        box_ids_query = EmailBoxBulkService.select_boxes(selection).order_by('id').values_list('id', flat=True)
+        chunk_size = settings.ADMIN_BULK_ACTION_CHUNK_SIZE
+        last_id = 0
+        try:
+            while box_ids := list(box_ids_query.filter(id__gt=last_id)[:chunk_size]):
+                EmailBoxBulkService._save_job(job_id, job)
+                job['processed'] += EmailBoxBulkService.apply(action, box_ids)
+                last_id = box_ids[-1]
+        except Exception:
+            job['status'] = 'failed'
+            EmailBoxBulkService._save_job(job_id, job)
+            raise
+        job['status'] = 'done'
+        EmailBoxBulkService._save_job(job_id, job)
+
+    @staticmethod
+    def get_job(job_id: str) -> dict[str, Any] | None:
+        """Получение состояния фоновой задачи."""
+        return cache.get(settings.ADMIN_BULK_JOB_KEY_FORMAT.format(job_id=job_id))
 
 
 class BoxFilterService:
@@ -161,18 +384,10 @@ class BoxFilterService:
     def __init__(self):
         self.repo = EmailBotWebRepository()
 
-    async def get_filters(self, telegram_id: int, box_id: int) -> list[BoxFilter]:
+    async def get_filters(self, telegram_id: int, box_id: int) -> list[BoxFilterDTO]:
         """Асинхронное получение списка фильтров и обработка ошибок."""
-        try:
-            bot_user = await self.repo.bot_user_repo.get_user(telegram_id)
-            email_box = await self.repo.email_box_repo.get_box(box_id)
-        except BotUser.DoesNotExist:
-            raise BotUserNotFound
-        except EmailBox.DoesNotExist:
-            raise EmailBoxNotFound
-        if not (email_box.user_id_id == bot_user.telegram_id):
-            raise BoxUserNotEqualToRequestedTelegramUser
-        if box_filters := await self.repo.box_filter_repo.get_filters(box_id):
-            return box_filters
+        box_with_filters = await get_user_box_with_filters(self.repo, telegram_id, box_id)
+        if box_with_filters.filters:
+            return box_with_filters.filters
         else:
             raise AppliedFiltersNotFound
@@ -9,7 +9,19 @@ from celery import shared_task
 from django.conf import settings
 from html2image import Html2Image
 from infrastructure.gateways.redis_client import redis_client
+from infrastructure.utils.metrics import (
+    EmailOutcomes,
+    PipelineStages,
+    record_delivery_lag,
+    record_outcome,
+    track_stage,
+)
 from infrastructure.utils.send_bot import send_photo_to_telegram_sync
+from infrastructure.utils.tracing import (
+    get_task_traceparent,
+    start_span,
+    use_traceparent,
+)
 from PIL import Image, ImageOps
 
 
@@ -52,30 +64,47 @@ def send_failed_photos_to_telegram(self) -> None:
                 files = {
                     'photo': image_bytes
                 }
-                response = requests.post(settings.TELEGRAM_SEND_PHOTO_URL, data=data,
-                                         files=files)
+                with use_traceparent(photo_data.get('traceparent')), start_span(
+                        'email.telegram_resend', telegram_id=chat_id) as span:
+                    response = requests.post(settings.TELEGRAM_SEND_PHOTO_URL, data=data,
+                                             files=files)
+                    span.set_attribute('http.status_code', response.status_code)
 
                 if response.status_code == HTTPStatus.OK:
                     redis_client.lpop(key)
+                    record_outcome(EmailOutcomes.REDELIVERED)
 
 
 @shared_task(bind=True)
 def email_html_to_image(self, html_content: str) -> bytes:
     """Задача, которая создает картинку и преобразует её в байты."""
-    hti = Html2Image()
-    temp_file_path = 'temp_email_image.png'
-    hti.screenshot(html_str=html_content, save_as=temp_file_path, size=(1200, 1000))
-    with Image.open(temp_file_path) as img:
-        bbox = ImageOps.invert(img.convert('RGB')).getbbox()
-        img_cropped = img.crop(bbox)
-        img_bytes = BytesIO()
-        img_cropped.save(img_bytes, format='PNG')
-        img_bytes = img_bytes.getvalue()  # type: ignore
-    os.remove(temp_file_path)
+    with use_traceparent(get_task_traceparent(self.request)), track_stage(PipelineStages.RENDER):
+        hti = Html2Image()
+        temp_file_path = 'temp_email_image.png'
+        hti.screenshot(html_str=html_content, save_as=temp_file_path, size=(1200, 1000))
+        with Image.open(temp_file_path) as img:
+            bbox = ImageOps.invert(img.convert('RGB')).getbbox()
+            img_cropped = img.crop(bbox)
+            img_bytes = BytesIO()
+            img_cropped.save(img_bytes, format='PNG')
+            img_bytes = img_bytes.getvalue()  # type: ignore
+        os.remove(temp_file_path)
     return img_bytes  # type: ignore
 
 
 @shared_task(bind=True)
-def send_image_to_telegram_task(self, image_bytes: bytes, telegram_id: int) -> None:
-    """Задача, которая отправляет сообщение в телеграм."""
-    send_photo_to_telegram_sync(image_bytes, telegram_id)
+def send_image_to_telegram_task(self, image_bytes: bytes, telegram_id: int, received_at: float | None = None) -> None:
+    """
+    Задача, которая отправляет сообщение в телеграм.
+    received_at - INTERNALDATE письма (unix time) для учета задержки доставки.
+    """
+    with use_traceparent(get_task_traceparent(self.request)):
+        if send_photo_to_telegram_sync(image_bytes, telegram_id).get('ok'):
+            record_delivery_lag(received_at)
+
+
+@shared_task(bind=True)
+def bulk_update_boxes_task(self, job_id: str, action: str, selection: dict, total: int) -> None:
+    """Задача, которая выполняет массовое действие над выделенными почтовыми ящиками пакетами и сохраняет прогресс."""
+    from email_service.services import EmailBoxBulkService
+    EmailBoxBulkService.run_job(job_id, action, selection, total)
@@ -1,10 +1,30 @@
 #!/bin/bash
 
+reset_metrics_dir() {
+    export PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus_multiproc}"
+    rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+    mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+}
+
+# Постоянные подключения к БД только для процессов с долгоживущими потоками (Celery, клиенты IMAP):
+# в процессе ASGI подключения потоков запросов не переиспользуются и не закрываются (Django #33497).
+use_persistent_db_connections() {
+    export DB_CONN_MAX_AGE="${DB_WORKER_CONN_MAX_AGE:-60}"
+}
+
 if [[ "${1}" == "web" ]]; then
+    export DB_CONN_MAX_AGE=0
     python3 manage.py migrate
     python3 manage.py collectstatic --noinput
+    reset_metrics_dir
     exec uvicorn core.asgi:application --host 0.0.0.0 --port "$WEB_PORT" --log-level debug
+elif [[ "${1}" == "listeners" ]]; then
+    reset_metrics_dir
+    use_persistent_db_connections
+    exec python3 manage.py run_listeners
 elif [[ "${1}" == "worker" ]]; then
+    reset_metrics_dir
+    use_persistent_db_connections
     celery -A core worker --loglevel=info
 elif [[ "${1}" == "beat" ]]; then
   celery -A core beat --loglevel=info
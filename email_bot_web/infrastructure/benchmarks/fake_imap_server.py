@@ -0,0 +1,345 @@
+import asyncio
+import re
+import time
+import zlib
+from dataclasses import dataclass, field
+from email.message import EmailMessage
+from email.parser import BytesHeaderParser
+from email.utils import formatdate, make_msgid
+from typing import Any
+
+HEADER_FIELDS = re.compile(r'HEADER\.FIELDS \((?P<names>[^)]*)\)', re.IGNORECASE)
+SEARCH_UID = re.compile(r'UID (?P<uid_set>\S+)', re.IGNORECASE)
+SELECT_QRESYNC = re.compile(r'\(QRESYNC \((?P<uid_validity>\d+) (?P<modseq>\d+)', re.IGNORECASE)
+CAPABILITIES = 'IMAP4rev1 IDLE UIDPLUS ENABLE CONDSTORE QRESYNC COMPRESS=DEFLATE'
+
+
+@dataclass(slots=True)
+class FakeMessage:
+    """Письмо почтового ящика поддельного сервера IMAP."""
+
+    uid: int
+    internal_date: float
+    raw: bytes
+    modseq: int = 1
+
+
+@dataclass(slots=True)
+class FakeMailbox:
+    """Папка INBOX пользователя поддельного сервера IMAP."""
+
+    uid_validity: int = 1
+    uid_next: int = 1
+    highest_modseq: int = 1
+    messages: list[FakeMessage] = field(default_factory=list)
+    idle_sessions: set['FakeIMAPSession'] = field(default_factory=set)
+
+
+def parse_sequence_set(sequence_set: str, max_value: int) -> set[int]:
+    """Разбор набора номеров IMAP (1,3:5,7:*) в множество номеров."""
+    numbers: set[int] = set()
+    for part in sequence_set.split(','):
+        start, _, end = part.partition(':')
+        start_value = max_value if start == '*' else int(start)
+        end_value = start_value if not end else max_value if end == '*' else int(end)
+        numbers.update(range(min(start_value, end_value), max(start_value, end_value) + 1))
+    return numbers
+
+
+def build_message(uid: int, recipient: str, body_size: int = 2000) -> bytes:
+    """Письмо в формате RFC 5322 с текстовым телом заданного размера."""
+    message = EmailMessage()
+    message['From'] = 'Benchmark Sender <sender@fake.imap>'
+    message['To'] = recipient
+    message['Subject'] = f'Benchmark message #{uid}'
+    message['Date'] = formatdate(usegmt=True)
+    message['Message-ID'] = make_msgid(domain='fake.imap')
+    message.set_content(('Lorem ipsum dolor sit amet. ' * (body_size // 28 + 1))[:body_size])
+    return message.as_bytes()
+
+
+class FakeIMAPSession:
+    """Сессия клиента поддельного сервера IMAP."""
+
+    def __init__(self, server: 'FakeIMAPServer', reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+        self.mailbox: FakeMailbox | None = None
+        self.user: str | None = None
+        self.idle_tag: str | None = None
+        self.qresync_enabled = False
+        self.compressor: Any = None
+        self.decompressor: Any = None
+        self.received = b''
+        self.closed = False
+
+    def write(self, data: bytes) -> None:
+        """Запись данных в соединение (после COMPRESS DEFLATE - в сжатом виде)."""
+        if self.compressor is not None:
+            data = self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+        self.writer.write(data)
+
+    def send(self, line: str | bytes) -> None:
+        """Запись строки ответа в соединение."""
+        self.write((line.encode() if isinstance(line, str) else line) + b'\r\n')
+
+    async def read_line(self) -> bytes:
+        """Чтение строки команды (после COMPRESS DEFLATE - с распаковкой); пустая строка - разрыв соединения."""
+        if self.decompressor is None:
+            return await self.reader.readline()
+        while b'\n' not in self.received:
+            data = await self.reader.read(65536)
+            if not data:
+                return b''
+            self.received += self.decompressor.decompress(data)
+        line, _, self.received = self.received.partition(b'\n')
+        return line + b'\n'
+
+    async def run(self) -> None:
+        """Обработка команд клиента до LOGOUT или разрыва соединения."""
+        self.send(f'* OK [CAPABILITY {CAPABILITIES}] Fake IMAP4rev1 server ready')
+        try:
+            while not self.closed:
+                line = await self.read_line()
+                if not line:
+                    break
+                self.handle(line.rstrip(b'\r\n').decode())
+                await self.writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            if self.mailbox:
+                self.mailbox.idle_sessions.discard(self)
+            self.writer.close()
+
+    def handle(self, line: str) -> None:
+        """Разбор строки и вызов обработчика команды."""
+        if self.idle_tag:
+            if line.upper() == 'DONE':
+                self.mailbox.idle_sessions.discard(self)  # type: ignore
+                self.send(f'{self.idle_tag} OK IDLE terminated')
+                self.idle_tag = None
+            return
+        tag, _, rest = line.partition(' ')
+        command, _, args = rest.partition(' ')
+        by_uid = command.upper() == 'UID'
+        if by_uid:
+            command, _, args = args.partition(' ')
+        handler = getattr(self, f'command_{command.lower()}', None)
+        if handler is None or (self.mailbox is None and command.upper() in {'FETCH', 'SEARCH', 'IDLE', 'NOOP'}):
+            self.send(f'{tag} BAD command unknown or not allowed in this state')
+            return
+        handler(tag, args, by_uid)
+
+    def command_capability(self, tag: str, args: str, by_uid: bool) -> None:
+        """CAPABILITY."""
+        self.send(f'* CAPABILITY {CAPABILITIES}')
+        self.send(f'{tag} OK CAPABILITY completed')
+
+    def command_login(self, tag: str, args: str, by_uid: bool) -> None:
+        """LOGIN: принимаются любые учетные данные, кроме пароля из rejected_passwords сервера."""
+        user, _, password = args.partition(' ')
+        if password.strip('"') in self.server.rejected_passwords:
+            self.send(f'{tag} NO [AUTHENTICATIONFAILED] Invalid credentials')
+            return
+        self.user = user.strip('"')
+        self.send(f'{tag} OK [CAPABILITY {CAPABILITIES}] LOGIN completed')
+
+    def command_compress(self, tag: str, args: str, by_uid: bool) -> None:
+        """COMPRESS DEFLATE (RFC 4978): ответ OK отправляется без сжатия, дальше обе стороны сжимают поток."""
+        if args.upper() != 'DEFLATE' or self.compressor is not None:
+            self.send(f'{tag} BAD unsupported compression')
+            return
+        self.send(f'{tag} OK DEFLATE active')
+        self.compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        self.decompressor = zlib.decompressobj(-15)
+
+    def command_enable(self, tag: str, args: str, by_uid: bool) -> None:
+        """ENABLE QRESYNC (RFC 7162)."""
+        if 'QRESYNC' in args.upper():
+            self.qresync_enabled = True
+            self.send('* ENABLED QRESYNC')
+        self.send(f'{tag} OK ENABLE completed')
+
+    def command_select(self, tag: str, args: str, by_uid: bool) -> None:
+        """SELECT INBOX [(CONDSTORE) | (QRESYNC (uidvalidity modseq))]: изменения с modseq сообщаются FETCH."""
+        if self.user is None:
+            self.send(f'{tag} NO not authenticated')
+            return
+        self.mailbox = self.server.get_mailbox(self.user)
+        self.send(f'* {len(self.mailbox.messages)} EXISTS')
+        self.send('* 0 RECENT')
+        self.send(f'* OK [UIDVALIDITY {self.mailbox.uid_validity}] UIDs valid')
+        self.send(f'* OK [UIDNEXT {self.mailbox.uid_next}] Predicted next UID')
+        if self.qresync_enabled or 'CONDSTORE' in args.upper():
+            self.send(f'* OK [HIGHESTMODSEQ {self.mailbox.highest_modseq}] Highest')
+        qresync = SELECT_QRESYNC.search(args) if self.qresync_enabled else None
+        if qresync and int(qresync.group('uid_validity')) == self.mailbox.uid_validity:
+            for number, message in enumerate(self.mailbox.messages, 1):
+                if message.modseq > int(qresync.group('modseq')):
+                    self.send(f'* {number} FETCH (UID {message.uid} FLAGS () MODSEQ ({message.modseq}))')
+        self.send(r'* FLAGS (\Seen \Answered \Flagged \Deleted \Draft)')
+        self.send(f'{tag} OK [READ-WRITE] SELECT completed')
+
+    def command_idle(self, tag: str, args: str, by_uid: bool) -> None:
+        """IDLE: новые письма сообщаются ответом EXISTS до получения DONE."""
+        self.idle_tag = tag
+        self.mailbox.idle_sessions.add(self)  # type: ignore
+        self.send('+ idling')
+
+    def command_noop(self, tag: str, args: str, by_uid: bool) -> None:
+        """NOOP с текущим количеством писем."""
+        self.send(f'* {len(self.mailbox.messages)} EXISTS')  # type: ignore
+        self.send(f'{tag} OK NOOP completed')
+
+    def command_status(self, tag: str, args: str, by_uid: bool) -> None:
+        """STATUS INBOX (UIDNEXT MESSAGES UIDVALIDITY)."""
+        mailbox = self.server.get_mailbox(self.user)  # type: ignore
+        self.send(f'* STATUS INBOX (MESSAGES {len(mailbox.messages)} UIDNEXT {mailbox.uid_next} '
+                  f'UIDVALIDITY {mailbox.uid_validity})')
+        self.send(f'{tag} OK STATUS completed')
+
+    def command_search(self, tag: str, args: str, by_uid: bool) -> None:
+        """SEARCH ALL / UID <набор>."""
+        messages = self.mailbox.messages  # type: ignore
+        uid_match = SEARCH_UID.search(args)
+        if uid_match:
+            uids = parse_sequence_set(uid_match.group('uid_set'), messages[-1].uid if messages else 0)
+            found = [(number, message) for number, message in enumerate(messages, 1) if message.uid in uids]
+        else:
+            found = list(enumerate(messages, 1))
+        results = ' '.join(str(message.uid if by_uid else number) for number, message in found)
+        self.send(f'* SEARCH {results}'.rstrip())
+        self.send(f'{tag} OK SEARCH completed')
+
+    def command_fetch(self, tag: str, args: str, by_uid: bool) -> None:
+        """FETCH / UID FETCH: UID, FLAGS, INTERNALDATE и одна секция BODY (заголовки или письмо целиком)."""
+        sequence_set, _, items = args.partition(' ')
+        messages = self.mailbox.messages  # type: ignore
+        if by_uid:
+            uids = parse_sequence_set(sequence_set, messages[-1].uid if messages else 0)
+            selected = [(number, message) for number, message in enumerate(messages, 1) if message.uid in uids]
+        else:
+            numbers = parse_sequence_set(sequence_set, len(messages))
+            selected = [(number, messages[number - 1]) for number in sorted(numbers) if 0 < number <= len(messages)]
+        items_upper = items.upper()
+        for number, message in selected:
+            attributes = [f'UID {message.uid}']
+            if 'FLAGS' in items_upper:
+                attributes.append('FLAGS ()')
+            if 'INTERNALDATE' in items_upper:
+                internal_date = time.strftime('%d-%b-%Y %H:%M:%S +0000', time.gmtime(message.internal_date))
+                attributes.append(f'INTERNALDATE "{internal_date}"')
+            literal = None
+            header_fields = HEADER_FIELDS.search(items)
+            if header_fields:
+                names = header_fields.group('names').split()
+                headers = BytesHeaderParser().parsebytes(message.raw)
+                literal = b''.join(
+                    f'{name}: {headers[name]}\r\n'.encode() for name in names if headers[name] is not None
+                ) + b'\r\n'
+                attributes.append(f'BODY[HEADER.FIELDS ({" ".join(names)})] {{{len(literal)}}}')
+            elif 'BODY[]' in items_upper or 'BODY.PEEK[]' in items_upper or 'RFC822' in items_upper:
+                literal = message.raw
+                attributes.append(f'BODY[] {{{len(message.raw)}}}')
+            response = f'* {number} FETCH ({" ".join(attributes)}'
+            if literal is None:
+                self.send(response + ')')
+            else:
+                self.send(response)
+                self.write(literal)
+                self.send(')')
+        self.send(f'{tag} OK FETCH completed')
+
+    def command_logout(self, tag: str, args: str, by_uid: bool) -> None:
+        """LOGOUT."""
+        self.send('* BYE Fake IMAP4rev1 server logging out')
+        self.send(f'{tag} OK LOGOUT completed')
+        self.closed = True
+
+
+class FakeIMAPServer:
+    """
+    Поддельный сервер IMAP4rev1 в процессе для нагрузочных замеров (без TLS):
+    LOGIN, ENABLE, COMPRESS, SELECT (с CONDSTORE/QRESYNC), IDLE, FETCH/UID FETCH, SEARCH/UID SEARCH, STATUS,
+    NOOP и LOGOUT.
+    Письма добавляются в ящики вызовом inject или с заданной частотой inject_at_rate.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, rejected_passwords: set[str] | None = None):
+        self.host = host
+        self.port = port
+        self.rejected_passwords = rejected_passwords or set()
+        self.mailboxes: dict[str, FakeMailbox] = {}
+        self.sessions: set[FakeIMAPSession] = set()
+        self._server: asyncio.Server | None = None
+
+    async def start(self, backlog: int = 1024) -> None:
+        """Запуск сервера; при port = 0 порт выбирается системой."""
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port, backlog=backlog)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def close(self) -> None:
+        """Остановка сервера и закрытие сессий."""
+        if self._server is not None:
+            self._server.close()
+            for session in list(self.sessions):
+                session.writer.close()
+            await self._server.wait_closed()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Обработка нового подключения клиента."""
+        session = FakeIMAPSession(self, reader, writer)
+        self.sessions.add(session)
+        try:
+            await session.run()
+        finally:
+            self.sessions.discard(session)
+
+    def get_mailbox(self, user: str) -> FakeMailbox:
+        """Папка INBOX пользователя (создается при первом обращении)."""
+        return self.mailboxes.setdefault(user, FakeMailbox())
+
+    @property
+    def idle_sessions_count(self) -> int:
+        """Количество сессий в состоянии IDLE."""
+        return sum(len(mailbox.idle_sessions) for mailbox in self.mailboxes.values())
+
+    def inject(self, user: str, body_size: int = 2000) -> FakeMessage:
+        """Добавление письма в ящик пользователя и уведомление сессий в IDLE."""
+        mailbox = self.get_mailbox(user)
+        mailbox.highest_modseq += 1
+        message = FakeMessage(uid=mailbox.uid_next, internal_date=time.time(),
+                              raw=build_message(mailbox.uid_next, user, body_size), modseq=mailbox.highest_modseq)
+        mailbox.uid_next += 1
+        mailbox.messages.append(message)
+        for session in mailbox.idle_sessions:
+            session.send(f'* {len(mailbox.messages)} EXISTS')
+        return message
+
+    async def inject_at_rate(self, users: list[str], rate: float, duration: float, body_size: int = 2000) -> int:
+        """Равномерное добавление писем в ящики пользователей по кругу с частотой rate писем/с."""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        injected = 0
+        while loop.time() - started < duration:
+            await asyncio.sleep(max(started + injected / rate - loop.time(), 0))
+            self.inject(users[injected % len(users)], body_size)
+            injected += 1
+        return injected
+
+
+def serve_in_process(port_queue: Any, host: str = '127.0.0.1') -> None:
+    """
+    Запуск сервера в отдельном процессе (цель multiprocessing.Process): выбранный порт передается в port_queue.
+    Так память и CPU сервера не учитываются в замерах клиентов.
+    """
+
+    async def serve() -> None:
+        server = FakeIMAPServer(host=host)
+        await server.start()
+        port_queue.put(server.port)
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
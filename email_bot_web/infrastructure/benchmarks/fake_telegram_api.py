@@ -0,0 +1,128 @@
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass
+from email.parser import BytesParser
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+
+@dataclass(slots=True)
+class FakeTelegramRequest:
+    """Запрос к поддельному Telegram Bot API."""
+
+    method: str
+    chat_id: int | None
+    status: int
+    received_at: float
+    size: int
+
+
+def parse_chat_id(content_type: str, body: bytes) -> int | None:
+    """Получение chat_id из тела запроса multipart/form-data или application/x-www-form-urlencoded."""
+    if content_type.startswith('multipart/form-data'):
+        message = BytesParser().parsebytes(f'Content-Type: {content_type}\r\n\r\n'.encode() + body)
+        for part in message.get_payload():
+            if part.get_param('name', header='content-disposition') == 'chat_id':
+                return int(part.get_payload(decode=True))
+        return None
+    for pair in body.decode().split('&'):
+        key, _, value = pair.partition('=')
+        if key == 'chat_id':
+            return int(value)
+    return None
+
+
+class FakeTelegramRequestHandler(BaseHTTPRequestHandler):
+    """Обработчик запросов методов бота вида /bot<token>/<method>."""
+
+    api: 'FakeTelegramAPI'
+
+    def do_POST(self) -> None:
+        """Запись запроса и ответ успехом, 429 или 5xx в заданных долях."""
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        method = self.path.rsplit('/', 1)[-1]
+        status, payload = self.api.choose_response()
+        self.api.record(FakeTelegramRequest(
+            method=method,
+            chat_id=parse_chat_id(self.headers.get('Content-Type', ''), body),
+            status=status,
+            received_at=time.time(),
+            size=len(body)
+        ))
+        if self.api.latency:
+            time.sleep(self.api.latency)
+        response = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        """Отключение вывода каждого запроса."""
+
+
+class FakeTelegramAPI:
+    """
+    Поддельный Telegram Bot API в отдельном потоке для нагрузочных замеров.
+    Записывает все запросы и отвечает 429 (rate_limit_ratio) или 502 (server_error_ratio) в заданных долях.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, rate_limit_ratio: float = 0.0,
+                 server_error_ratio: float = 0.0, latency: float = 0.0, seed: int | None = None):
+        self.rate_limit_ratio = rate_limit_ratio
+        self.server_error_ratio = server_error_ratio
+        self.latency = latency
+        self.requests: list[FakeTelegramRequest] = []
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        handler = type('BoundFakeTelegramRequestHandler', (FakeTelegramRequestHandler,), {'api': self})
+        self._server = ThreadingHTTPServer((host, port), handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-telegram-api', daemon=True)
+
+    @property
+    def url(self) -> str:
+        """Адрес сервера для настройки TELEGRAM_HOST."""
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def method_url(self, method: str) -> str:
+        """Адрес метода бота."""
+        return f'{self.url}/botfake/{method}'
+
+    def start(self) -> None:
+        """Запуск сервера в фоновом потоке."""
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Остановка сервера."""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def choose_response(self) -> tuple[int, dict[str, Any]]:
+        """Выбор ответа на очередной запрос."""
+        with self._lock:
+            value = self._random.random()
+            message_id = len(self.requests) + 1
+        if value < self.rate_limit_ratio:
+            return HTTPStatus.TOO_MANY_REQUESTS, {
+                'ok': False, 'error_code': 429, 'description': 'Too Many Requests: retry after 1',
+                'parameters': {'retry_after': 1},
+            }
+        if value < self.rate_limit_ratio + self.server_error_ratio:
+            return HTTPStatus.BAD_GATEWAY, {'ok': False, 'error_code': 502, 'description': 'Bad Gateway'}
+        return HTTPStatus.OK, {'ok': True, 'result': {'message_id': message_id}}
+
+    def record(self, request: FakeTelegramRequest) -> None:
+        """Сохранение запроса."""
+        with self._lock:
+            self.requests.append(request)
+
+    @property
+    def delivered(self) -> list[FakeTelegramRequest]:
+        """Успешно принятые запросы."""
+        with self._lock:
+            return [request for request in self.requests if request.status == HTTPStatus.OK]
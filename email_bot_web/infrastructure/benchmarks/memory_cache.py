@@ -0,0 +1,15 @@
+from typing import Any
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.locmem import LocMemCache
+
+
+class TimeoutRecordingCache(LocMemCache):
+    """Кеш в памяти процесса, запоминающий переданное время жизни последней записи каждого ключа."""
+
+    timeouts: dict[str, float | None] = {}
+
+    def set(self, key: str, value: Any, timeout: float | None = DEFAULT_TIMEOUT, version: int | None = None) -> None:
+        """Запись значения с сохранением переданного времени жизни."""
+        super().set(key, value, timeout=timeout, version=version)
+        self.timeouts[key] = timeout
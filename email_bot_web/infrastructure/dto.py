@@ -0,0 +1,115 @@
+from dataclasses import dataclass
+
+from email_service.models import BoxFilter, EmailBox, EmailService
+from user.models import BotUser
+
+
+@dataclass(slots=True)
+class BotUserDTO:
+    """Компактное представление пользователя бота для кеша."""
+
+    telegram_id: int
+    is_active: bool
+
+    @classmethod
+    def from_model(cls, bot_user: BotUser) -> 'BotUserDTO':
+        """Создание DTO из экземпляра модели."""
+        return cls(telegram_id=bot_user.telegram_id, is_active=bot_user.is_active)
+
+
+@dataclass(slots=True)
+class EmailServiceDTO:
+    """Компактное представление почтового сервиса для кеша."""
+
+    id: int
+    title: str
+    slug: str
+    address: str
+    port: int
+    idle_renewal_interval: int
+    command_timeout: int
+    max_connections: int | None
+    connect_rate: float | None
+    use_compression: bool
+    capabilities: list[str] | None
+
+    @classmethod
+    def from_model(cls, email_service: EmailService) -> 'EmailServiceDTO':
+        """Создание DTO из экземпляра модели."""
+        return cls(
+            id=email_service.id,
+            title=email_service.title,
+            slug=email_service.slug,
+            address=email_service.address,
+            port=email_service.port,
+            idle_renewal_interval=email_service.idle_renewal_interval,
+            command_timeout=email_service.command_timeout,
+            max_connections=email_service.max_connections,
+            connect_rate=email_service.connect_rate,
+            use_compression=email_service.use_compression,
+            capabilities=email_service.capabilities
+        )
+
+    def supports(self, capability: str) -> bool:
+        """Поддержка расширения IMAP сервером по определенному ранее ответу CAPABILITY."""
+        return capability in (self.capabilities or ())
+
+
+@dataclass(slots=True)
+class EmailBoxDTO:
+    """Компактное представление почтового ящика для кеша."""
+
+    id: int
+    user_id_id: int
+    email_service_id: int
+    email_username: str
+    email_password: str
+    is_active: bool
+
+    @classmethod
+    def from_model(cls, email_box: EmailBox) -> 'EmailBoxDTO':
+        """Создание DTO из экземпляра модели."""
+        return cls(
+            id=email_box.id,
+            user_id_id=email_box.user_id_id,
+            email_service_id=email_box.email_service_id,
+            email_username=email_box.email_username,
+            email_password=email_box.email_password,
+            is_active=email_box.is_active
+        )
+
+
+@dataclass(slots=True)
+class BoxFilterDTO:
+    """Компактное представление фильтра почтового ящика для кеша."""
+
+    id: int
+    box_id_id: int
+    filter_value: str
+    filter_name: str | None
+
+    @classmethod
+    def from_model(cls, box_filter: BoxFilter) -> 'BoxFilterDTO':
+        """Создание DTO из экземпляра модели."""
+        return cls(
+            id=box_filter.id,
+            box_id_id=box_filter.box_id_id,
+            filter_value=box_filter.filter_value,
+            filter_name=box_filter.filter_name
+        )
+
+
+@dataclass(slots=True)
+class EmailBoxWithFiltersDTO:
+    """Почтовый ящик пользователя вместе с его фильтрами: составное значение кеша для запросов по ящику."""
+
+    box: EmailBoxDTO
+    filters: list[BoxFilterDTO]
+
+    @classmethod
+    def from_model(cls, email_box: EmailBox) -> 'EmailBoxWithFiltersDTO':
+        """Создание DTO из экземпляра модели с предзагруженными фильтрами."""
+        return cls(
+            box=EmailBoxDTO.from_model(email_box),
+            filters=[BoxFilterDTO.from_model(box_filter) for box_filter in email_box.filters.all()]
+        )
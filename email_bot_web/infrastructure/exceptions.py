@@ -26,6 +26,10 @@ class EmailBoxNotFound(Exception):
     """Почтовый ящик не найден."""
 
 
+class BoxProvisioningJobNotFound(Exception):
+    """Задача создания почтового ящика не найдена."""
+
+
 class UserBoxesNotFound(Exception):
     """Почтовые ящики пользователя не найдены."""
 
@@ -48,3 +52,15 @@ class IMAPServerTimeout(Exception):
 
 class IMAPClientIsNotConnected(Exception):
     """Клиент IMAP не подключен."""
+
+
+class IMAPConnectionLost(Exception):
+    """Соединение с сервером IMAP разорвано."""
+
+
+class IMAPCircuitOpen(IMAPServerTimeout):
+    """Подключения к серверу IMAP приостановлены после серии отказов сервера."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(retry_after)
+        self.retry_after = retry_after
@@ -0,0 +1,78 @@
+import asyncio
+from typing import TYPE_CHECKING, Any
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import QuerySet
+
+if TYPE_CHECKING:
+    from psycopg_pool import AsyncConnectionPool
+
+
+class AsyncDatabase:
+    """
+    Нативный асинхронный доступ к PostgreSQL через пул подключений psycopg 3 для горячих запросов на чтение.
+    Запросы строятся ORM и компилируются в SQL, поэтому выполняются без перехода в поток sync_to_async.
+    """
+
+    def __init__(self):
+        self._pool: AsyncConnectionPool | None = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        """Включен ли асинхронный пул (ASYNC_DB_POOL_ENABLED)."""
+        return settings.ASYNC_DB_POOL_ENABLED
+
+    @staticmethod
+    def _get_conninfo() -> str:
+        """Строка подключения из настроек базы данных default."""
+        from psycopg.conninfo import make_conninfo
+
+        database = settings.DATABASES['default']
+        return make_conninfo(
+            dbname=database['NAME'],
+            user=database['USER'],
+            password=database['PASSWORD'],
+            host=database['HOST'],
+            port=database['PORT']
+        )
+
+    async def open(self) -> 'AsyncConnectionPool':
+        """Асинхронное открытие пула и ожидание минимального числа подключений; возвращает открытый пул."""
+        from psycopg_pool import AsyncConnectionPool
+
+        async with self._lock:
+            if self._pool is not None:
+                return self._pool
+            pool = AsyncConnectionPool(
+                conninfo=self._get_conninfo(),
+                min_size=settings.ASYNC_DB_POOL_MIN_SIZE,
+                max_size=settings.ASYNC_DB_POOL_MAX_SIZE,
+                timeout=settings.ASYNC_DB_POOL_TIMEOUT,
+                open=False
+            )
+            await pool.open(wait=True, timeout=settings.ASYNC_DB_POOL_TIMEOUT)
+            self._pool = pool
+            return pool
+
+    async def close(self) -> None:
+        """Асинхронное закрытие пула и всех его подключений."""
+        async with self._lock:
+            if self._pool is not None:
+                await self._pool.close()
+                self._pool = None
+
+    async def fetch_all(self, queryset: QuerySet) -> list[tuple[Any, ...]]:
+        """
+        Асинхронное выполнение запроса ORM на подключении из пула.
+        Возвращает строки результата (для values_list - в порядке перечисленных полей).
+        """
+        pool = self._pool or await self.open()
+        sql, params = queryset.query.get_compiler(connection=connections[queryset.db]).as_sql()
+        async with pool.connection() as connection:
+            cursor = await connection.execute(sql, params)
+            return await cursor.fetchall()
+
+
+async_db = AsyncDatabase()
@@ -0,0 +1,73 @@
+from dataclasses import dataclass
+from typing import Any
+
+import msgpack
+from django.apps import apps
+from django.core.exceptions import ObjectDoesNotExist
+from django.utils.module_loading import import_string
+from django_redis.serializers.base import BaseSerializer
+from infrastructure.dto import (
+    BotUserDTO,
+    BoxFilterDTO,
+    EmailBoxDTO,
+    EmailBoxWithFiltersDTO,
+    EmailServiceDTO,
+)
+
+
+@dataclass(frozen=True, slots=True)
+class MissingObject:
+    """Запись негативного кеша: объект по ключу отсутствует в базе данных."""
+
+    model_label: str
+
+    @classmethod
+    def from_error(cls, error: ObjectDoesNotExist) -> 'MissingObject':
+        """Создание записи по исключению DoesNotExist конкретной модели."""
+        error_class = type(error)
+        model_path = error_class.__qualname__.rsplit('.', 1)[0]
+        model = import_string(f'{error_class.__module__}.{model_path}')
+        return cls(model_label=model._meta.label)
+
+    @property
+    def error_class(self) -> type[ObjectDoesNotExist]:
+        """Исключение DoesNotExist модели, для которой была сделана запись."""
+        return apps.get_model(self.model_label).DoesNotExist
+
+
+# Порядок определяет коды msgpack ext-типов: при его изменении нужно увеличить CACHE_SCHEMA_VERSION.
+CACHE_VALUE_TYPES: tuple[type, ...] = (
+    BotUserDTO,
+    EmailServiceDTO,
+    EmailBoxDTO,
+    BoxFilterDTO,
+    MissingObject,
+    EmailBoxWithFiltersDTO,
+)
+EXT_CODES = {value_type: code for code, value_type in enumerate(CACHE_VALUE_TYPES, start=1)}
+
+
+def encode_value(value: Any) -> msgpack.ExtType:
+    """Упаковка DTO в msgpack ext-тип со списком значений полей (вложенные DTO упаковываются так же)."""
+    code = EXT_CODES.get(type(value))
+    if code is None:
+        raise TypeError(f'Object of type {type(value).__name__} can not be cached')
+    fields = [getattr(value, field) for field in value.__slots__]
+    return msgpack.ExtType(code, msgpack.packb(fields, default=encode_value))
+
+
+def decode_value(code: int, data: bytes) -> Any:
+    """Распаковка msgpack ext-типа обратно в DTO."""
+    return CACHE_VALUE_TYPES[code - 1](*msgpack.unpackb(data, ext_hook=decode_value))
+
+
+class MsgpackSerializer(BaseSerializer):
+    """Сериализатор django-redis, хранящий DTO репозиториев в msgpack вместо pickle."""
+
+    def dumps(self, value: Any) -> bytes:
+        """Сериализация значения для записи в Redis."""
+        return msgpack.packb(value, default=encode_value)
+
+    def loads(self, value: bytes) -> Any:
+        """Десериализация значения, прочитанного из Redis."""
+        return msgpack.unpackb(value, ext_hook=decode_value)
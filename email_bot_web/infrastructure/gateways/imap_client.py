@@ -1,78 +1,169 @@
 import asyncio
+import functools
 import json
 import logging
+import random
 import re
+import socket
 from asyncio import wait_for
 from collections import namedtuple
+from datetime import datetime
 from email.header import decode_header
 from email.message import Message
 from email.parser import BytesHeaderParser, BytesParser
 from enum import Enum
-from functools import wraps
-from typing import Any, Callable, Collection
+from typing import Collection
 
 import aioimaplib
 from django.conf import settings
+from email_service.repositories import EmailDomainRepository
 from email_service.tasks import email_html_to_image, send_image_to_telegram_task
+from infrastructure.dto import EmailServiceDTO
 from infrastructure.exceptions import (
     EmailCredsInvalid,
     IMAPClientIsNotConnected,
+    IMAPConnectionLost,
     IMAPServerTimeout,
 )
+from infrastructure.gateways.imap_compression import DeflateTransport, start_deflate
+from infrastructure.gateways.imap_control import imap_control
+from infrastructure.gateways.imap_fleet import BoxConnectionStates, imap_fleet
+from infrastructure.gateways.imap_hosts import HostIMAP4, imap_hosts
+from infrastructure.gateways.imap_polling import poll_scheduler
 from infrastructure.gateways.redis_client import redis_client
 from infrastructure.utils.email_decoder import EmailDecoder
+from infrastructure.utils.metrics import (
+    EmailOutcomes,
+    PipelineStages,
+    record_outcome,
+    track_stage,
+)
+from infrastructure.utils.tracing import (
+    TRACEPARENT_HEADER,
+    get_traceparent,
+    message_trace_id,
+    start_span,
+)
 
 ID_HEADER_SET = {'Content-Type', 'From', 'To', 'Cc', 'Bcc', 'Date', 'Subject',
                  'Message-ID', 'In-Reply-To', 'References'}
 FETCH_MESSAGE_DATA_UID = re.compile(rb'.*UID (?P<uid>\d+).*')
+FETCH_MESSAGE_INTERNALDATE = re.compile(rb'INTERNALDATE "(?P<date>[^"]+)"')
+SELECT_UIDVALIDITY = re.compile(rb'\[UIDVALIDITY (?P<value>\d+)\]')
+SELECT_UIDNEXT = re.compile(rb'\[UIDNEXT (?P<value>\d+)\]')
+SELECT_HIGHESTMODSEQ = re.compile(rb'\[HIGHESTMODSEQ (?P<value>\d+)\]')
 MessageAttributes = namedtuple('MessageAttributes', 'uid flags sequence_number')
+# Расширения IMAP, которые сохраняются в профиле почтового сервиса.
+PROFILE_CAPABILITIES = frozenset({'IDLE', 'ENABLE', 'CONDSTORE', 'QRESYNC', 'COMPRESS=DEFLATE', 'NOTIFY'})
+# Ошибки соединения, после которых клиент переподключается к серверу, а не завершается.
+RECONNECT_ERRORS = (
+    IMAPServerTimeout,
+    IMAPConnectionLost,
+    OSError,
+    asyncio.exceptions.TimeoutError,
+    aioimaplib.AioImapException,
+)
+TCP_KEEPALIVE_OPTIONS = (
+    ('TCP_KEEPIDLE', 'IMAP_TCP_KEEPALIVE_IDLE'),
+    ('TCP_KEEPINTVL', 'IMAP_TCP_KEEPALIVE_INTERVAL'),
+    ('TCP_KEEPCNT', 'IMAP_TCP_KEEPALIVE_COUNT'),
+)
 
 logger = logging.getLogger('infrastructure')
 
 
-def retry_async(max_retries: int = 5, delay_on_failure: int = 30) -> Callable:
-    """Декоратор для асинхронных функций, который пытается повторно выполнить функцию при возникновении исключения."""
-
-    def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
-        @wraps(func)
-        async def wrapper(*args: Any, **kwargs: Any) -> Any:
-            retries = 0
-            while retries < max_retries:
-                try:
-                    return await func(*args, **kwargs)
-                except Exception as e:
-                    retries += 1
-                    logger.error(f'Exception {type(e).__name__} occurred. Retry {retries}/{max_retries}.')
-                    if retries < max_retries:
-                        await asyncio.sleep(delay_on_failure)
-            logger.error(f'Max retries reached for {func.__name__}. Exiting...')
-            raise Exception(f'Max retries reached for {func.__name__}.')
-
-        return wrapper
-
-    return decorator
+def reconnect_delay(attempt: int, retry_after: float = 0.0) -> float:
+    """
+    Задержка переподключения с полным случайным разбросом (full jitter): равномерно от 0 до
+    IMAP_RECONNECT_BASE_DELAY * 2^attempt, но не больше IMAP_RECONNECT_MAX_DELAY, чтобы ящики,
+    отключившиеся одновременно, не переподключались одной волной. retry_after - время до пробного
+    подключения к серверу, подключения к которому приостановлены автоматом защиты.
+    """
+    max_delay = min(settings.IMAP_RECONNECT_MAX_DELAY, settings.IMAP_RECONNECT_BASE_DELAY * 2 ** min(attempt, 32))
+    return retry_after + random.uniform(0, max_delay)
 
 
 class IMAPConnectionManager:
-    """Управление соединением и аутентификацией IMAP клиентов."""
+    """
+    Управление соединением и аутентификацией IMAP клиентов.
+    Порт, таймаут команд и лимиты подключений к серверу берутся из профиля почтового сервиса.
+    """
 
-    def __init__(self, host: str, user: str, password: str):
-        self.host = host
+    __slots__ = ('service', 'user', 'password', 'client', 'imap_host', 'holds_connection', 'connection_lost')
+
+    def __init__(self, service: EmailServiceDTO, user: str, password: str):
+        self.service = service
         self.user = user
         self.password = password
-        self.client = None
-
-    async def check_connection(self) -> bool:
-        """Проверка соединения с IMAP сервером."""
+        self.client: HostIMAP4 | aioimaplib.IMAP4 | None = None
+        self.imap_host = imap_hosts.get(service)
+        self.holds_connection = False
+        self.connection_lost = False
+
+    @property
+    def host(self) -> str:
+        """Адрес сервера IMAP."""
+        return self.service.address
+
+    async def open_client(self) -> HostIMAP4:
+        """
+        Новое подключение к серверу в темпе connect_rate из профиля сервиса
+        (с общим для сервера контекстом TLS и кешем DNS).
+        """
+        await self.imap_host.wait_connect_turn()
+        return HostIMAP4(self.imap_host, port=self.service.port, timeout=self.service.command_timeout)
+
+    async def acquire_connection(self) -> None:
+        """Занятие места под сессию с учетом max_connections сервера (один раз на сессию клиента)."""
+        if not self.holds_connection:
+            await self.imap_host.acquire_connection()
+            self.holds_connection = True
+
+    def release_connection(self) -> None:
+        """Освобождение места сессии клиента."""
+        if self.holds_connection:
+            self.holds_connection = False
+            self.imap_host.release_connection()
+
+    async def detect_capabilities(self, client: aioimaplib.IMAP4) -> None:
+        """
+        Определение расширений IMAP сервера, если они еще не сохранены в профиле сервиса.
+        Команда CAPABILITY отправляется после LOGIN, так как часть расширений объявляется только после аутентификации.
+        """
+        if self.service.capabilities is not None:
+            return
+        try:
+            await wait_for(client.protocol.capability(), timeout=self.service.command_timeout)
+        except (asyncio.exceptions.TimeoutError, aioimaplib.AioImapException) as error:
+            logger.warning(f'CAPABILITY failed on the imap server {self.host}: {error!r}')
+            return
+        capabilities = sorted(PROFILE_CAPABILITIES.intersection(client.protocol.capabilities))
+        self.service.capabilities = capabilities
+        logger.info(f'The imap server {self.host} supports {capabilities}.')
+        await EmailDomainRepository.update_capabilities(self.service.id, capabilities)
+
+    async def check_connection(self, keep_session: bool = False) -> bool:
+        """
+        Проверка соединения с IMAP сервером.
+        При keep_session успешная сессия не закрывается, а остается в self.client для передачи клиенту ящика.
+        """
+        self.imap_host.check_circuit()
         try:
-            test_client = aioimaplib.IMAP4_SSL(host=self.host, timeout=30)
+            test_client = await self.open_client()
             await test_client.wait_hello_from_server()
             response = await test_client.login(self.user, self.password)
-        except asyncio.exceptions.TimeoutError:
-            logger.error(f'The imap server {self.host} connection was timed out.')
+        except (asyncio.exceptions.TimeoutError, OSError) as error:
+            logger.error(f'The imap server {self.host} connection failed: {error!r}')
+            self.imap_host.record_failure()
             raise IMAPServerTimeout
+        self.imap_host.record_success()
         logger.info(f'The imap server {self.host} responded.')
         if response.result == IMAPStatuses.OK.value:
+            await self.detect_capabilities(test_client)
+            if keep_session:
+                logger.info(f'Test connection successfully worked for {self.user}. Keeping the session.')
+                self.client = test_client
+                return True
             logger.info(f'Test connection successfully worked for {self.user}. Logging out.')
             await test_client.logout()
             return True
@@ -81,23 +172,135 @@ class IMAPConnectionManager:
             await test_client.logout()
             return False
 
-    async def connect(self) -> None:
-        """Соединение и аутентификация с IMAP сервером."""
+    async def connect(self, sync_state: tuple[int, int] | None = None) -> tuple[aioimaplib.Response, bool]:
+        """
+        Соединение и аутентификация с IMAP сервером (принятая проверенная сессия только выбирает INBOX).
+        sync_state - UIDVALIDITY и MODSEQ последней синхронизации; возвращается ответ на SELECT INBOX
+        и признак того, что SELECT выполнен с QRESYNC.
+        """
+        if not self.has_authenticated_session():
+            self.imap_host.check_circuit()
+        await self.acquire_connection()
+        if self.has_authenticated_session():
+            logger.info(f'User {self.user} reuses the verified session.')
+            self.watch_connection()
+            await self.start_compression()
+            return await self.select_inbox(sync_state)
+        if not self.client or self.client.get_state() in (aioimaplib.AUTH, aioimaplib.SELECTED, aioimaplib.LOGOUT):
+            # Нет клиента или принятая сессия уже закрыта сервером - новое подключение
+            self.client = await self.open_client()
+        try:
+            await self.client.wait_hello_from_server()
+            self.watch_connection()
+            response = await self.client.login(self.user, self.password)
+        except (asyncio.exceptions.TimeoutError, OSError) as error:
+            logger.error(f'The imap server {self.host} connection failed: {error!r}')
+            self.imap_host.record_failure()
+            raise IMAPServerTimeout
+        self.imap_host.record_success()
+        if response.result == IMAPStatuses.OK.value:
+            logger.info(f'User {self.user} successfully logged in.')
+            await self.detect_capabilities(self.client)
+            await self.start_compression()
+            return await self.select_inbox(sync_state)
+        logger.error(f'Login credentials are wrong for {self.user}.')
+        await self.client.logout()
+        raise EmailCredsInvalid
+
+    async def start_compression(self) -> None:
+        """
+        Включение сжатия трафика COMPRESS=DEFLATE (RFC 4978), если оно разрешено в профиле сервиса
+        и поддерживается сервером. Экономия видна по метрике imap_compressed_bytes (payload/wire).
+        """
         if not self.client:
-            self.client = aioimaplib.IMAP4_SSL(host=self.host, timeout=30)
+            raise IMAPClientIsNotConnected
+        protocol = self.client.protocol
+        if not (self.service.use_compression and self.service.supports('COMPRESS=DEFLATE')) \
+                or isinstance(protocol.transport, DeflateTransport):
+            return
+        command = aioimaplib.Command('COMPRESS', protocol.new_tag(), 'DEFLATE', loop=protocol.loop)
         try:
-            await self.client.wait_hello_from_server()  # type: ignore
-            response = await self.client.login(self.user, self.password)  # type: ignore
+            response = await wait_for(protocol.execute(command), timeout=self.service.command_timeout)
         except asyncio.exceptions.TimeoutError:
-            logger.error(f'The imap server {self.host} connection was timed out.')
+            logger.error(f'COMPRESS timed out for {self.user}. IMAP server - {self.host}')
             raise IMAPServerTimeout
         if response.result == IMAPStatuses.OK.value:
-            logger.info(f'User {self.user} successfully logged in.')
-            await self.client.select('INBOX')  # type: ignore
+            start_deflate(protocol, self.host)
         else:
-            logger.error(f'Login credentials are wrong for {self.user}.')
-            await self.client.logout()  # type: ignore
-            raise EmailCredsInvalid
+            logger.warning(f'The imap server {self.host} refused COMPRESS DEFLATE: {response}')
+
+    async def select_inbox(self, sync_state: tuple[int, int] | None = None) -> tuple[aioimaplib.Response, bool]:
+        """
+        Выбор INBOX с учетом расширений сервера (RFC 7162).
+        С QRESYNC и известным состоянием сервер сразу в ответе на SELECT перечисляет письма, измененные
+        после сохраненного MODSEQ; с CONDSTORE ответ содержит HIGHESTMODSEQ для сравнения с сохраненным.
+        """
+        if not self.client:
+            raise IMAPClientIsNotConnected
+        client = self.client
+        mailbox = 'INBOX'
+        try:
+            if self.service.supports('QRESYNC'):
+                response = await wait_for(client.protocol.simple_command('ENABLE', 'QRESYNC'),
+                                          timeout=self.service.command_timeout)
+                if response.result == IMAPStatuses.OK.value and sync_state:
+                    mailbox = 'INBOX (QRESYNC (%d %d))' % sync_state
+            elif self.service.supports('CONDSTORE'):
+                mailbox = 'INBOX (CONDSTORE)'
+            response = await client.select(mailbox)
+            return response, mailbox.startswith('INBOX (QRESYNC')
+        except asyncio.exceptions.TimeoutError:
+            logger.error(f'Selecting INBOX timed out for {self.user}. IMAP server - {self.host}')
+            raise IMAPServerTimeout
+
+    def has_authenticated_session(self) -> bool:
+        """Проверка наличия открытой аутентифицированной сессии (например, принятой после проверки ящика)."""
+        protocol = getattr(self.client, 'protocol', None)
+        if protocol is None or protocol.state != aioimaplib.AUTH:
+            return False
+        transport = protocol.transport
+        return transport is not None and not transport.is_closing()
+
+    def watch_connection(self) -> None:
+        """
+        Включение TCP keepalive на сокете сессии и подписка на разрыв соединения.
+        Ядро проверяет молчащее соединение, поэтому оборванная сессия IDLE обнаруживается
+        за IMAP_TCP_KEEPALIVE_IDLE + IMAP_TCP_KEEPALIVE_INTERVAL * IMAP_TCP_KEEPALIVE_COUNT секунд без команд IMAP.
+        """
+        if not self.client:
+            raise IMAPClientIsNotConnected
+        protocol = self.client.protocol
+        self.connection_lost = False
+        protocol.conn_lost_cb = functools.partial(self.on_connection_lost, self.client)
+        sock = protocol.transport.get_extra_info('socket') if protocol.transport else None
+        if sock is None:
+            return
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        for option_name, setting_name in TCP_KEEPALIVE_OPTIONS:
+            option = getattr(socket, option_name, None)
+            if option is not None:
+                sock.setsockopt(socket.IPPROTO_TCP, option, getattr(settings, setting_name))
+
+    def on_connection_lost(self, client: aioimaplib.IMAP4, error: Exception | None) -> None:
+        """Отметка о разрыве соединения и прерывание ожидания уведомлений в IDLE."""
+        if client is not self.client or client.get_state() == aioimaplib.LOGOUT:
+            return
+        self.connection_lost = True
+        logger.warning(f'Connection to the imap server {self.host} lost for {self.user}: {error!r}')
+        client.protocol.idle_queue.put_nowait(aioimaplib.STOP_WAIT_SERVER_PUSH)
+
+    def check_alive(self) -> None:
+        """Проверка, что соединение с сервером не разорвано."""
+        if self.connection_lost:
+            raise IMAPConnectionLost
+
+    def drop_session(self) -> None:
+        """Закрытие оборванной сессии без LOGOUT и освобождение ее места перед переподключением."""
+        transport = getattr(getattr(self.client, 'protocol', None), 'transport', None)
+        self.client = None
+        if transport is not None and not transport.is_closing():
+            transport.abort()
+        self.release_connection()
 
     def is_connected(self) -> bool:
         """Проверка наличия соединения с IMAP сервером."""
@@ -114,6 +317,8 @@ class IMAPConnectionManager:
         except asyncio.exceptions.TimeoutError:
             logger.error(f'Logout failed for user {self.user}. IMAP server - {self.host}')
             raise IMAPServerTimeout
+        finally:
+            self.release_connection()
 
 
 class IMAPStatuses(Enum):
@@ -128,6 +333,8 @@ class IMAPStatuses(Enum):
 class RedisOperations:
     """Управление операциями с Redis для IMAP клиента."""
 
+    __slots__ = ('telegram_id', 'box_id')
+
     def __init__(self, telegram_id: int, box_id: int):
         self.telegram_id = telegram_id
         self.box_id = box_id
@@ -156,6 +363,30 @@ class RedisOperations:
         )
         await redis_client.delete(key)
 
+    async def set_checkpoint(self, checkpoint: dict[str, int | None]) -> None:
+        """Сохранение состояния синхронизации ящика (UID последнего обработанного письма, UIDVALIDITY, MODSEQ)."""
+        key = settings.IMAP_CLIENT_CHECKPOINT_KEY_FORMAT.format(
+            telegram_id=self.telegram_id,
+            box_id=self.box_id
+        )
+        await redis_client.set(key, checkpoint, timeout=None)
+
+    async def get_checkpoint(self) -> dict[str, int | None] | int | None:
+        """Получение состояния синхронизации ящика, сохраненного прежним клиентом или владельцем ящика."""
+        key = settings.IMAP_CLIENT_CHECKPOINT_KEY_FORMAT.format(
+            telegram_id=self.telegram_id,
+            box_id=self.box_id
+        )
+        return await redis_client.get(key)
+
+    async def remove_checkpoint(self) -> None:
+        """Удаление состояния синхронизации ящика."""
+        key = settings.IMAP_CLIENT_CHECKPOINT_KEY_FORMAT.format(
+            telegram_id=self.telegram_id,
+            box_id=self.box_id
+        )
+        await redis_client.delete(key)
+
     async def prepend_email_to_list(self, decoded_email_params) -> None:
         """Присоеднение декодированных сообщений к списку с ключом telegram_id."""
         key = f'telegram_id_{self.telegram_id}_emails'
@@ -164,13 +395,25 @@ class RedisOperations:
 
 
 class IMAPClient:
-    """Класс для работы с почтовыми сервисами по протоколу IMAP."""
+    """
+    Класс для работы с почтовыми сервисами по протоколу IMAP.
+    Состояние ящика хранится в __slots__, так как процесс держит тысячи клиентов одновременно.
+    """
+
+    __slots__ = ('connection_manager', 'redis_ops', 'whitelist', 'persistent_max_uid', 'uid_validity',
+                 'highest_modseq', 'released', 'polling', 'poll_interval')
 
-    def __init__(self, host: str, user: str, password: str, telegram_id: int, box_id: int, whitelist: set):
-        self.connection_manager = IMAPConnectionManager(host=host, user=user, password=password)
+    def __init__(self, service: EmailServiceDTO, user: str, password: str, telegram_id: int, box_id: int,
+                 whitelist: set):
+        self.connection_manager = IMAPConnectionManager(service=service, user=user, password=password)
         self.redis_ops = RedisOperations(telegram_id=telegram_id, box_id=box_id)
-        self.whitelist = set(whitelist) if whitelist else None
-        self.persistent_max_uid = 1
+        self.whitelist = frozenset(whitelist) if whitelist else None
+        self.persistent_max_uid: int | None = None
+        self.uid_validity: int | None = None
+        self.highest_modseq: int | None = None
+        self.released = False
+        self.polling = False
+        self.poll_interval = 0.0
 
     def extract_email(self, encoded_str: str) -> str | None:
         """Извлечение адреса электронной почты из строки."""
@@ -193,39 +436,182 @@ class IMAPClient:
             return int(match_result.group('uid'))
         return 0
 
+    @staticmethod
+    def parse_internal_date(fetch_line: bytes) -> float | None:
+        """Получение INTERNALDATE (время получения письма сервером) из ответа FETCH в виде unix time."""
+        match_result = FETCH_MESSAGE_INTERNALDATE.search(fetch_line)
+        if not match_result:
+            return None
+        try:
+            return datetime.strptime(match_result.group('date').decode().strip(), '%d-%b-%Y %H:%M:%S %z').timestamp()
+        except ValueError:
+            return None
+
+    def checkpoint(self) -> dict[str, int | None]:
+        """Состояние синхронизации ящика для продолжения после переподключения или передачи другому узлу."""
+        return {'uid': self.persistent_max_uid, 'uid_validity': self.uid_validity, 'modseq': self.highest_modseq}
+
+    def restore_checkpoint(self, checkpoint: dict[str, int | None] | int | None) -> None:
+        """Восстановление состояния синхронизации (целое число - UID, сохраненный прежней версией клиента)."""
+        if isinstance(checkpoint, dict):
+            self.persistent_max_uid = checkpoint['uid']
+            self.uid_validity = checkpoint['uid_validity']
+            self.highest_modseq = checkpoint['modseq']
+        elif checkpoint:
+            self.persistent_max_uid = checkpoint
+
+    def qresync_state(self) -> tuple[int, int] | None:
+        """UIDVALIDITY и MODSEQ последней синхронизации для SELECT с QRESYNC, если они известны."""
+        if self.persistent_max_uid is None or self.uid_validity is None or self.highest_modseq is None:
+            return None
+        return self.uid_validity, self.highest_modseq
+
+    @staticmethod
+    def parse_response_code(lines: list[bytes], pattern: re.Pattern) -> int | None:
+        """Числовое значение кода ответа сервера (например, [UIDNEXT 42]) из строк ответа."""
+        for line in lines:
+            match_result = pattern.search(line)
+            if match_result:
+                return int(match_result.group('value'))
+        return None
+
+    async def search_uids(self, uid_set: str) -> list[int]:
+        """UID писем из набора (UID SEARCH UID n:*) по возрастанию."""
+        if not self.connection_manager.client:
+            raise IMAPClientIsNotConnected
+        response = await self.connection_manager.client.uid_search(f'UID {uid_set}', charset=None)
+        if response.result != IMAPStatuses.OK.value:
+            logger.error(f'UID SEARCH failed for {self.connection_manager.user}: {response}')
+            return []
+        return sorted(int(uid) for uid in response.lines[0].split() if uid.isdigit())
+
+    async def search_new_uids(self) -> list[int]:
+        """UID писем после последнего обработанного (в ответ на n:* сервер возвращает и последнее письмо)."""
+        last_uid = self.persistent_max_uid
+        if last_uid is None:
+            return []
+        return [uid for uid in await self.search_uids(f'{last_uid + 1}:*') if uid > last_uid]
+
+    async def find_missed_uids(self, select_response: aioimaplib.Response, qresync_used: bool) -> list[int]:
+        """
+        UID писем, пришедших, пока ящик не слушался этим клиентом.
+        С QRESYNC они перечислены в ответе на SELECT, с CONDSTORE неизменный HIGHESTMODSEQ означает
+        отсутствие изменений, иначе (или если UIDNEXT сдвинулся) выполняется UID SEARCH UID n:*.
+        Без сохраненного состояния или при смене UIDVALIDITY отсчет начинается с текущего UIDNEXT.
+        """
+        lines = select_response.lines
+        uid_validity = self.parse_response_code(lines, SELECT_UIDVALIDITY)
+        uid_next = self.parse_response_code(lines, SELECT_UIDNEXT)
+        highest_modseq = self.parse_response_code(lines, SELECT_HIGHESTMODSEQ)
+        known_uid_validity, known_modseq = self.uid_validity, self.highest_modseq
+        self.uid_validity, self.highest_modseq = uid_validity, highest_modseq
+        if self.persistent_max_uid is None or (known_uid_validity is not None and uid_validity != known_uid_validity):
+            if self.persistent_max_uid is not None:
+                logger.warning(f'UIDVALIDITY of INBOX changed for {self.connection_manager.user}. Skipping resync.')
+            last_uids = [] if uid_next else await self.search_uids('*')
+            self.persistent_max_uid = uid_next - 1 if uid_next else max(last_uids, default=0)
+            return []
+        if qresync_used:
+            changed_uids = {
+                int(match_result.group('uid')) for line in lines
+                if b'FETCH' in line and (match_result := FETCH_MESSAGE_DATA_UID.match(line))
+            }
+            return sorted(uid for uid in changed_uids if uid > self.persistent_max_uid)
+        if highest_modseq is not None and highest_modseq == known_modseq:
+            return []
+        if uid_next is not None and uid_next - 1 <= self.persistent_max_uid:
+            return []
+        return await self.search_new_uids()
+
+    async def resync(self, select_response: aioimaplib.Response, qresync_used: bool) -> None:
+        """
+        Обработка писем, пропущенных за время переподключения или передачи ящика, и сохранение
+        состояния синхронизации. Приостановленный ящик только сдвигает отсчет, а после долгого перерыва
+        обрабатываются не более IMAP_RESYNC_MAX_MESSAGES последних писем.
+        """
+        box_id = self.redis_ops.box_id
+        try:
+            missed_uids = await self.find_missed_uids(select_response, qresync_used)
+        except asyncio.exceptions.TimeoutError:
+            raise IMAPServerTimeout
+        if missed_uids and await self.redis_ops.get_status() == IMAPStatuses.ACTIVE.value:
+            if len(missed_uids) > settings.IMAP_RESYNC_MAX_MESSAGES:
+                logger.warning(f'Skipping {len(missed_uids) - settings.IMAP_RESYNC_MAX_MESSAGES} missed emails '
+                               f'for {self.connection_manager.user}.')
+                missed_uids = missed_uids[-settings.IMAP_RESYNC_MAX_MESSAGES:]
+            logger.info(f'Resync of {self.connection_manager.user}: {len(missed_uids)} missed emails.')
+            imap_fleet.set_state(box_id, BoxConnectionStates.PROCESSING)
+            for uid in missed_uids:
+                self.persistent_max_uid = await self.fetch_messages_headers(uid)
+                imap_fleet.record_message(box_id, uid)
+        elif missed_uids:
+            self.persistent_max_uid = missed_uids[-1]
+        await self.redis_ops.set_checkpoint(self.checkpoint())
+
+    async def process_new_messages(self, uids: list[int]) -> None:
+        """Обработка новых писем по возрастанию UID с сохранением состояния синхронизации после каждого письма."""
+        imap_fleet.set_state(self.redis_ops.box_id, BoxConnectionStates.PROCESSING)
+        for uid in uids:
+            self.persistent_max_uid = await self.fetch_messages_headers(uid)
+            imap_fleet.record_message(self.redis_ops.box_id, uid)
+            await self.redis_ops.set_checkpoint(self.checkpoint())
+            logger.info(f'Processed email with UID: {uid}')
+
     async def fetch_messages_headers(self, uid: int) -> int:
-        """Обработка сообщения с указанным UID и отправка письма пользователю."""
+        """Обработка сообщения с указанным UID и отправка письма пользователю в трассе письма (box_id + UID)."""
+        box_id = self.redis_ops.box_id
+        with start_span('email.process', trace_id=message_trace_id(box_id, uid), box_id=box_id, uid=uid,
+                        telegram_id=self.redis_ops.telegram_id):
+            await self.process_message(uid)
+        return uid
+
+    async def process_message(self, uid: int) -> None:
+        """Получение заголовков письма, проверка белого списка, декодирование и постановка задач отправки."""
         if not self.connection_manager.client:
             raise IMAPClientIsNotConnected
         try:
-            response = await self.connection_manager.client.uid('fetch', str(uid),
-                                                                '(UID FLAGS BODY.PEEK[HEADER.FIELDS (%s)])' % ' '.join(
-                                                                    ID_HEADER_SET))
+            with track_stage(PipelineStages.IMAP_FETCH_HEADERS):
+                response = await self.connection_manager.client.uid(
+                    'fetch', str(uid),
+                    '(UID FLAGS INTERNALDATE BODY.PEEK[HEADER.FIELDS (%s)])' % ' '.join(ID_HEADER_SET)
+                )
         except asyncio.exceptions.TimeoutError:
             logger.error(
                 f'Fetching headers failed for user {self.connection_manager.user}. IMAP server - {self.connection_manager.host}')
             raise IMAPServerTimeout
         if response.result == IMAPStatuses.OK.value:
+            received_at = self.parse_internal_date(response.lines[0])
             headers_line = response.lines[1]
             message_headers = BytesHeaderParser().parsebytes(headers_line)
 
-            if not self.whitelist or (
-                    self.whitelist and self.extract_email(message_headers.get('From')) in self.whitelist):
-                body = await self.fetch_message_body(uid)
-                raw_email_params = {
-                    'Subject': message_headers.get('Subject'),
-                    'From': message_headers.get('From'),
-                    'To': message_headers.get('To'),
-                    'Date': message_headers.get('Date'),
-                    'Body': body.as_string()
-                }
-                decoded_email_params = EmailDecoder.decode_email(raw_email_params)
-                html_content = EmailDecoder.email_to_html(decoded_email_params)
-                email_html_to_image.apply_async(args=[html_content],
-                                                link=send_image_to_telegram_task.s(self.redis_ops.telegram_id))
+            with track_stage(PipelineStages.FILTER):
+                is_allowed = not self.whitelist or self.extract_email(message_headers.get('From')) in self.whitelist
+            if is_allowed:
+                with track_stage(PipelineStages.IMAP_FETCH_BODY):
+                    body = await self.fetch_message_body(uid)
+                with track_stage(PipelineStages.DECODE):
+                    raw_email_params = {
+                        'Subject': message_headers.get('Subject'),
+                        'From': message_headers.get('From'),
+                        'To': message_headers.get('To'),
+                        'Date': message_headers.get('Date'),
+                        'Body': body.as_string()
+                    }
+                    decoded_email_params = EmailDecoder.decode_email(raw_email_params)
+                    html_content = EmailDecoder.email_to_html(decoded_email_params)
+                trace_headers = {TRACEPARENT_HEADER: get_traceparent()}
+                email_html_to_image.apply_async(
+                    args=[html_content],
+                    headers=trace_headers,
+                    link=send_image_to_telegram_task.s(self.redis_ops.telegram_id, received_at).set(
+                        headers=trace_headers)
+                )
+                logger.info(f'Email with UID {uid} queued for rendering.')
+            else:
+                record_outcome(EmailOutcomes.FILTERED)
+                logger.info(f'Email with UID {uid} filtered out by whitelist.')
         else:
             logger.error('error %s' % response)
-        return uid
 
     async def fetch_message_body(self, uid: int) -> Message:
         """Получение тела письма."""
@@ -254,45 +640,200 @@ class IMAPClient:
                 logger.info('unprocessed push message : %r' % msg)
         return ''
 
+    async def wait_idle_push(self) -> tuple[str, bool]:
+        """
+        Ожидание нового письма в IDLE: уведомления без EXISTS (например, '* OK Still here') IDLE не прерывают.
+        Возвращает порядковый номер письма и признак молчания сервера дольше IMAP_IDLE_SILENCE_TIMEOUT
+        (в том числе если IDLE закончился по интервалу перезапуска без единого уведомления за это время).
+        """
+        client = self.connection_manager.client
+        if not client:
+            raise IMAPClientIsNotConnected
+        loop = asyncio.get_running_loop()
+        last_push_at = loop.time()
+        while True:
+            try:
+                push_messages = await client.wait_server_push(
+                    timeout=settings.IMAP_IDLE_SILENCE_TIMEOUT)
+            except asyncio.exceptions.TimeoutError:
+                return '', True
+            if push_messages == aioimaplib.STOP_WAIT_SERVER_PUSH:
+                return '', loop.time() - last_push_at >= settings.IMAP_IDLE_SILENCE_TIMEOUT
+            last_push_at = loop.time()
+            imap_fleet.record_idle(self.redis_ops.box_id)
+            seq_number = await self.handle_server_push(push_messages)
+            if seq_number:
+                return seq_number, False
+
     async def handle_active_state(self) -> bool:
-        """Обработка активного статуса IMAP клиента."""
-        if not self.connection_manager.client:
+        """
+        Обработка активного статуса IMAP клиента.
+        IDLE держится до нового письма, команды узла или интервала перезапуска из профиля сервиса.
+        Разрыв соединения обнаруживается TCP keepalive, а если сервер молчит дольше IMAP_IDLE_SILENCE_TIMEOUT,
+        после выхода из IDLE сессия проверяется поиском новых писем (UID SEARCH UID n:*). Найденные письма
+        означают, что сервер молча не присылает уведомления в IDLE, и ящик переводится на опрос.
+        """
+        client = self.connection_manager.client
+        if not client:
             raise IMAPClientIsNotConnected
         logger.info(f'{self.connection_manager.user} starting idle')
+        self.connection_manager.check_alive()
         try:
-            idle_task = await self.connection_manager.client.idle_start(timeout=60)
-            seq_number = await self.handle_server_push(
-                await self.connection_manager.client.wait_server_push())
-            self.connection_manager.client.idle_done()
-            await wait_for(idle_task, timeout=20)
+            idle_task = await wait_for(
+                client.idle_start(timeout=self.connection_manager.service.idle_renewal_interval),
+                timeout=self.connection_manager.service.command_timeout
+            )
+            imap_fleet.record_idle(self.redis_ops.box_id)
+            seq_number, is_silent = await self.wait_idle_push()
+            self.connection_manager.check_alive()
+            client.idle_done()
+            await wait_for(idle_task, timeout=self.connection_manager.service.command_timeout)
+            if is_silent:
+                logger.info(f'The imap server {self.connection_manager.host} is silent. Checking with UID SEARCH.')
+                missed_uids = await self.search_new_uids()
+                imap_fleet.record_idle(self.redis_ops.box_id)
+                if missed_uids:
+                    logger.warning(f'The imap server {self.connection_manager.host} did not report '
+                                   f'{len(missed_uids)} new emails in IDLE. Switching {self.connection_manager.user} '
+                                   f'to polling.')
+                    self.start_polling()
+                    await self.process_new_messages(missed_uids)
+                    return True
             if seq_number:
+                imap_fleet.set_state(self.redis_ops.box_id, BoxConnectionStates.PROCESSING)
                 uid = await self.fetch_uid_from_seq_number(seq_number)
                 if uid:
-                    self.persistent_max_uid = await self.fetch_messages_headers(uid)
-                logger.info(f'Processed email with UID: {uid}')
+                    await self.process_new_messages([uid])
                 return True
         except asyncio.exceptions.TimeoutError:
             raise IMAPServerTimeout
         logger.info(f'{self.connection_manager.user} ending idle')
         return False
 
-    async def imap_loop(self, initial_state: str = IMAPStatuses.ACTIVE.value) -> None:
-        """Цикл поддержания состояния 'idle' с сервером."""
-        await self.redis_ops.set_status(initial_state)
-        await self.connection_manager.connect()
+    def start_polling(self) -> None:
+        """Перевод ящика с IDLE на опрос по срокам общего планировщика процесса."""
+        self.polling = True
+        self.poll_interval = poll_scheduler.first_interval()
+
+    async def handle_polling_state(self) -> bool:
+        """
+        Обработка активного статуса на сервере без IDLE (или с IDLE без уведомлений).
+        В срок из общего планировщика ящик проверяется одной командой UID SEARCH UID n:*, после чего
+        интервал опроса сокращается, если нашлись письма, и растет, пока ящик молчит.
+        """
+        box_id = self.redis_ops.box_id
+        self.connection_manager.check_alive()
+        if not await poll_scheduler.wait(box_id, self.poll_interval):
+            return False
+        self.connection_manager.check_alive()
+        try:
+            new_uids = await self.search_new_uids()
+            if new_uids:
+                logger.info(f'Polling of {self.connection_manager.user} found {len(new_uids)} new emails.')
+                await self.process_new_messages(new_uids)
+        except asyncio.exceptions.TimeoutError:
+            raise IMAPServerTimeout
+        imap_fleet.record_poll(box_id)
+        self.poll_interval = poll_scheduler.next_interval(self.poll_interval, len(new_uids))
+        return bool(new_uids)
+
+    async def wake_up(self) -> None:
+        """Прерывание ожидания сообщений в IDLE или срока опроса, чтобы цикл клиента сразу перечитал статус."""
+        poll_scheduler.wake(self.redis_ops.box_id)
+        if self.connection_manager.client:
+            await self.connection_manager.client.stop_wait_server_push()
+
+    async def release(self) -> None:
+        """
+        Остановка клиента на этом узле без изменения статуса ящика в Redis:
+        ящик передается другому узлу, который продолжит прослушивание с тем же статусом.
+        Обработка текущего письма завершается, после чего сохраняется UID последнего письма и выполняется LOGOUT.
+        """
+        self.released = True
+        await self.wake_up()
+
+    async def connect_session(self) -> None:
+        """Подключение к серверу, выбор INBOX и обработка писем, пропущенных без подключения."""
+        select_response, qresync_used = await self.connection_manager.connect(self.qresync_state())
         if not self.connection_manager.client:
             raise IMAPClientIsNotConnected
+        await self.resync(select_response, qresync_used)
+        service = self.connection_manager.service
+        if service.capabilities is not None and not service.supports('IDLE') and not self.polling:
+            logger.info(f'The imap server {self.connection_manager.host} does not support IDLE. '
+                        f'Polling {self.connection_manager.user}.')
+            self.start_polling()
+
+    async def wait_reconnect(self, delay: float) -> bool:
+        """
+        Ожидание переподключения в общем планировщике процесса.
+        Команда канала управления прерывает ожидание; False - клиент остановлен или передан другому узлу.
+        """
+        await poll_scheduler.wait(self.redis_ops.box_id, delay)
+        return not self.released and await self.redis_ops.get_status() != IMAPStatuses.STOPPED.value
+
+    async def imap_loop(self, initial_state: str = IMAPStatuses.ACTIVE.value) -> None:
+        """
+        Цикл поддержания состояния 'idle' с сервером.
+        Таймауты и разрывы соединения не завершают клиент: сессия переподключается с задержкой reconnect_delay,
+        которая растет с каждой неудачной попыткой и сбрасывается после успешного подключения.
+        """
+        box_id = self.redis_ops.box_id
+        await self.redis_ops.set_status(initial_state)
+        self.restore_checkpoint(await self.redis_ops.get_checkpoint())
+        imap_fleet.register(box_id, self.redis_ops.telegram_id, self.connection_manager.host)
+        imap_control.register(box_id, self)
+        try:
+            attempt = 0
+            while True:
+                try:
+                    await self.connect_session()
+                    attempt = 0
+                    await self.run_state_loop()
+                    break
+                except RECONNECT_ERRORS as error:
+                    self.connection_manager.drop_session()
+                    imap_fleet.record_error(box_id, error)
+                    delay = reconnect_delay(attempt, getattr(error, 'retry_after', 0.0))
+                    attempt += 1
+                    logger.warning(f'IMAPClient for {self.connection_manager.user} failed: {error!r}. '
+                                   f'Reconnecting in {delay:.1f} s.')
+                    if not await self.wait_reconnect(delay):
+                        break
+                    imap_fleet.record_reconnect(box_id)
+        except Exception as error:
+            imap_fleet.record_error(box_id, error)
+            self.connection_manager.release_connection()
+            raise
+        finally:
+            imap_control.unregister(box_id, self)
+        imap_fleet.remove(box_id)
+        if self.released:
+            await self.redis_ops.set_checkpoint(self.checkpoint())
+        else:
+            await self.redis_ops.remove_status()
+            await self.redis_ops.remove_checkpoint()
+        if self.connection_manager.client:
+            await self.connection_manager.disconnect()
+
+    async def run_state_loop(self) -> None:
+        """Обработка статусов клиента до получения статуса 'stopped' или передачи ящика другому узлу."""
         while True:
+            if self.released:
+                logger.info(f'IMAPClient for {self.connection_manager.user} released to another node.')
+                break
             current_status = await self.redis_ops.get_status()
             if current_status == IMAPStatuses.PAUSED.value:
                 logger.info(
                     f'IMAPClient for {self.connection_manager.user} is in paused state. Awaiting active state...')
+                imap_fleet.set_state(self.redis_ops.box_id, BoxConnectionStates.PAUSED)
                 await asyncio.sleep(5)
                 continue
             elif current_status == IMAPStatuses.ACTIVE.value:
-                await self.handle_active_state()
+                if self.polling:
+                    await self.handle_polling_state()
+                else:
+                    await self.handle_active_state()
             elif current_status == IMAPStatuses.STOPPED.value:
                 logger.info(f'IMAPClient for {self.connection_manager.user} stopped.')
                 break
-        await self.redis_ops.remove_status()
-        await self.connection_manager.disconnect()
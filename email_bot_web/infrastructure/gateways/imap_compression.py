@@ -0,0 +1,99 @@
+import asyncio
+import zlib
+from typing import Any
+
+from infrastructure.utils.metrics import IMAP_COMPRESSED_BYTES_TOTAL
+
+# Клиент отправляет только короткие команды, поэтому окно и память его компрессора минимальны (около 3 КБ
+# на сессию). Распаковка данных сервера требует полного окна 32 КБ (RFC 4978).
+CLIENT_WINDOW_BITS = -9
+CLIENT_MEM_LEVEL = 1
+SERVER_WINDOW_BITS = -15
+
+
+class DeflateProtocol(asyncio.Protocol):
+    """Распаковка данных сервера перед передачей протоколу IMAP."""
+
+    def __init__(self, protocol: asyncio.Protocol, host: str):
+        self.protocol = protocol
+        self.decompressor = zlib.decompressobj(SERVER_WINDOW_BITS)
+        self.wire_bytes = IMAP_COMPRESSED_BYTES_TOTAL.labels(host=host, direction='received', layer='wire')
+        self.payload_bytes = IMAP_COMPRESSED_BYTES_TOTAL.labels(host=host, direction='received', layer='payload')
+
+    def data_received(self, data: bytes) -> None:
+        """Распаковка полученного блока данных."""
+        payload = self.decompressor.decompress(data)
+        self.wire_bytes.inc(len(data))
+        self.payload_bytes.inc(len(payload))
+        if payload:
+            self.protocol.data_received(payload)
+
+    def eof_received(self) -> bool | None:
+        """Закрытие соединения сервером."""
+        return self.protocol.eof_received()
+
+    def connection_lost(self, exc: Exception | None) -> None:
+        """Разрыв соединения."""
+        self.protocol.connection_lost(exc)
+
+    def pause_writing(self) -> None:
+        """Заполнение буфера отправки."""
+        self.protocol.pause_writing()
+
+    def resume_writing(self) -> None:
+        """Освобождение буфера отправки."""
+        self.protocol.resume_writing()
+
+
+class DeflateTransport(asyncio.Transport):
+    """Транспорт сессии IMAP со сжатием COMPRESS=DEFLATE поверх исходного (TLS) транспорта."""
+
+    def __init__(self, transport: asyncio.Transport, host: str):
+        super().__init__()
+        self.transport = transport
+        self.compressor = zlib.compressobj(
+            zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, CLIENT_WINDOW_BITS, CLIENT_MEM_LEVEL
+        )
+        self.wire_bytes = IMAP_COMPRESSED_BYTES_TOTAL.labels(host=host, direction='sent', layer='wire')
+        self.payload_bytes = IMAP_COMPRESSED_BYTES_TOTAL.labels(host=host, direction='sent', layer='payload')
+
+    def write(self, data: bytes) -> None:
+        """Сжатие и отправка данных; каждая запись завершается Z_SYNC_FLUSH, чтобы сервер сразу получил команду."""
+        compressed = self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+        self.payload_bytes.inc(len(data))
+        self.wire_bytes.inc(len(compressed))
+        self.transport.write(compressed)
+
+    def get_extra_info(self, name: str, default: Any = None) -> Any:
+        """Сведения исходного транспорта (сокет, SSL объект)."""
+        return self.transport.get_extra_info(name, default)
+
+    def is_closing(self) -> bool:
+        """Проверка закрытия исходного транспорта."""
+        return self.transport.is_closing()
+
+    def close(self) -> None:
+        """Закрытие исходного транспорта."""
+        self.transport.close()
+
+    def abort(self) -> None:
+        """Немедленное закрытие исходного транспорта."""
+        self.transport.abort()
+
+    def get_write_buffer_size(self) -> int:
+        """Размер буфера отправки исходного транспорта."""
+        return self.transport.get_write_buffer_size()
+
+    def set_write_buffer_limits(self, high: int | None = None, low: int | None = None) -> None:
+        """Границы буфера отправки исходного транспорта."""
+        self.transport.set_write_buffer_limits(high, low)
+
+
+def start_deflate(protocol: asyncio.Protocol, host: str) -> None:
+    """
+    Перевод сессии на сжатие после ответа OK на COMPRESS DEFLATE: протокол IMAP пишет в сжимающий транспорт,
+    а данные сервера распаковываются до передачи протоколу.
+    """
+    transport = protocol.transport  # type: ignore
+    transport.set_protocol(DeflateProtocol(protocol, host))
+    protocol.transport = DeflateTransport(transport, host)  # type: ignore
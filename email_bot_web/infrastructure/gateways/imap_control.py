@@ -0,0 +1,63 @@
+import asyncio
+import json
+import logging
+from typing import TYPE_CHECKING, Any
+
+import redis.asyncio
+from django.conf import settings
+from redis.asyncio.client import PubSub
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+if TYPE_CHECKING:
+    from infrastructure.gateways.imap_client import IMAPClient
+
+logger = logging.getLogger('infrastructure')
+
+
+class IMAPControlListener:
+    """
+    Подписка процесса на канал управления клиентами IMAP.
+    Статусы в Redis остаются источником истины, а команда канала пробуждает клиенты из IDLE,
+    чтобы новый статус применялся сразу, а не после окончания цикла ожидания.
+    Команда с флагом rebalance (например, после создания ящика) запускает немедленное распределение ящиков.
+    """
+
+    def __init__(self):
+        self.clients: dict[int, 'IMAPClient'] = {}
+        self.rebalance_event = asyncio.Event()
+
+    def register(self, box_id: int, client: 'IMAPClient') -> None:
+        """Регистрация запущенного в процессе клиента IMAP почтового ящика."""
+        self.clients[box_id] = client
+
+    def unregister(self, box_id: int, client: 'IMAPClient') -> None:
+        """Удаление клиента IMAP почтового ящика из процесса."""
+        if self.clients.get(box_id) is client:
+            del self.clients[box_id]
+
+    async def dispatch(self, control_message: dict[str, Any]) -> None:
+        """Пробуждение клиентов текущего процесса, перечисленных в команде."""
+        if control_message.get('rebalance'):
+            self.rebalance_event.set()
+        for box_id in control_message.get('box_ids', []):
+            client = self.clients.get(box_id)
+            if client:
+                await client.wake_up()
+
+    async def listen(self) -> None:
+        """Асинхронное чтение команд из канала Redis с переподключением при разрыве соединения."""
+        connection = redis.asyncio.from_url(settings.CACHES['default']['LOCATION'])
+        while True:
+            try:
+                pubsub: PubSub = connection.pubsub()
+                async with pubsub:
+                    await pubsub.subscribe(settings.IMAP_CONTROL_CHANNEL)
+                    async for message in pubsub.listen():
+                        if message['type'] == 'message':
+                            await self.dispatch(json.loads(message['data']))
+            except RedisConnectionError:
+                logger.error('IMAP control channel connection lost. Reconnecting...')
+                await asyncio.sleep(5)
+
+
+imap_control = IMAPControlListener()
@@ -0,0 +1,225 @@
+import asyncio
+import json
+import logging
+import time
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+from enum import Enum
+from typing import Any
+
+import redis.asyncio
+from django.conf import settings
+from redis.asyncio.client import Pipeline
+from redis.exceptions import RedisError
+
+logger = logging.getLogger('infrastructure')
+
+
+class BoxConnectionStates(Enum):
+    """Состояния подключения клиента IMAP в реестре."""
+
+    CONNECTING = 'connecting'
+    IDLE = 'idle'
+    POLLING = 'polling'
+    PROCESSING = 'processing'
+    PAUSED = 'paused'
+    ERROR = 'error'
+
+
+CONNECTED_STATES = {
+    BoxConnectionStates.IDLE.value,
+    BoxConnectionStates.POLLING.value,
+    BoxConnectionStates.PROCESSING.value,
+    BoxConnectionStates.PAUSED.value,
+}
+
+
+@dataclass(slots=True)
+class BoxState:
+    """Состояние клиента IMAP почтового ящика в реестре узла."""
+
+    box_id: int
+    telegram_id: int
+    host: str
+    state: str = BoxConnectionStates.CONNECTING.value
+    last_idle_at: float | None = None
+    last_uid: int | None = None
+    last_message_at: float | None = None
+    reconnects: int = 0
+    reconnect_times: list[float] = field(default_factory=list)
+    error_streak: int = 0
+    last_error: str | None = None
+    updated_at: float = 0.0
+
+
+class IMAPFleetRegistry:
+    """
+    Реестр состояний клиентов IMAP процесса.
+    Изменения копятся в памяти и периодически записываются одним HSET в хеш узла (поле - id ящика),
+    поэтому запись не зависит от количества событий, а чтение всего парка - один HVALS на узел.
+    """
+
+    def __init__(self):
+        self.node_id = settings.NODE_ID
+        self.node_key = settings.IMAP_FLEET_NODE_KEY_FORMAT.format(node_id=self.node_id)
+        self.boxes: dict[int, BoxState] = {}
+        self._dirty: set[int] = set()
+        self._removed: set[int] = set()
+
+    def register(self, box_id: int, telegram_id: int, host: str) -> None:
+        """Добавление почтового ящика в реестр при запуске клиента."""
+        self.boxes[box_id] = BoxState(box_id=box_id, telegram_id=telegram_id, host=host, updated_at=time.time())
+        self._removed.discard(box_id)
+        self._dirty.add(box_id)
+
+    def update(self, box_id: int, **changes: Any) -> None:
+        """Изменение полей состояния почтового ящика."""
+        box_state = self.boxes.get(box_id)
+        if box_state is None:
+            return
+        for field_name, value in changes.items():
+            setattr(box_state, field_name, value)
+        box_state.updated_at = time.time()
+        self._dirty.add(box_id)
+
+    def set_state(self, box_id: int, state: BoxConnectionStates) -> None:
+        """Смена состояния подключения почтового ящика."""
+        self.update(box_id, state=state.value)
+
+    def record_idle(self, box_id: int) -> None:
+        """Отметка о начале IDLE или ответе сервера в IDLE: клиент подключен, ошибки сброшены."""
+        self.update(box_id, state=BoxConnectionStates.IDLE.value, last_idle_at=time.time(), error_streak=0)
+
+    def record_poll(self, box_id: int) -> None:
+        """Отметка об успешном опросе ящика без IDLE: клиент подключен, ошибки сброшены."""
+        self.update(box_id, state=BoxConnectionStates.POLLING.value, last_idle_at=time.time(), error_streak=0)
+
+    def record_message(self, box_id: int, uid: int) -> None:
+        """Отметка об обработке письма с указанным UID."""
+        self.update(box_id, last_uid=uid, last_message_at=time.time())
+
+    def record_reconnect(self, box_id: int) -> None:
+        """
+        Увеличение счетчика переподключений и запись времени переподключения.
+        Хранятся только последние IMAP_FLEET_FLAPPING_RECONNECTS отметок: их достаточно, чтобы определить,
+        уложились ли они в окно IMAP_FLEET_FLAPPING_WINDOW.
+        """
+        box_state = self.boxes.get(box_id)
+        if box_state:
+            reconnect_times = [*box_state.reconnect_times, time.time()][-settings.IMAP_FLEET_FLAPPING_RECONNECTS:]
+            self.update(
+                box_id,
+                state=BoxConnectionStates.CONNECTING.value,
+                reconnects=box_state.reconnects + 1,
+                reconnect_times=reconnect_times
+            )
+
+    def record_error(self, box_id: int, error: BaseException) -> None:
+        """Отметка об ошибке клиента: увеличение серии ошибок подряд."""
+        box_state = self.boxes.get(box_id)
+        if box_state:
+            self.update(
+                box_id,
+                state=BoxConnectionStates.ERROR.value,
+                error_streak=box_state.error_streak + 1,
+                last_error=type(error).__name__
+            )
+
+    def remove(self, box_id: int) -> None:
+        """Удаление почтового ящика из реестра при остановке клиента."""
+        if self.boxes.pop(box_id, None):
+            self._dirty.discard(box_id)
+            self._removed.add(box_id)
+
+    async def flush(self, connection: redis.asyncio.Redis) -> None:
+        """Запись накопленных изменений и отметки активности узла одним конвейером Redis."""
+        dirty = {box_id: self.boxes[box_id] for box_id in self._dirty if box_id in self.boxes}
+        removed = list(self._removed)
+        self._dirty.clear()
+        self._removed.clear()
+        try:
+            pipe: Pipeline = connection.pipeline(transaction=False)
+            async with pipe:
+                if dirty:
+                    pipe.hset(self.node_key, mapping={
+                        str(box_id): json.dumps(asdict(box_state), separators=(',', ':'))
+                        for box_id, box_state in dirty.items()
+                    })
+                if removed:
+                    pipe.hdel(self.node_key, *map(str, removed))
+                pipe.expire(self.node_key, settings.IMAP_FLEET_NODE_TTL)
+                pipe.zadd(settings.IMAP_FLEET_NODES_KEY, {self.node_id: time.time()})
+                await pipe.execute()
+        except RedisError:
+            self._dirty.update(dirty)
+            self._removed.update(removed)
+            raise
+
+    async def leave(self) -> None:
+        """Удаление узла из реестра парка при плановой остановке."""
+        connection = redis.asyncio.from_url(settings.CACHES['default']['LOCATION'])
+        pipe: Pipeline = connection.pipeline(transaction=False)
+        async with pipe:
+            pipe.delete(self.node_key)
+            pipe.zrem(settings.IMAP_FLEET_NODES_KEY, self.node_id)
+            await pipe.execute()
+
+    async def run(self) -> None:
+        """Периодическая запись реестра узла в Redis."""
+        connection = redis.asyncio.from_url(settings.CACHES['default']['LOCATION'])
+        while True:
+            await asyncio.sleep(settings.IMAP_FLEET_FLUSH_INTERVAL)
+            try:
+                await self.flush(connection)
+            except RedisError as error:
+                logger.error(f'IMAP fleet registry flush failed: {error}')
+
+
+def get_fleet_snapshot(client: Any) -> dict[str, Any]:
+    """
+    Синхронная сводка по всем живым узлам: состояния, подключения по хостам и проблемные ящики.
+    Узлы без отметки активности дольше IMAP_FLEET_NODE_TTL не учитываются и удаляются из списка.
+    Нестабильным считается ящик с IMAP_FLEET_FLAPPING_RECONNECTS переподключениями за IMAP_FLEET_FLAPPING_WINDOW.
+    """
+    now = time.time()
+    client.zremrangebyscore(settings.IMAP_FLEET_NODES_KEY, '-inf', now - settings.IMAP_FLEET_NODE_TTL)
+    node_ids = [node_id.decode() for node_id in client.zrange(settings.IMAP_FLEET_NODES_KEY, 0, -1)]
+    with client.pipeline(transaction=False) as pipe:
+        for node_id in node_ids:
+            pipe.hvals(settings.IMAP_FLEET_NODE_KEY_FORMAT.format(node_id=node_id))
+        node_values = pipe.execute()
+    states: Counter = Counter()
+    host_connections: Counter = Counter()
+    problem_boxes = []
+    nodes = []
+    for node_id, values in zip(node_ids, node_values):
+        box_states = [json.loads(value) for value in values]
+        nodes.append({'node_id': node_id, 'boxes': len(box_states)})
+        for box_state in box_states:
+            box_state['node_id'] = node_id
+            states[box_state['state']] += 1
+            if box_state['state'] in CONNECTED_STATES:
+                host_connections[box_state['host']] += 1
+            box_state['idle_age'] = int(now - (box_state['last_idle_at'] or box_state['updated_at']))
+            box_state['message_age'] = int(now - box_state['last_message_at']) if box_state['last_message_at'] else None
+            is_waiting = box_state['state'] in (BoxConnectionStates.IDLE.value, BoxConnectionStates.POLLING.value)
+            box_state['stuck'] = is_waiting and box_state['idle_age'] > settings.IMAP_FLEET_STUCK_AFTER
+            box_state['recent_reconnects'] = sum(
+                reconnect_at > now - settings.IMAP_FLEET_FLAPPING_WINDOW
+                for reconnect_at in box_state.get('reconnect_times', [])
+            )
+            box_state['flapping'] = box_state['recent_reconnects'] >= settings.IMAP_FLEET_FLAPPING_RECONNECTS
+            if box_state['stuck'] or box_state['flapping'] or box_state['error_streak']:
+                problem_boxes.append(box_state)
+    problem_boxes.sort(key=lambda box: (box['error_streak'], box['recent_reconnects']), reverse=True)
+    return {
+        'nodes': nodes,
+        'states': dict(states),
+        'total': sum(states.values()),
+        'host_connections': host_connections.most_common(),
+        'problem_boxes': problem_boxes[:settings.IMAP_FLEET_PROBLEM_BOXES_LIMIT],
+        'problem_boxes_total': len(problem_boxes),
+    }
+
+
+imap_fleet = IMAPFleetRegistry()
@@ -0,0 +1,292 @@
+import asyncio
+import logging
+import socket
+import ssl
+import time
+from collections import deque
+from enum import Enum
+from typing import Callable
+
+import aioimaplib
+from django.conf import settings
+from infrastructure.dto import EmailServiceDTO
+from infrastructure.exceptions import IMAPCircuitOpen
+from infrastructure.utils.metrics import (
+    IMAP_CIRCUIT_TRANSITIONS_TOTAL,
+    IMAP_DNS_LOOKUPS_TOTAL,
+    IMAP_HANDSHAKE_SECONDS,
+)
+
+logger = logging.getLogger('infrastructure')
+
+
+class CircuitStates(Enum):
+    """Состояния автомата защиты сервера IMAP."""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+
+class ResumableSSLContext(ssl.SSLContext):
+    """
+    Контекст TLS сервера IMAP, общий для всех подключений процесса к этому серверу: сертификаты загружаются
+    один раз, а каждое новое подключение предлагает серверу сессию TLS прошлого подключения (tls_session),
+    что заменяет полное рукопожатие сокращенным.
+    """
+
+    tls_session: ssl.SSLSession | None = None
+
+    def wrap_bio(self, incoming: ssl.MemoryBIO, outgoing: ssl.MemoryBIO, server_side: bool = False,
+                 server_hostname: str | None = None, session: ssl.SSLSession | None = None) -> ssl.SSLObject:
+        """Создание объекта TLS соединения (вызывается asyncio) с сохраненной сессией для возобновления."""
+        return super().wrap_bio(incoming, outgoing, server_side, server_hostname, session or self.tls_session)
+
+
+class HostIMAP4(aioimaplib.IMAP4):
+    """
+    Клиент IMAP, подключающийся через состояние сервера в процессе (кеш DNS и общий контекст TLS).
+    Ошибка подключения (DNS, TCP, TLS) возвращается при ожидании приветствия сразу, а не по таймауту.
+    """
+
+    def __init__(self, imap_host: 'IMAPHost', port: int, timeout: float):
+        self.imap_host = imap_host
+        self.connecting: asyncio.Task | None = None
+        super().__init__(host=imap_host.address, port=port, timeout=timeout)
+
+    def create_client(self, host: str, port: int, loop: asyncio.AbstractEventLoop | None,
+                      conn_lost_cb: Callable[[Exception | None], None] | None = None,
+                      ssl_context: ssl.SSLContext | None = None) -> None:
+        """Создание протокола и запуск подключения к серверу."""
+        local_loop = loop if loop is not None else asyncio.get_running_loop()
+        self.protocol = aioimaplib.IMAP4ClientProtocol(local_loop, conn_lost_cb)
+        self.connecting = local_loop.create_task(
+            self.imap_host.open_connection(lambda: self.protocol, port, self.timeout)
+        )
+
+    async def wait_hello_from_server(self) -> None:
+        """Ожидание подключения и приветствия сервера; после него сохраняется сессия TLS для возобновления."""
+        if self.connecting is not None:
+            await asyncio.wait_for(self.connecting, self.timeout)
+        await super().wait_hello_from_server()
+        self.imap_host.save_tls_session(self.protocol.transport)
+
+
+class IMAPHost:
+    """
+    Ограничения подключений процесса к одному серверу IMAP по профилю почтового сервиса:
+    число одновременно открытых сессий (max_connections) и темп новых подключений (connect_rate).
+    Превышение лимитов провайдера приводит к отказам LOGIN и временной блокировке адреса узла.
+    Автомат защиты (circuit breaker) приостанавливает подключения к недоступному серверу после
+    IMAP_CIRCUIT_FAILURE_THRESHOLD отказов подряд и затем пропускает по одному пробному подключению.
+    Массовое переподключение к серверу использует один контекст TLS с возобновлением сессий
+    и адреса из кеша DNS вместо полного рукопожатия и запроса DNS на каждое подключение.
+    """
+
+    __slots__ = ('address', 'max_connections', 'connect_interval', 'connections', 'next_connect_at', '_waiters',
+                 'circuit_state', 'failures', 'open_timeout', 'opened_until', 'probe_started_at', 'ssl_context',
+                 'addresses', 'addresses_expire_at', 'connects', '_resolving')
+
+    def __init__(self, address: str):
+        self.address = address
+        self.max_connections: int | None = None
+        self.connect_interval = 0.0
+        self.connections = 0
+        self.next_connect_at = 0.0
+        self._waiters: deque[asyncio.Future] = deque()
+        self.circuit_state = CircuitStates.CLOSED
+        self.failures = 0
+        self.open_timeout = float(settings.IMAP_CIRCUIT_OPEN_TIMEOUT)
+        self.opened_until = 0.0
+        self.probe_started_at = 0.0
+        self.ssl_context: ResumableSSLContext | None = None
+        self.addresses: list[tuple[socket.AddressFamily, str]] = []
+        self.addresses_expire_at = 0.0
+        self.connects = 0
+        self._resolving: asyncio.Task | None = None
+
+    def configure(self, service: EmailServiceDTO) -> None:
+        """Применение лимитов из профиля почтового сервиса (профиль мог измениться в админ-панели)."""
+        self.max_connections = service.max_connections
+        self.connect_interval = 1 / service.connect_rate if service.connect_rate else 0.0
+        self._wake_waiters()
+
+    def has_free_connection(self) -> bool:
+        """Проверка, можно ли открыть еще одну сессию без превышения max_connections."""
+        return not self.max_connections or self.connections < self.max_connections
+
+    async def acquire_connection(self) -> None:
+        """Ожидание свободного места под сессию в порядке очереди."""
+        while not self.has_free_connection() or self._waiters:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    # Место освободилось для отмененной задачи - передаем его следующей
+                    self._wake_waiters()
+                raise
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+            if self.has_free_connection():
+                break
+        self.connections += 1
+
+    def release_connection(self) -> None:
+        """Освобождение места закрытой сессии."""
+        self.connections -= 1
+        self._wake_waiters()
+
+    def _wake_waiters(self) -> None:
+        """Пробуждение ожидающих задач по числу свободных мест."""
+        free = len(self._waiters) if not self.max_connections else self.max_connections - self.connections
+        while free > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+    async def wait_connect_turn(self) -> None:
+        """Выдерживание темпа новых подключений: попытки распределяются с интервалом 1 / connect_rate."""
+        if not self.connect_interval:
+            return
+        now = asyncio.get_running_loop().time()
+        connect_at = max(now, self.next_connect_at)
+        self.next_connect_at = connect_at + self.connect_interval
+        await asyncio.sleep(connect_at - now)
+
+    def get_ssl_context(self) -> ResumableSSLContext:
+        """Общий контекст TLS сервера (создается при первом подключении)."""
+        if self.ssl_context is None:
+            self.ssl_context = ResumableSSLContext(ssl.PROTOCOL_TLS_CLIENT)
+            self.ssl_context.load_default_certs(ssl.Purpose.SERVER_AUTH)
+        return self.ssl_context
+
+    def save_tls_session(self, transport: asyncio.Transport | None) -> None:
+        """
+        Сохранение сессии TLS подключения для возобновления следующими подключениями.
+        Сессия берется после приветствия сервера: в TLS 1.3 билет сессии приходит после рукопожатия.
+        """
+        ssl_object = transport.get_extra_info('ssl_object') if transport else None
+        if ssl_object is not None and ssl_object.session is not None:
+            self.get_ssl_context().tls_session = ssl_object.session
+
+    async def resolve(self) -> list[tuple[socket.AddressFamily, str]]:
+        """
+        Адреса сервера из кеша DNS процесса (IMAP_DNS_CACHE_TTL): при массовом переподключении
+        имя разрешается один раз, одновременные запросы ожидают общий результат.
+        """
+        loop = asyncio.get_running_loop()
+        if self.addresses and loop.time() < self.addresses_expire_at:
+            IMAP_DNS_LOOKUPS_TOTAL.labels(host=self.address, result='cached').inc()
+            return self.addresses
+        if self._resolving is None:
+            self._resolving = loop.create_task(self._resolve())
+        else:
+            IMAP_DNS_LOOKUPS_TOTAL.labels(host=self.address, result='cached').inc()
+        return await asyncio.shield(self._resolving)
+
+    async def _resolve(self) -> list[tuple[socket.AddressFamily, str]]:
+        """Запрос DNS с сохранением адресов в кеш."""
+        try:
+            address_infos = await asyncio.get_running_loop().getaddrinfo(self.address, None, type=socket.SOCK_STREAM)
+        finally:
+            self._resolving = None
+        IMAP_DNS_LOOKUPS_TOTAL.labels(host=self.address, result='resolved').inc()
+        self.addresses = list(dict.fromkeys((family, sockaddr[0]) for family, _, _, _, sockaddr in address_infos))
+        self.addresses_expire_at = asyncio.get_running_loop().time() + settings.IMAP_DNS_CACHE_TTL
+        return self.addresses
+
+    async def open_connection(self, protocol_factory: Callable[[], asyncio.Protocol], port: int,
+                              timeout: float) -> tuple[asyncio.BaseTransport, asyncio.Protocol]:
+        """
+        Подключение TCP и TLS к одному из адресов сервера по очереди. Длительность рукопожатия учитывается
+        в метрике imap_handshake_seconds отдельно для полных и возобновленных сессий TLS;
+        при ошибке подключения адреса удаляются из кеша DNS.
+        """
+        addresses = await self.resolve()
+        family, ip_address = addresses[self.connects % len(addresses)]
+        self.connects += 1
+        started = time.perf_counter()
+        try:
+            transport, protocol = await asyncio.get_running_loop().create_connection(
+                protocol_factory, ip_address, port, family=family, ssl=self.get_ssl_context(),
+                server_hostname=self.address, ssl_handshake_timeout=timeout
+            )
+        except OSError:
+            self.addresses = []
+            raise
+        ssl_object = transport.get_extra_info('ssl_object')
+        IMAP_HANDSHAKE_SECONDS.labels(
+            host=self.address,
+            tls_session='resumed' if ssl_object is not None and ssl_object.session_reused else 'new'
+        ).observe(time.perf_counter() - started)
+        return transport, protocol
+
+    def check_circuit(self) -> None:
+        """
+        Проверка автомата защиты перед подключением.
+        Разомкнутый автомат отклоняет подключения до истечения open_timeout, после чего пропускает одно
+        пробное подключение; пока оно не завершилось (но не дольше open_timeout), остальные отклоняются.
+        """
+        if self.circuit_state == CircuitStates.CLOSED:
+            return
+        now = time.monotonic()
+        if self.circuit_state == CircuitStates.OPEN:
+            retry_at = self.opened_until
+        else:
+            retry_at = self.probe_started_at + self.open_timeout
+        if now < retry_at:
+            raise IMAPCircuitOpen(retry_after=retry_at - now)
+        self.probe_started_at = now
+        self._set_circuit_state(CircuitStates.HALF_OPEN)
+
+    def record_success(self) -> None:
+        """Учет ответа сервера на подключение: автомат замыкается, серия отказов сбрасывается."""
+        self.failures = 0
+        if self.circuit_state != CircuitStates.CLOSED:
+            self.open_timeout = float(settings.IMAP_CIRCUIT_OPEN_TIMEOUT)
+            self._set_circuit_state(CircuitStates.CLOSED)
+
+    def record_failure(self) -> None:
+        """
+        Учет отказа сервера при подключении. Автомат размыкается после серии отказов подряд
+        или после неудачного пробного подключения (тогда время разомкнутого состояния удваивается).
+        """
+        self.failures += 1
+        if self.circuit_state == CircuitStates.HALF_OPEN:
+            self.open_timeout = min(self.open_timeout * 2, settings.IMAP_CIRCUIT_MAX_OPEN_TIMEOUT)
+        elif self.circuit_state == CircuitStates.OPEN or self.failures < settings.IMAP_CIRCUIT_FAILURE_THRESHOLD:
+            return
+        self.opened_until = time.monotonic() + self.open_timeout
+        self._set_circuit_state(CircuitStates.OPEN)
+
+    def _set_circuit_state(self, circuit_state: CircuitStates) -> None:
+        """Переключение автомата защиты с записью в журнал и метрику."""
+        self.circuit_state = circuit_state
+        IMAP_CIRCUIT_TRANSITIONS_TOTAL.labels(host=self.address, state=circuit_state.value).inc()
+        if circuit_state == CircuitStates.OPEN:
+            logger.warning(f'The imap server {self.address} failed {self.failures} connections in a row. '
+                           f'Suspending connections for {self.open_timeout:.0f} s.')
+        else:
+            logger.info(f'Circuit of the imap server {self.address} is {circuit_state.value}.')
+
+
+class IMAPHostRegistry:
+    """Состояние подключений процесса к серверам IMAP, общее для всех клиентов одного сервера."""
+
+    def __init__(self):
+        self.hosts: dict[str, IMAPHost] = {}
+
+    def get(self, service: EmailServiceDTO) -> IMAPHost:
+        """Состояние сервера почтового сервиса с лимитами из его текущего профиля."""
+        host = self.hosts.get(service.address)
+        if host is None:
+            host = self.hosts[service.address] = IMAPHost(service.address)
+        host.configure(service)
+        return host
+
+
+imap_hosts = IMAPHostRegistry()
@@ -0,0 +1,74 @@
+import asyncio
+import logging
+import signal
+
+from infrastructure.gateways.async_db import async_db
+from infrastructure.gateways.imap_control import imap_control
+from infrastructure.gateways.imap_fleet import imap_fleet
+from infrastructure.gateways.imap_provisioning import box_provisioning
+from infrastructure.gateways.imap_sessions import imap_sessions
+from infrastructure.gateways.imap_shards import imap_shards
+from redis.exceptions import RedisError
+
+logger = logging.getLogger('infrastructure')
+
+
+class ListenerNode:
+    """Узел-слушатель IMAP: канал управления, реестр состояний и распределение ящиков в одном цикле событий."""
+
+    def __init__(self):
+        self.shards_task: asyncio.Task | None = None
+        self.leases_task: asyncio.Task | None = None
+        self.provisioning_task: asyncio.Task | None = None
+        self.background_tasks: set[asyncio.Task] = set()
+
+    def start(self) -> None:
+        """Запуск фоновых задач узла в текущем цикле событий."""
+        for coroutine in (imap_control.listen(), imap_fleet.run()):
+            self.background_tasks.add(asyncio.create_task(coroutine))
+        self.shards_task = asyncio.create_task(imap_shards.run())
+        self.leases_task = asyncio.create_task(imap_shards.keep_leases())
+        self.provisioning_task = asyncio.create_task(box_provisioning.run())
+
+    async def stop(self) -> None:
+        """
+        Плановая остановка: прием задач создания ящиков и распределение ящиков прекращаются, клиенты передаются
+        другим узлам с LOGOUT в пределах IMAP_SHUTDOWN_TIMEOUT, затем узел удаляется из реестра парка.
+        Канал управления и продление аренд работают до конца передачи, чтобы команды продолжали будить клиенты,
+        а аренды еще не переданных ящиков не истекали.
+        """
+        for task in (self.provisioning_task, self.shards_task):
+            if task:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        await imap_shards.shutdown()
+        if self.leases_task:
+            self.leases_task.cancel()
+            await asyncio.gather(self.leases_task, return_exceptions=True)
+        await imap_sessions.close()
+        for task in self.background_tasks:
+            task.cancel()
+        await asyncio.gather(*self.background_tasks, return_exceptions=True)
+        self.background_tasks.clear()
+        try:
+            await imap_fleet.leave()
+        except RedisError as error:
+            logger.error(f'IMAP fleet registry cleanup failed: {error}')
+
+    async def run(self) -> None:
+        """Работа узла в отдельном процессе до SIGTERM/SIGINT с плановой остановкой."""
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, stop_event.set)
+        if async_db.enabled:
+            await async_db.open()
+        self.start()
+        await stop_event.wait()
+        logger.info('IMAP listener node is stopping')
+        await self.stop()
+        if async_db.enabled:
+            await async_db.close()
+
+
+listener_node = ListenerNode()
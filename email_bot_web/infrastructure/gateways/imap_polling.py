@@ -0,0 +1,92 @@
+import asyncio
+import heapq
+import itertools
+import random
+
+from django.conf import settings
+
+
+class PollScheduler:
+    """
+    Общий для процесса планировщик опроса ящиков без IDLE и переподключения ящиков после ошибок.
+    Сроки хранятся в одной куче, а цикл событий держит единственный таймер на ближайший срок:
+    клиент ящика ждет future, которую планировщик завершает по сроку или при пробуждении клиента.
+    Отмененные сроки не удаляются из кучи, а пропускаются при срабатывании таймера.
+    """
+
+    def __init__(self):
+        self._heap: list[tuple[float, int, int]] = []
+        self._waiters: dict[int, tuple[int, asyncio.Future]] = {}
+        self._entries = itertools.count()
+        self._timer: asyncio.TimerHandle | None = None
+
+    @staticmethod
+    def first_interval() -> float:
+        """
+        Интервал первого опроса ящика: случайный в пределах IMAP_POLL_MIN_INTERVAL,
+        чтобы ящики, запущенные одновременно, не опрашивались одной волной.
+        """
+        return random.uniform(0, settings.IMAP_POLL_MIN_INTERVAL)
+
+    @staticmethod
+    def next_interval(interval: float, new_messages: int) -> float:
+        """
+        Интервал следующего опроса по наблюдаемому потоку писем ящика:
+        найденные письма сокращают интервал вдвое, пустой опрос увеличивает его в IMAP_POLL_BACKOFF раз.
+        """
+        if new_messages:
+            interval /= 2
+        else:
+            interval *= settings.IMAP_POLL_BACKOFF
+        return min(max(interval, settings.IMAP_POLL_MIN_INTERVAL), settings.IMAP_POLL_MAX_INTERVAL)
+
+    async def wait(self, box_id: int, delay: float) -> bool:
+        """
+        Ожидание срока ящика; False - ожидание прервано вызовом wake.
+        Новое ожидание того же ящика прерывает прежнее, чтобы оно не осталось без срока.
+        """
+        loop = asyncio.get_running_loop()
+        self.wake(box_id)
+        entry = next(self._entries)
+        future = loop.create_future()
+        self._waiters[box_id] = (entry, future)
+        heapq.heappush(self._heap, (loop.time() + delay, entry, box_id))
+        self._schedule(loop)
+        try:
+            return await future
+        finally:
+            if self._waiters.get(box_id, (None,))[0] == entry:
+                del self._waiters[box_id]
+
+    def wake(self, box_id: int) -> None:
+        """Прерывание ожидания ящика, чтобы клиент сразу перечитал статус."""
+        waiter = self._waiters.pop(box_id, None)
+        if waiter and not waiter[1].done():
+            waiter[1].set_result(False)
+
+    def _schedule(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Перенос таймера цикла событий на ближайший срок в куче."""
+        if not self._heap:
+            return
+        due = self._heap[0][0]
+        if self._timer is not None:
+            if self._timer.when() <= due:
+                return
+            self._timer.cancel()
+        self._timer = loop.call_at(due, self._fire, loop)
+
+    def _fire(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Завершение ожидания всех ящиков, срок которых наступил."""
+        self._timer = None
+        now = loop.time()
+        while self._heap and self._heap[0][0] <= now:
+            _, entry, box_id = heapq.heappop(self._heap)
+            waiter = self._waiters.get(box_id)
+            if waiter and waiter[0] == entry:
+                del self._waiters[box_id]
+                if not waiter[1].done():
+                    waiter[1].set_result(True)
+        self._schedule(loop)
+
+
+poll_scheduler = PollScheduler()
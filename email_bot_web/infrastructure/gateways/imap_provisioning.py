@@ -0,0 +1,74 @@
+import asyncio
+import json
+import logging
+from typing import Any
+
+import redis.asyncio
+from django.conf import settings
+from email_service.services import EmailBoxService
+from infrastructure.gateways.imap_sessions import imap_sessions
+from infrastructure.gateways.imap_shards import imap_shards
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+logger = logging.getLogger('infrastructure')
+
+QUEUE_POLL_TIMEOUT = 5  # in seconds
+
+
+class BoxProvisioningConsumer:
+    """
+    Создание почтовых ящиков на узлах-слушателях из очереди Redis: BLPOP отдает задачу одному узлу,
+    медленная проверка входа в IMAP не занимает веб-сервер, а проверенная сессия остается в процессе слушателя.
+    Сессию принимает клиент ящика, если ящик принадлежит этому узлу, иначе она сразу закрывается.
+    """
+
+    def __init__(self):
+        self.email_box_service = EmailBoxService()
+        self.jobs: set[asyncio.Task] = set()
+
+    async def run(self) -> None:
+        """Получение задач из очереди с ограничением числа одновременно выполняемых (BOX_PROVISIONING_CONCURRENCY)."""
+        connection = redis.asyncio.from_url(settings.CACHES['default']['LOCATION'])
+        semaphore = asyncio.Semaphore(settings.BOX_PROVISIONING_CONCURRENCY)
+        try:
+            while True:
+                await semaphore.acquire()
+                try:
+                    item = await connection.blpop(settings.BOX_PROVISIONING_QUEUE_KEY, timeout=QUEUE_POLL_TIMEOUT)
+                except RedisConnectionError:
+                    semaphore.release()
+                    logger.error('Box provisioning queue connection lost. Reconnecting...')
+                    await asyncio.sleep(QUEUE_POLL_TIMEOUT)
+                    continue
+                if item is None:
+                    semaphore.release()
+                    continue
+                job = asyncio.create_task(self.provision(connection, json.loads(item[1]), semaphore))
+                self.jobs.add(job)
+                job.add_done_callback(self.jobs.discard)
+        finally:
+            for job in self.jobs:
+                job.cancel()
+            await asyncio.gather(*self.jobs, return_exceptions=True)
+
+    async def provision(
+            self,
+            connection: redis.asyncio.Redis,
+            job_message: dict[str, Any],
+            semaphore: asyncio.Semaphore
+    ) -> None:
+        """Выполнение задачи; прерванная остановкой узла задача возвращается в начало очереди."""
+        try:
+            box_id = await self.email_box_service.run_provisioning_job(job_message)
+            if box_id and imap_shards.ring.owner(box_id) != imap_shards.node_id:
+                imap_sessions.expire(box_id)
+        except asyncio.CancelledError:
+            await connection.lpush(settings.BOX_PROVISIONING_QUEUE_KEY, json.dumps(job_message))
+            raise
+        except Exception as error:
+            logger.error(f'Box provisioning job {job_message["job_id"]} failed: {error!r}')
+        finally:
+            semaphore.release()
+
+
+box_provisioning = BoxProvisioningConsumer()
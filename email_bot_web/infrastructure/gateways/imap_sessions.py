@@ -0,0 +1,63 @@
+import asyncio
+import logging
+
+import aioimaplib
+from django.conf import settings
+
+logger = logging.getLogger('infrastructure')
+
+
+class IMAPSessionPool:
+    """
+    Аутентифицированные сессии IMAP, открытые при проверке нового почтового ящика.
+    Клиент ящика, запущенный в этом процессе, принимает сессию вместо повторного подключения и LOGIN;
+    сессия, не принятая за IMAP_SESSION_ADOPTION_TIMEOUT, закрывается.
+    """
+
+    def __init__(self):
+        self.sessions: dict[int, tuple[aioimaplib.IMAP4, asyncio.TimerHandle]] = {}
+        self._logout_tasks: set[asyncio.Task] = set()
+
+    def park(self, box_id: int, client: aioimaplib.IMAP4) -> None:
+        """Сохранение сессии почтового ящика до принятия клиентом."""
+        expire_handle = asyncio.get_running_loop().call_later(
+            settings.IMAP_SESSION_ADOPTION_TIMEOUT, self.expire, box_id
+        )
+        self.sessions[box_id] = (client, expire_handle)
+
+    def adopt(self, box_id: int) -> aioimaplib.IMAP4 | None:
+        """Принятие сохраненной сессии почтового ящика клиентом."""
+        session = self.sessions.pop(box_id, None)
+        if session is None:
+            return None
+        client, expire_handle = session
+        expire_handle.cancel()
+        logger.info(f'IMAP session of box {box_id} adopted by its listener.')
+        return client
+
+    def expire(self, box_id: int) -> None:
+        """Закрытие сессии, не принятой клиентом вовремя."""
+        session = self.sessions.pop(box_id, None)
+        if session is not None:
+            logger.info(f'IMAP session of box {box_id} was not adopted in time. Logging out.')
+            task = asyncio.create_task(self.logout(session[0]))
+            self._logout_tasks.add(task)
+            task.add_done_callback(self._logout_tasks.discard)
+
+    @staticmethod
+    async def logout(client: aioimaplib.IMAP4) -> None:
+        """LOGOUT без ожидания дольше таймаута команды."""
+        try:
+            await client.logout()
+        except (asyncio.TimeoutError, aioimaplib.AioImapException, OSError) as error:
+            logger.error(f'Logout of a parked IMAP session failed: {error!r}')
+
+    async def close(self) -> None:
+        """Закрытие всех сохраненных сессий при остановке процесса."""
+        box_ids = list(self.sessions)
+        for box_id in box_ids:
+            self.expire(box_id)
+        await asyncio.gather(*self._logout_tasks, return_exceptions=True)
+
+
+imap_sessions = IMAPSessionPool()
@@ -0,0 +1,390 @@
+import asyncio
+import bisect
+import hashlib
+import json
+import logging
+import time
+from typing import Iterable
+
+import redis.asyncio
+from django.conf import settings
+from django.db import DatabaseError
+from email_service.repositories import EmailBoxRepository, EmailDomainRepository
+from infrastructure.dto import EmailBoxWithFiltersDTO, EmailServiceDTO
+from infrastructure.gateways.imap_client import IMAPClient, IMAPStatuses
+from infrastructure.gateways.imap_control import imap_control
+from infrastructure.gateways.imap_sessions import imap_sessions
+from infrastructure.utils.encryption_service import CryptoService
+from redis.asyncio.client import Pipeline
+from redis.exceptions import RedisError
+
+logger = logging.getLogger('infrastructure')
+
+# Продление аренд ящиков узла: только тех ключей, которые все еще принадлежат узлу (ARGV[1]).
+RENEW_LEASES_SCRIPT = """
+local renewed = {}
+for i, key in ipairs(KEYS) do
+    if redis.call('GET', key) == ARGV[1] then
+        redis.call('PEXPIRE', key, ARGV[2])
+        renewed[i] = 1
+    else
+        renewed[i] = 0
+    end
+end
+return renewed
+"""
+
+# Освобождение аренды, только если она принадлежит узлу.
+RELEASE_LEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def ring_hash(value: str) -> int:
+    """Позиция значения на кольце хешей."""
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], 'big')
+
+
+class HashRing:
+    """Консистентное хеширование ящиков по узлам: при смене состава узлов переезжает около 1/N ящиков."""
+
+    def __init__(self, node_ids: list[str], virtual_nodes: int = settings.IMAP_SHARD_VIRTUAL_NODES):
+        self.node_ids = sorted(node_ids)
+        points = sorted(
+            (ring_hash(f'{node_id}#{index}'), node_id) for node_id in self.node_ids for index in range(virtual_nodes)
+        )
+        self._hashes = [point for point, _ in points]
+        self._nodes = [node_id for _, node_id in points]
+
+    def owner(self, box_id: int) -> str | None:
+        """Узел, которому принадлежит почтовый ящик."""
+        if not self._nodes:
+            return None
+        index = bisect.bisect(self._hashes, ring_hash(str(box_id))) % len(self._nodes)
+        return self._nodes[index]
+
+
+def build_imap_client(
+        box_with_filters: EmailBoxWithFiltersDTO,
+        services: dict[int, EmailServiceDTO],
+        crypto_service: CryptoService
+) -> IMAPClient:
+    """Создание клиента IMAP почтового ящика."""
+    box = box_with_filters.box
+    return IMAPClient(
+        service=services[box.email_service_id],
+        user=box.email_username,
+        password=crypto_service.decrypt_password(box.email_password),
+        telegram_id=box.user_id_id,
+        box_id=box.id,
+        whitelist={filter_obj.filter_value for filter_obj in box_with_filters.filters}
+    )
+
+
+class IMAPShardCoordinator:
+    """
+    Распределение почтовых ящиков между узлами-слушателями.
+    Узлы отмечаются в ZSET (heartbeat), ящики делятся консистентным хешированием по живым узлам,
+    а клиент запускается только после получения аренды ящика в Redis (SET NX с TTL), поэтому один ящик
+    никогда не слушают два узла: новый владелец ждет, пока прежний остановит клиент и освободит аренду.
+    Передача и захват ящиков ограничены IMAP_SHARD_ACQUIRE_BATCH за шаг, а подключения пачки распределены
+    по интервалу heartbeat, поэтому новый узел принимает ящики постепенно, без одновременного переподключения.
+    Аренды продлеваются отдельной задачей (keep_leases), которую не задерживают ни запросы к БД,
+    ни остановка клиентов; если аренды не удается продлить дольше их TTL, узел сам останавливает свои клиенты.
+    Набор ящиков узла хранится в памяти: полностью он перечитывается из БД только при смене состава узлов,
+    а новые ящики добавляются по счетчику поколений и журналу созданных ящиков в Redis.
+    """
+
+    def __init__(self):
+        self.node_id = settings.NODE_ID
+        self.ring = HashRing([])
+        self.clients: dict[int, IMAPClient] = {}
+        self.loops: dict[int, asyncio.Task] = {}
+        self.leases_valid_until = 0.0
+        self.lost: set[int] = set()
+        self.owned: set[int] = set()
+        self.owned_generation: int | None = None
+        self._connection: redis.asyncio.Redis | None = None
+        self._renew_leases = None
+        self._release_lease = None
+
+    @staticmethod
+    def lease_key(box_id: int) -> str:
+        """Ключ аренды почтового ящика."""
+        return settings.IMAP_SHARD_LEASE_KEY_FORMAT.format(box_id=box_id)
+
+    def _get_connection(self) -> redis.asyncio.Redis:
+        """Подключение к Redis и регистрация скриптов аренд."""
+        if self._connection is None:
+            self._connection = redis.asyncio.from_url(settings.CACHES['default']['LOCATION'])
+            self._renew_leases = self._connection.register_script(RENEW_LEASES_SCRIPT)
+            self._release_lease = self._connection.register_script(RELEASE_LEASE_SCRIPT)
+        return self._connection
+
+    async def heartbeat(self) -> tuple[list[str], int]:
+        """
+        Отметка активности узла, удаление неактивных узлов, получение списка живых узлов
+        и текущего поколения набора ящиков.
+        """
+        now = time.time()
+        pipe: Pipeline = self._get_connection().pipeline(transaction=False)
+        async with pipe:
+            pipe.zadd(settings.IMAP_SHARD_NODES_KEY, {self.node_id: now})
+            pipe.zremrangebyscore(settings.IMAP_SHARD_NODES_KEY, '-inf', now - settings.IMAP_SHARD_NODE_TTL)
+            pipe.zrange(settings.IMAP_SHARD_NODES_KEY, 0, -1)
+            pipe.get(settings.IMAP_SHARD_BOXES_GENERATION_KEY)
+            *_, node_ids, generation = await pipe.execute()
+        return [node_id.decode() for node_id in node_ids], int(generation or 0)
+
+    async def read_new_boxes(self, since: int) -> tuple[int, list[int] | None]:
+        """
+        Текущее поколение набора ящиков и ящики, созданные после поколения since;
+        None - журнал созданных ящиков уже не покрывает разрыв и нужно полное перечитывание.
+        """
+        pipe: Pipeline = self._get_connection().pipeline(transaction=True)
+        async with pipe:
+            pipe.get(settings.IMAP_SHARD_BOXES_GENERATION_KEY)
+            pipe.lrange(settings.IMAP_SHARD_NEW_BOXES_KEY, 0, -1)
+            generation, entries = await pipe.execute()
+        generation = int(generation or 0)
+        first_generation = generation - len(entries) + 1
+        if generation < since or since + 1 < first_generation:
+            return generation, None
+        return generation, [int(box_id) for box_id in entries[max(since + 1 - first_generation, 0):]]
+
+    async def scan_owned(self, node_ids: list[str], generation: int) -> None:
+        """Полное перечитывание ящиков узла из БД: при старте узла и смене состава узлов."""
+        ring = HashRing(node_ids)
+        box_ids = await EmailBoxRepository.get_active_users_box_ids()
+        self.ring = ring
+        self.owned = {box_id for box_id in box_ids if ring.owner(box_id) == self.node_id}
+        self.owned_generation = generation
+
+    async def update_owned(self, node_ids: list[str], generation: int) -> None:
+        """
+        Обновление ящиков узла: полное перечитывание только при смене состава узлов или разрыве журнала,
+        иначе добавление созданных после прошлого шага ящиков. Удаленные ящики отбрасывает start_clients.
+        """
+        if self.owned_generation is None or sorted(node_ids) != self.ring.node_ids:
+            await self.scan_owned(node_ids, generation)
+            return
+        if generation == self.owned_generation:
+            return
+        generation, new_box_ids = await self.read_new_boxes(self.owned_generation)
+        if new_box_ids is None:
+            await self.scan_owned(node_ids, generation)
+            return
+        self.owned.update(box_id for box_id in new_box_ids if self.ring.owner(box_id) == self.node_id)
+        self.owned_generation = generation
+
+    async def renew_leases(self) -> set[int]:
+        """
+        Продление аренд запущенных ящиков одним скриптом; возвращает ящики, аренда которых потеряна.
+        Ящики, остановленные или перезапущенные во время продления, потерянными не считаются.
+        """
+        loops = dict(self.loops)
+        if not loops:
+            return set()
+        renewed = await self._renew_leases(
+            keys=[self.lease_key(box_id) for box_id in loops],
+            args=[self.node_id, settings.IMAP_SHARD_LEASE_TTL * 1000]
+        )
+        return {
+            box_id for (box_id, loop), is_renewed in zip(loops.items(), renewed)
+            if not is_renewed and self.loops.get(box_id) is loop
+        }
+
+    async def keep_leases(self) -> None:
+        """
+        Продление аренд каждые IMAP_SHARD_LEASE_RENEW_INTERVAL в отдельной задаче узла.
+        Ящики с потерянной арендой останавливает ближайший шаг распределения, который запускается сразу.
+        """
+        while True:
+            started = time.monotonic()
+            try:
+                lost = await self.renew_leases()
+            except RedisError as error:
+                logger.error(f'Renewing IMAP box leases failed: {error}')
+                await self.release_if_leases_expired()
+            else:
+                self.leases_valid_until = started + settings.IMAP_SHARD_LEASE_TTL
+                if lost:
+                    self.lost |= lost
+                    imap_control.rebalance_event.set()
+            await asyncio.sleep(settings.IMAP_SHARD_LEASE_RENEW_INTERVAL)
+
+    async def release_if_leases_expired(self) -> None:
+        """Остановка всех клиентов узла, если аренды не продлевались дольше их TTL."""
+        if self.loops and time.monotonic() > self.leases_valid_until:
+            logger.error(f'Node {self.node_id} lost its leases, stopping {len(self.loops)} clients')
+            await self.release_all()
+
+    async def acquire_leases(self, box_ids: list[int]) -> list[int]:
+        """Получение аренд свободных ящиков одним конвейером SET NX; возвращает полученные."""
+        if not box_ids:
+            return []
+        started = time.monotonic()
+        pipe: Pipeline = self._get_connection().pipeline(transaction=False)
+        async with pipe:
+            for box_id in box_ids:
+                pipe.set(self.lease_key(box_id), self.node_id, nx=True, px=settings.IMAP_SHARD_LEASE_TTL * 1000)
+            results = await pipe.execute()
+        if not self.loops:
+            self.leases_valid_until = started + settings.IMAP_SHARD_LEASE_TTL
+        return [box_id for box_id, acquired in zip(box_ids, results) if acquired]
+
+    async def start_clients(self, box_ids: list[int]) -> None:
+        """Запуск клиентов IMAP ящиков, аренды которых получены узлом."""
+        boxes_with_filters = await EmailBoxRepository.get_active_users_boxes_with_filters(box_ids)
+        services = {service.id: service for service in await EmailDomainRepository.get_services()}
+        crypto_service = CryptoService(settings.CRYPTO_KEY)
+        start_interval = settings.IMAP_SHARD_HEARTBEAT_INTERVAL / max(len(boxes_with_filters), 1)
+        for index, box_with_filters in enumerate(boxes_with_filters):
+            box = box_with_filters.box
+            imap_client = build_imap_client(box_with_filters, services, crypto_service)
+            imap_client.connection_manager.client = imap_sessions.adopt(box.id)
+            initial_state = IMAPStatuses.ACTIVE.value if box.is_active else IMAPStatuses.PAUSED.value
+            delay = 0 if imap_client.connection_manager.client else index * start_interval
+            self.clients[box.id] = imap_client
+            self.loops[box.id] = asyncio.create_task(self.run_client(imap_client, initial_state, delay))
+        for box_id in set(box_ids) - {box_with_filters.box.id for box_with_filters in boxes_with_filters}:
+            self.owned.discard(box_id)
+            await self._release_lease(keys=[self.lease_key(box_id)], args=[self.node_id])
+
+    @staticmethod
+    async def run_client(imap_client: IMAPClient, initial_state: str, delay: float) -> None:
+        """Запуск клиента с задержкой, распределяющей подключения пачки по времени."""
+        await asyncio.sleep(delay)
+        if not imap_client.released:
+            await imap_client.imap_loop(initial_state=initial_state)
+
+    async def release_clients(self, box_ids: Iterable[int], timeout: float) -> None:
+        """
+        Остановка клиентов ящиков без изменения их статуса: ожидание обработки текущих писем и LOGOUT
+        не дольше timeout, затем освобождение аренд для новых владельцев.
+        Клиенты сразу снимаются с узла, поэтому одновременные вызовы не останавливают один клиент дважды.
+        """
+        released = {
+            box_id: (self.clients.pop(box_id), self.loops.pop(box_id)) for box_id in box_ids if box_id in self.loops
+        }
+        for imap_client, _ in released.values():
+            await imap_client.release()
+        running = [loop for _, loop in released.values() if not loop.done()]
+        if running:
+            _, pending = await asyncio.wait(running, timeout=timeout)
+            for loop in pending:
+                loop.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        for box_id, (_, loop) in released.items():
+            if not loop.cancelled() and loop.exception() is not None:
+                logger.error(f'IMAP client for box {box_id} failed while released: {loop.exception()!r}')
+        try:
+            await asyncio.gather(*(
+                self._release_lease(keys=[self.lease_key(box_id)], args=[self.node_id]) for box_id in released
+            ))
+        except RedisError as error:
+            logger.error(f'Releasing IMAP box leases failed, they will expire: {error}')
+
+    async def release_all(self) -> None:
+        """Остановка всех клиентов узла и освобождение их аренд."""
+        await self.release_clients(list(self.loops), settings.IMAP_SHARD_RELEASE_TIMEOUT)
+
+    def _collect_finished(self) -> list[int]:
+        """Удаление завершившихся клиентов (ящик удален или ошибка клиента)."""
+        finished = [box_id for box_id, loop in self.loops.items() if loop.done()]
+        for box_id in finished:
+            loop = self.loops.pop(box_id)
+            self.clients.pop(box_id, None)
+            if not loop.cancelled() and loop.exception() is not None:
+                logger.error(f'IMAP client for box {box_id} failed: {loop.exception()!r}')
+        return finished
+
+    async def rebalance(self) -> None:
+        """Один шаг распределения: heartbeat, остановка ящиков с потерянной арендой, передача чужих и захват своих."""
+        node_ids, generation = await self.heartbeat()
+        await self.update_owned(node_ids, generation)
+        for box_id in self._collect_finished():
+            await self._release_lease(keys=[self.lease_key(box_id)], args=[self.node_id])
+        owned = self.owned
+        lost, self.lost = self.lost & set(self.loops), set()
+        to_hand_over = sorted(set(self.loops) - owned - lost)[:settings.IMAP_SHARD_ACQUIRE_BATCH]
+        to_release = lost | set(to_hand_over)
+        if to_release:
+            logger.info(f'Node {self.node_id} hands over {len(to_release)} boxes')
+            await self.release_clients(to_release, settings.IMAP_SHARD_RELEASE_TIMEOUT)
+        to_acquire = sorted(owned - set(self.loops))[:settings.IMAP_SHARD_ACQUIRE_BATCH]
+        acquired = await self.acquire_leases(to_acquire)
+        if acquired:
+            logger.info(f'Node {self.node_id} starts {len(acquired)} boxes')
+            await self.start_clients(acquired)
+
+    async def run(self) -> None:
+        """
+        Периодическое распределение ящиков с интервалом IMAP_SHARD_HEARTBEAT_INTERVAL
+        или сразу после команды rebalance в канале управления.
+        Ошибка шага (Redis, БД или любая другая) не останавливает цикл: шаг повторяется на следующем интервале.
+        """
+        while True:
+            imap_control.rebalance_event.clear()
+            try:
+                await self.rebalance()
+            except (RedisError, DatabaseError) as error:
+                logger.error(f'IMAP shard rebalance failed: {error!r}')
+                await self.release_if_leases_expired()
+            except Exception:
+                logger.exception('IMAP shard rebalance failed')
+                await self.release_if_leases_expired()
+            try:
+                await asyncio.wait_for(imap_control.rebalance_event.wait(), settings.IMAP_SHARD_HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    async def leave(self) -> list[str]:
+        """Удаление узла из кольца; возвращает другие живые узлы."""
+        now = time.time()
+        pipe: Pipeline = self._get_connection().pipeline(transaction=False)
+        async with pipe:
+            pipe.zrem(settings.IMAP_SHARD_NODES_KEY, self.node_id)
+            pipe.zrangebyscore(settings.IMAP_SHARD_NODES_KEY, now - settings.IMAP_SHARD_NODE_TTL, '+inf')
+            _, node_ids = await pipe.execute()
+        return [node_id.decode() for node_id in node_ids]
+
+    async def request_rebalance(self) -> None:
+        """Команда остальным узлам немедленно пересчитать распределение ящиков."""
+        await self._get_connection().publish(
+            settings.IMAP_CONTROL_CHANNEL, json.dumps({'rebalance': True, 'box_ids': []})
+        )
+
+    async def shutdown(self) -> None:
+        """
+        Плановая остановка узла в пределах IMAP_SHUTDOWN_TIMEOUT (вызывается после остановки run).
+        Узел выходит из кольца; если есть другие узлы, первая половина срока уходит на передачу ящиков
+        пачками по IMAP_SHARD_ACQUIRE_BATCH с командой rebalance после каждой пачки, чтобы новые владельцы
+        подключались постепенно. Оставшиеся ящики освобождаются параллельно до конца срока.
+        """
+        deadline = time.monotonic() + settings.IMAP_SHUTDOWN_TIMEOUT
+        handover_deadline = deadline - settings.IMAP_SHUTDOWN_TIMEOUT / 2
+        try:
+            other_nodes = await self.leave()
+        except RedisError as error:
+            logger.error(f'IMAP shard node {self.node_id} could not leave the ring: {error}')
+            other_nodes = []
+        logger.info(f'Node {self.node_id} shutting down: {len(self.loops)} boxes, {len(other_nodes)} other nodes')
+        if other_nodes:
+            box_ids = sorted(self.loops)
+            for start in range(0, len(box_ids), settings.IMAP_SHARD_ACQUIRE_BATCH):
+                remaining = handover_deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                await self.release_clients(box_ids[start:start + settings.IMAP_SHARD_ACQUIRE_BATCH], remaining)
+                try:
+                    await self.request_rebalance()
+                except RedisError:
+                    pass
+        await self.release_clients(list(self.loops), max(deadline - time.monotonic(), 0))
+
+
+imap_shards = IMAPShardCoordinator()
@@ -1,9 +1,33 @@
+import asyncio
 import functools
+import json
+import random
 from typing import Any, Callable
 
+from asgiref.sync import sync_to_async
 from django.conf import settings
-from django.core.cache import cache
+from django.core.cache import cache, caches
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
+from django.utils.connection import ConnectionProxy
 from django_redis import get_redis_connection
+from infrastructure.gateways.cache_serializer import MissingObject
+
+repository_cache = ConnectionProxy(caches, settings.REPOSITORY_CACHE_ALIAS)
+
+# Чтение счетчиков поколений (MGET) и значения по построенному из них ключу за один запрос к Redis.
+GENERATIONAL_GET_SCRIPT = """
+local generations = redis.call('MGET', unpack(KEYS))
+local key = ARGV[1]
+for _, generation in ipairs(generations) do
+    key = key .. ':' .. (generation or '0')
+end
+local result = {redis.call('GET', key)}
+for i, generation in ipairs(generations) do
+    result[i + 1] = generation
+end
+return result
+"""
 
 
 class RedisClient:
@@ -11,17 +35,20 @@ class RedisClient:
 
     def __init__(self):
         self.client = get_redis_connection('default')
+        self.repository_client = get_redis_connection(settings.REPOSITORY_CACHE_ALIAS)
+        self._generational_get = self.repository_client.register_script(GENERATIONAL_GET_SCRIPT)
+        self._inflight: dict[str, asyncio.Task] = {}
 
     def _make_key(self, key: str | bytes) -> str:
         """Получить ключ с указанием версии."""
         return cache.make_key(key)
 
-    async def get(self, key: str | bytes) -> str | None:
-        """Асинхронное получение значения по ключу."""
+    async def get(self, key: str | bytes) -> Any:
+        """Асинхронное получение значения по ключу (None, если ключа нет)."""
         return await cache.aget(key)
 
-    async def set(self, key: str | bytes, value: str | bytes, timeout: int | None = None) -> None:
-        """Асинхронное добавление ключа и значения в Redis."""
+    async def set(self, key: str | bytes, value: Any, timeout: int | None = None) -> None:
+        """Асинхронное добавление ключа и значения (сериализуется кешем) в Redis."""
         await cache.aset(key, value, timeout=timeout)
 
     async def delete(self, key: str | bytes) -> int:
@@ -45,8 +72,8 @@ class RedisClient:
 
         return list(telegram_ids)
 
-    def set_sync(self, key: str | bytes, value: str | bytes, timeout: int | None = None):
-        """Синхронное добавление ключа и значения в Redis."""
+    def set_sync(self, key: str | bytes, value: Any, timeout: int | None = None):
+        """Синхронное добавление ключа и значения (сериализуется кешем) в Redis."""
         return cache.set(key, value, timeout=timeout)
 
     def exists_sync(self, key: str | bytes) -> bool:
@@ -80,42 +107,172 @@ class RedisClient:
         """Синхроная установка времени жизни ключа."""
         return cache.touch(key, timeout)
 
-    def cache_result(self, key_format: str, timeout: int = settings.CACHE_TIMEOUT) -> Callable:
-        """Декоратор для кеширования результатов функции"""
+    @staticmethod
+    def _jittered_timeout(timeout: int) -> int:
+        """Разброс времени жизни ключа, чтобы записи не истекали одновременно."""
+        spread = int(timeout * settings.CACHE_TIMEOUT_JITTER)
+        return timeout + random.randint(-spread, spread)
+
+    async def _load_and_cache(self, cache_key: str, timeout: int, func: Callable, *args: Any, **kwargs: Any) -> Any:
+        """Загрузка значения из источника и запись результата (или его отсутствия) в кеш."""
+        try:
+            result = await func(*args, **kwargs)
+        except ObjectDoesNotExist as error:
+            await repository_cache.aset(cache_key, MissingObject.from_error(error),
+                                        timeout=settings.CACHE_NEGATIVE_TIMEOUT)
+            raise
+        await repository_cache.aset(cache_key, result, timeout=self._jittered_timeout(timeout))
+        return result
+
+    def _release_inflight(self, cache_key: str, task: asyncio.Task) -> None:
+        """Снятие завершенной загрузки из списка выполняющихся."""
+        self._inflight.pop(cache_key, None)
+        if not task.cancelled():
+            task.exception()
+
+    @staticmethod
+    def _bind_arguments(func: Callable, args: tuple, kwargs: dict[str, Any]) -> dict[str, Any]:
+        """Сопоставление позиционных аргументов функции с их именами для форматирования ключей."""
+        all_args = {**kwargs}
+        for i, arg in enumerate(args):
+            all_args[func.__code__.co_varnames[i]] = arg
+        return all_args
+
+    def _get_generational_sync(self, key: str, generation_keys: list[str]) -> tuple[str, Any]:
+        """
+        Синхронное получение значения по ключу с текущими номерами поколений за один запрос к Redis.
+        Возвращает итоговый ключ (для записи при промахе) и значение или None.
+        """
+        value, *generations = self._generational_get(
+            keys=[repository_cache.make_key(generation_key) for generation_key in generation_keys],
+            args=[repository_cache.make_key(key)]
+        )
+        cache_key = ':'.join([key, *(generation.decode() if generation else '0' for generation in generations)])
+        return cache_key, repository_cache.client.decode(value) if value is not None else None
+
+    async def _get_generational(self, key: str, generation_keys: list[str]) -> tuple[str, Any]:
+        """Асинхронное получение значения по ключу с добавленными номерами поколений, от которых оно зависит."""
+        if not generation_keys:
+            return key, await repository_cache.aget(key)
+        return await sync_to_async(self._get_generational_sync)(key, generation_keys)
+
+    def bump_generations(self, generation_keys: list[str]) -> None:
+        """
+        Синхронное атомарное увеличение счетчиков поколений одним запросом к Redis.
+        Все ключи кеша, построенные на прежних поколениях, перестают читаться и истекают по TTL.
+        """
+        with self.repository_client.pipeline() as pipe:
+            for generation_key in generation_keys:
+                pipe.incr(repository_cache.make_key(generation_key))
+            pipe.execute()
+
+    def bump_generations_on_commit(self, generation_keys: list[str]) -> None:
+        """Увеличение счетчиков поколений после фиксации текущей транзакции (или сразу в autocommit)."""
+        transaction.on_commit(functools.partial(self.bump_generations, generation_keys))
+
+    def update_boxes_state(
+            self,
+            status_keys: dict[str, str],
+            generation_keys: list[str],
+            control_message: dict[str, Any]
+    ) -> None:
+        """
+        Синхронная запись статусов клиентов IMAP, увеличение счетчиков поколений кеша
+        и публикация команды в канал управления клиентами IMAP одним конвейером Redis.
+        """
+        with self.client.pipeline(transaction=False) as pipe:
+            for key, status in status_keys.items():
+                pipe.set(cache.make_key(key), cache.client.encode(status))
+            for generation_key in generation_keys:
+                pipe.incr(repository_cache.make_key(generation_key))
+            pipe.publish(settings.IMAP_CONTROL_CHANNEL, json.dumps(control_message))
+            pipe.execute()
+
+    async def publish_control(self, control_message: dict[str, Any]) -> None:
+        """Асинхронная публикация команды в канал управления клиентами IMAP."""
+        await sync_to_async(self.client.publish)(settings.IMAP_CONTROL_CHANNEL, json.dumps(control_message))
+
+    def publish_new_box_sync(self, box_id: int) -> None:
+        """
+        Синхронное увеличение поколения набора ящиков, запись ящика в журнал созданных ящиков
+        и команда rebalance в канал управления одной транзакцией Redis.
+        По поколению и журналу узлы-слушатели добавляют новый ящик, не перечитывая все ящики из БД.
+        """
+        with self.client.pipeline() as pipe:
+            pipe.incr(settings.IMAP_SHARD_BOXES_GENERATION_KEY)
+            pipe.rpush(settings.IMAP_SHARD_NEW_BOXES_KEY, box_id)
+            pipe.ltrim(settings.IMAP_SHARD_NEW_BOXES_KEY, -settings.IMAP_SHARD_NEW_BOXES_LOG_SIZE, -1)
+            pipe.publish(settings.IMAP_CONTROL_CHANNEL, json.dumps({'rebalance': True, 'box_ids': [box_id]}))
+            pipe.execute()
+
+    async def publish_new_box(self, box_id: int) -> None:
+        """Асинхронная публикация созданного ящика для узлов-слушателей."""
+        await sync_to_async(self.publish_new_box_sync)(box_id)
+
+    async def enqueue_provisioning_job(self, job_message: dict[str, Any]) -> None:
+        """Асинхронная постановка задачи создания почтового ящика в очередь узлов-слушателей."""
+        await sync_to_async(self.client.rpush)(settings.BOX_PROVISIONING_QUEUE_KEY, json.dumps(job_message))
+
+    def update_boxes_state_on_commit(
+            self,
+            status_keys: dict[str, str],
+            generation_keys: list[str],
+            control_message: dict[str, Any]
+    ) -> None:
+        """Обновление статусов, поколений и отправка команды после фиксации текущей транзакции."""
+        transaction.on_commit(functools.partial(self.update_boxes_state, status_keys, generation_keys, control_message))
+
+    def cache_result(
+            self,
+            key_format: str,
+            generation_format_list: list[str] | None = None,
+            timeout: int = settings.CACHE_TIMEOUT
+    ) -> Callable:
+        """
+        Декоратор для кеширования результатов функции в кеше репозиториев (msgpack, версия схемы в ключе).
+        Ключ включает номера поколений из generation_format_list, поэтому инвалидация не требует удаления ключей.
+        Одновременные промахи по одному ключу ожидают один общий запрос к источнику,
+        а отсутствие объекта (DoesNotExist) кешируется на короткое время.
+        """
 
         def decorator(func: Callable) -> Callable:
 
             @functools.wraps(func)
             async def wrapper(*args: Any, **kwargs: Any) -> Any:
-                all_args = {**kwargs}
-                for i, arg in enumerate(args):
-                    all_args[func.__code__.co_varnames[i]] = arg
-                cache_key = key_format.format(**all_args)
-                cached_value = cache.get(cache_key)
+                all_args = self._bind_arguments(func, args, kwargs)
+                generation_keys = [generation_format.format(**all_args)
+                                   for generation_format in generation_format_list or []]
+                cache_key, cached_value = await self._get_generational(key_format.format(**all_args), generation_keys)
+                if isinstance(cached_value, MissingObject):
+                    raise cached_value.error_class()
                 if cached_value is not None:
                     return cached_value
-                result = await func(*args, **kwargs)
-                cache.set(cache_key, result, timeout=timeout)
-                return result
+                task = self._inflight.get(cache_key)
+                if task is None:
+                    task = asyncio.create_task(self._load_and_cache(cache_key, timeout, func, *args, **kwargs))
+                    self._inflight[cache_key] = task
+                    task.add_done_callback(functools.partial(self._release_inflight, cache_key))
+                return await asyncio.shield(task)
 
             return wrapper
 
         return decorator
 
-    def invalidate_cache(self, key_format_list: list[str]) -> Callable:
-        """Инвалидация кеша на основании полученных форматов ключей."""
+    def invalidate_cache(self, generation_format_list: list[str]) -> Callable:
+        """
+        Инвалидация кеша после записи: увеличение счетчиков поколений, полученных из форматов ключей.
+        Счетчики увеличиваются только после фиксации транзакции, в которой выполнялась запись,
+        поэтому параллельное чтение не может закешировать устаревшие данные под новым поколением.
+        """
 
         def decorator(func: Callable) -> Callable:
 
             @functools.wraps(func)
             async def wrapper(*args: Any, **kwargs: Any) -> Any:
-                all_args = {**kwargs}
-                for i, arg in enumerate(args):
-                    all_args[func.__code__.co_varnames[i]] = arg
-                for key_format in key_format_list:
-                    cache_key = key_format.format(**all_args)
-                    await cache.adelete(cache_key)
+                all_args = self._bind_arguments(func, args, kwargs)
                 result = await func(*args, **kwargs)
+                generation_keys = [generation_format.format(**all_args) for generation_format in generation_format_list]
+                await sync_to_async(self.bump_generations_on_commit)(generation_keys)
                 return result
 
             return wrapper
@@ -0,0 +1,120 @@
+import operator
+from functools import reduce
+from typing import Any, Iterator
+
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections, models
+from django.db.models import Q, QuerySet
+from django.forms import Media
+from django.http import HttpRequest
+from django.utils.functional import cached_property
+
+MAX_BIGINT = 2 ** 63 - 1
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Пагинатор для больших таблиц: для выборки без фильтров берет оценку количества строк
+    из статистики PostgreSQL (pg_class.reltuples) вместо COUNT(*) по всей таблице.
+    """
+
+    @cached_property
+    def count(self) -> int:
+        """Оценка количества строк для больших таблиц без фильтров, иначе точное количество."""
+        object_list = self.object_list
+        if isinstance(object_list, QuerySet) and not object_list.query.where:
+            connection = connections[object_list.db]
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        'SELECT reltuples::bigint FROM pg_class WHERE relname = %s',
+                        [object_list.model._meta.db_table]
+                    )
+                    row = cursor.fetchone()
+                if row and row[0] >= settings.ADMIN_ESTIMATED_COUNT_THRESHOLD:
+                    return row[0]
+        return super().count
+
+
+class NumericSearchMixin:
+    """
+    Поиск в админ-панели по точному совпадению числовых полей из search_fields.
+    Использует индексы вместо LIKE по приведенному к строке значению; нечисловой запрос ничего не находит.
+    """
+
+    def get_search_lookups(self, request: HttpRequest, search_term: str) -> dict[str, int] | None:
+        """
+        Условия поиска, объединяемые через OR: пустой словарь - поиск не задан,
+        None - запрос нечисловой и ничего не находит.
+        """
+        search_term = search_term.strip()
+        if not search_term:
+            return {}
+        if not search_term.isdigit() or int(search_term) > MAX_BIGINT:
+            return None
+        return {field: int(search_term) for field in self.get_search_fields(request)}  # type: ignore
+
+    def get_search_results(self, request: HttpRequest, queryset: QuerySet, search_term: str) -> tuple[QuerySet, bool]:
+        """Фильтрация выборки по точному значению числовых полей."""
+        search_lookups = self.get_search_lookups(request, search_term)
+        if search_lookups is None:
+            return queryset.none(), False
+        if not search_lookups:
+            return queryset, False
+        search_query = reduce(operator.or_, (Q(**{field: value}) for field, value in search_lookups.items()))
+        return queryset.filter(search_query), False
+
+
+class AutocompleteListFilter(admin.FieldListFilter):
+    """
+    Фильтр списка по внешнему ключу с полем автодополнения вместо списка всех связанных объектов.
+    Связанная модель должна быть зарегистрирована в админ-панели с search_fields.
+    """
+
+    template = 'admin/autocomplete_list_filter.html'
+
+    def __init__(
+            self,
+            field: models.ForeignKey,
+            request: HttpRequest,
+            params: dict[str, str],
+            model: type[models.Model],
+            model_admin: admin.ModelAdmin,
+            field_path: str
+    ):
+        self.lookup_kwarg = f'{field_path}__{field.target_field.name}__exact'
+        self.lookup_val = params.get(self.lookup_kwarg)
+        super().__init__(field, request, params, model, model_admin, field_path)
+        self.widget_id = f'autocomplete_list_filter_{field_path}'
+        widget = field.formfield(widget=AutocompleteSelect(field, model_admin.admin_site), required=False).widget
+        try:
+            self.rendered_widget = widget.render(name=self.lookup_kwarg, value=self.lookup_val,
+                                                 attrs={'id': self.widget_id})
+        except (ValueError, ValidationError):
+            self.rendered_widget = widget.render(name=self.lookup_kwarg, value=None, attrs={'id': self.widget_id})
+
+    def expected_parameters(self) -> list[str]:
+        """Параметры строки запроса, которые обрабатывает фильтр."""
+        return [self.lookup_kwarg]
+
+    def has_output(self) -> bool:
+        """Фильтр отображается всегда, так как варианты загружаются автодополнением."""
+        return True
+
+    def choices(self, changelist: ChangeList) -> Iterator[dict[str, Any]]:
+        """Вариант сброса фильтра; выбранное значение показывает поле автодополнения."""
+        yield {
+            'selected': self.lookup_val is None,
+            'query_string': changelist.get_query_string(remove=[self.lookup_kwarg]),
+            'display': 'Все',
+        }
+
+    @staticmethod
+    def get_media(field: models.ForeignKey, admin_site: admin.AdminSite) -> Media:
+        """Скрипты и стили поля автодополнения для подключения в media модели админ-панели."""
+        return AutocompleteSelect(field, admin_site).media
@@ -0,0 +1,133 @@
+import os
+import time
+from contextlib import contextmanager, nullcontext
+from enum import Enum
+from typing import Iterator
+
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse
+from infrastructure.utils.tracing import Span, current_span_context, start_span
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    start_http_server,
+)
+
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+DELIVERY_LAG_BUCKETS = (1, 2, 5, 10, 20, 30, 60, 120, 300, 600, 1800, 3600, 21600)
+
+
+class PipelineStages(Enum):
+    """Этапы обработки письма от получения с сервера IMAP до отправки в Telegram."""
+
+    IMAP_FETCH_HEADERS = 'imap_fetch_headers'
+    IMAP_FETCH_BODY = 'imap_fetch_body'
+    DECODE = 'decode'
+    FILTER = 'filter'
+    RENDER = 'render'
+    TELEGRAM_SEND = 'telegram_send'
+
+
+class EmailOutcomes(Enum):
+    """Итоги обработки письма."""
+
+    FILTERED = 'filtered'
+    DELIVERED = 'delivered'
+    FAILED = 'failed'
+    REDELIVERED = 'redelivered'
+
+
+PIPELINE_STAGE_SECONDS = Histogram(
+    'email_pipeline_stage_seconds',
+    'Длительность этапа обработки письма',
+    ['stage'],
+    buckets=STAGE_BUCKETS
+)
+EMAIL_DELIVERY_LAG_SECONDS = Histogram(
+    'email_delivery_lag_seconds',
+    'Задержка от INTERNALDATE письма на сервере IMAP до доставки в Telegram',
+    buckets=DELIVERY_LAG_BUCKETS
+)
+EMAILS_TOTAL = Counter(
+    'emails',
+    'Количество обработанных писем по итогу обработки',
+    ['outcome']
+)
+IMAP_COMPRESSED_BYTES_TOTAL = Counter(
+    'imap_compressed_bytes',
+    'Трафик сессий IMAP со сжатием COMPRESS=DEFLATE: payload - до сжатия, wire - передано по сети',
+    ['host', 'direction', 'layer']
+)
+IMAP_HANDSHAKE_SECONDS = Histogram(
+    'imap_handshake_seconds',
+    'Длительность установки соединения TCP и TLS с сервером IMAP: new - полное рукопожатие, resumed - возобновление',
+    ['host', 'tls_session'],
+    buckets=STAGE_BUCKETS
+)
+IMAP_DNS_LOOKUPS_TOTAL = Counter(
+    'imap_dns_lookups',
+    'Разрешение имени сервера IMAP при подключении: cached - из кеша процесса, resolved - запрос DNS',
+    ['host', 'result']
+)
+IMAP_CIRCUIT_TRANSITIONS_TOTAL = Counter(
+    'imap_circuit_transitions',
+    'Переключения автомата защиты сервера IMAP: open - подключения приостановлены, half_open - пробное подключение',
+    ['host', 'state']
+)
+
+
+@contextmanager
+def track_stage(stage: PipelineStages) -> Iterator[Span | None]:
+    """Замер длительности этапа обработки письма и спан этапа, если письмо трассируется."""
+    stage_span = start_span(f'email.{stage.value}', stage=stage.value) if current_span_context.get() else nullcontext()
+    started = time.perf_counter()
+    try:
+        with stage_span as span:
+            yield span
+    finally:
+        PIPELINE_STAGE_SECONDS.labels(stage=stage.value).observe(time.perf_counter() - started)
+
+
+def record_outcome(outcome: EmailOutcomes) -> None:
+    """Учет итога обработки письма."""
+    EMAILS_TOTAL.labels(outcome=outcome.value).inc()
+
+
+def record_delivery_lag(received_at: float | None) -> None:
+    """Учет задержки доставки письма относительно его INTERNALDATE (unix time)."""
+    if received_at is not None:
+        EMAIL_DELIVERY_LAG_SECONDS.observe(max(time.time() - received_at, 0))
+
+
+def get_registry() -> CollectorRegistry:
+    """
+    Реестр метрик для выдачи.
+    В многопроцессном режиме (задан PROMETHEUS_MULTIPROC_DIR) собирает значения всех процессов из файлов каталога.
+    """
+    if not os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def metrics_view(request: HttpRequest) -> HttpResponse:
+    """Выдача метрик в текстовом формате Prometheus."""
+    return HttpResponse(generate_latest(get_registry()), content_type=CONTENT_TYPE_LATEST)
+
+
+def start_worker_metrics_server() -> None:
+    """Запуск HTTP сервера метрик в главном процессе Celery worker (0 в WORKER_METRICS_PORT отключает)."""
+    if settings.WORKER_METRICS_PORT:
+        start_http_server(settings.WORKER_METRICS_PORT, registry=get_registry())
+
+
+def mark_worker_process_dead(pid: int) -> None:
+    """Удаление файлов метрик завершившегося дочернего процесса Celery worker."""
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.mark_process_dead(pid)
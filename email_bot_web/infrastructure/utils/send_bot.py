@@ -7,6 +7,13 @@ import httpx
 import requests
 from django.conf import settings
 from infrastructure.gateways.redis_client import redis_client
+from infrastructure.utils.metrics import (
+    EmailOutcomes,
+    PipelineStages,
+    record_outcome,
+    track_stage,
+)
+from infrastructure.utils.tracing import get_traceparent
 
 MAX_MESSAGE_LENGTH = 1000
 
@@ -64,12 +71,19 @@ def send_photo_to_telegram_sync(image_bytes: bytes, telegram_id: int) -> dict[st
     files = {
         'photo': image_bytes
     }
-    response = requests.post(settings.TELEGRAM_SEND_PHOTO_URL, data=data, files=files)
-    if response.status_code != HTTPStatus.OK:
+    with track_stage(PipelineStages.TELEGRAM_SEND) as span:
+        response = requests.post(settings.TELEGRAM_SEND_PHOTO_URL, data=data, files=files)
+        if span:
+            span.set_attribute('http.status_code', response.status_code)
+    if response.status_code == HTTPStatus.OK:
+        record_outcome(EmailOutcomes.DELIVERED)
+    else:
+        record_outcome(EmailOutcomes.FAILED)
         redis_key = f'telegram_id_{telegram_id}_failed_photos'
         failed_data = {
             'data': data,
-            'image': base64.b64encode(image_bytes).decode('utf-8')
+            'image': base64.b64encode(image_bytes).decode('utf-8'),
+            'traceparent': get_traceparent()
         }
         redis_client.prepend_to_list(redis_key, json.dumps(failed_data))
         redis_client.touch(redis_key, timeout=86400)
@@ -0,0 +1,247 @@
+import atexit
+import hashlib
+import json
+import logging
+import os
+import queue
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Iterator
+
+import requests
+from django.conf import settings
+
+TRACEPARENT_HEADER = 'traceparent'
+SPAN_KIND_INTERNAL = 1
+STATUS_CODE_ERROR = 2
+
+logger = logging.getLogger('infrastructure')
+
+
+@dataclass(slots=True, frozen=True)
+class SpanContext:
+    """Контекст трассировки в формате W3C Trace Context: идентификатор трассы и текущего спана."""
+
+    trace_id: str
+    span_id: str
+
+    def to_traceparent(self) -> str:
+        """Значение заголовка traceparent."""
+        return f'00-{self.trace_id}-{self.span_id}-01'
+
+    @classmethod
+    def from_traceparent(cls, traceparent: str | None) -> 'SpanContext | None':
+        """Разбор заголовка traceparent, None для пустого или некорректного значения."""
+        parts = traceparent.split('-') if traceparent else []
+        if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+            return None
+        return cls(trace_id=parts[1], span_id=parts[2])
+
+
+current_span_context: ContextVar[SpanContext | None] = ContextVar('current_span_context', default=None)
+
+
+@dataclass(slots=True)
+class Span:
+    """Спан трассировки этапа обработки письма."""
+
+    name: str
+    context: SpanContext
+    parent_span_id: str = ''
+    start_ns: int = field(default_factory=time.time_ns)
+    end_ns: int = 0
+    attributes: dict[str, Any] = field(default_factory=dict)
+    error: str = ''
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        """Установка атрибута спана."""
+        self.attributes[key] = value
+
+    def to_otlp(self) -> dict[str, Any]:
+        """Представление спана в формате OTLP/JSON."""
+        otlp_span = {
+            'traceId': self.context.trace_id,
+            'spanId': self.context.span_id,
+            'parentSpanId': self.parent_span_id,
+            'name': self.name,
+            'kind': SPAN_KIND_INTERNAL,
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.end_ns),
+            'attributes': otlp_attributes(self.attributes),
+        }
+        if self.error:
+            otlp_span['status'] = {'code': STATUS_CODE_ERROR, 'message': self.error}
+        return otlp_span
+
+
+def otlp_attributes(attributes: dict[str, Any]) -> list[dict[str, Any]]:
+    """Преобразование атрибутов в список пар ключ-значение OTLP/JSON."""
+    otlp_values = []
+    for key, value in attributes.items():
+        otlp_value: dict[str, Any]
+        if isinstance(value, bool):
+            otlp_value = {'boolValue': value}
+        elif isinstance(value, int):
+            otlp_value = {'intValue': str(value)}
+        elif isinstance(value, float):
+            otlp_value = {'doubleValue': value}
+        else:
+            otlp_value = {'stringValue': str(value)}
+        otlp_values.append({'key': key, 'value': otlp_value})
+    return otlp_values
+
+
+class SpanExporter:
+    """
+    Экспорт завершенных спанов в формате OTLP/JSON: фоновый поток периодически выгружает очередь пачками.
+    TRACING_EXPORTER: 'file' - строки ExportTraceServiceRequest в TRACING_FILE_PATH (читает приемник otlpjsonfile
+    OpenTelemetry Collector), 'otlp' - отправка в коллектор по OTLP/HTTP, пустое значение - экспорт отключен.
+    """
+
+    def __init__(self):
+        self._queue: queue.Queue = queue.Queue(maxsize=settings.TRACING_QUEUE_SIZE)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pid: int | None = None
+
+    def export(self, span: Span) -> None:
+        """Постановка спана в очередь экспорта; при переполнении очереди спан отбрасывается."""
+        if not settings.TRACING_EXPORTER:
+            return
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(span.to_otlp())
+        except queue.Full:
+            pass
+
+    def _ensure_worker(self) -> None:
+        """Запуск потока экспорта в текущем процессе (в том числе в дочерних процессах после fork)."""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=settings.TRACING_QUEUE_SIZE)
+            threading.Thread(target=self._run, name='span-exporter', daemon=True).start()
+            atexit.register(self.flush)
+            self._pid = os.getpid()
+
+    def _run(self) -> None:
+        """Периодическая выгрузка накопленных спанов."""
+        while True:
+            time.sleep(settings.TRACING_EXPORT_INTERVAL)
+            self.flush()
+
+    def flush(self) -> None:
+        """Синхронная выгрузка всех спанов из очереди пачками по TRACING_EXPORT_BATCH_SIZE."""
+        with self._flush_lock:
+            while True:
+                batch: list[dict[str, Any]] = []
+                while len(batch) < settings.TRACING_EXPORT_BATCH_SIZE:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if not batch:
+                    return
+                self._write(batch)
+
+    @staticmethod
+    def _write(batch: list[dict[str, Any]]) -> None:
+        """Запись пачки спанов одним запросом ExportTraceServiceRequest."""
+        payload = {
+            'resourceSpans': [{
+                'resource': {
+                    'attributes': otlp_attributes({
+                        'service.name': settings.TRACING_SERVICE_NAME,
+                        'service.instance.id': settings.NODE_ID,
+                    }),
+                },
+                'scopeSpans': [{'scope': {'name': 'infrastructure.utils.tracing'}, 'spans': batch}],
+            }]
+        }
+        try:
+            if settings.TRACING_EXPORTER == 'file':
+                with open(settings.TRACING_FILE_PATH, 'a') as traces_file:
+                    traces_file.write(json.dumps(payload, separators=(',', ':')) + '\n')
+            elif settings.TRACING_EXPORTER == 'otlp':
+                requests.post(settings.TRACING_OTLP_ENDPOINT, json=payload, timeout=5).raise_for_status()
+        except (OSError, requests.RequestException) as error:
+            logger.error(f'Spans export failed: {error}')
+
+
+span_exporter = SpanExporter()
+
+
+def message_trace_id(box_id: int, uid: int) -> str:
+    """Идентификатор трассы письма, вычисляемый из id почтового ящика и UID письма."""
+    return hashlib.sha256(f'{box_id}:{uid}'.encode()).hexdigest()[:32]
+
+
+def get_traceparent() -> str | None:
+    """Заголовок traceparent текущего спана для передачи в задачи Celery и данные переотправки."""
+    span_context = current_span_context.get()
+    return span_context.to_traceparent() if span_context else None
+
+
+def get_task_traceparent(request: Any) -> str | None:
+    """Заголовок traceparent из заголовков сообщения задачи Celery."""
+    return (request.headers or {}).get(TRACEPARENT_HEADER)
+
+
+@contextmanager
+def start_span(name: str, trace_id: str | None = None, **attributes: Any) -> Iterator[Span]:
+    """
+    Спан, дочерний к текущему спану контекста. Без текущего спана начинается новая трасса
+    с идентификатором trace_id (случайным, если он не указан).
+    """
+    parent = current_span_context.get()
+    if trace_id is None:
+        trace_id = parent.trace_id if parent else secrets.token_hex(16)
+    parent_span_id = parent.span_id if parent and parent.trace_id == trace_id else ''
+    span = Span(name=name, context=SpanContext(trace_id, secrets.token_hex(8)), parent_span_id=parent_span_id,
+                attributes=attributes)
+    token = current_span_context.set(span.context)
+    try:
+        yield span
+    except Exception as error:
+        span.error = type(error).__name__
+        raise
+    finally:
+        span.end_ns = time.time_ns()
+        current_span_context.reset(token)
+        logger.debug(
+            f'Span {name} finished in {(span.end_ns - span.start_ns) / 1e6:.1f} ms',
+            extra={'trace_id': trace_id, 'span_id': span.context.span_id}
+        )
+        span_exporter.export(span)
+
+
+@contextmanager
+def use_traceparent(traceparent: str | None) -> Iterator[None]:
+    """Продолжение трассы из заголовка traceparent: новые спаны становятся дочерними к переданному."""
+    span_context = SpanContext.from_traceparent(traceparent)
+    if span_context is None:
+        yield
+        return
+    token = current_span_context.set(span_context)
+    try:
+        yield
+    finally:
+        current_span_context.reset(token)
+
+
+class TraceContextFilter(logging.Filter):
+    """Добавление trace_id и span_id текущего спана в записи логов."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        """Заполнение полей трассировки записи лога."""
+        span_context = current_span_context.get()
+        if not hasattr(record, 'trace_id'):
+            record.trace_id = span_context.trace_id if span_context else '-'
+            record.span_id = span_context.span_id if span_context else '-'
+        return True
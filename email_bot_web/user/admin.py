@@ -1,10 +1,11 @@
 from django.contrib import admin
 from django.http import HttpRequest
+from infrastructure.utils.admin_tools import EstimatedCountPaginator, NumericSearchMixin
 from user.models import BotUser
 
 
 @admin.register(BotUser)
-class BotUserAdmin(admin.ModelAdmin):
+class BotUserAdmin(NumericSearchMixin, admin.ModelAdmin):
     """Админ панель модели пользователя."""
 
     fields = ('telegram_id',)
@@ -13,6 +14,8 @@ class BotUserAdmin(admin.ModelAdmin):
     ordering = ('telegram_id',)
     search_help_text = 'Поиск по telegram ID'
     list_per_page = 50
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
     def has_change_permission(self, request: HttpRequest, obj: BotUser | None = None) -> bool:
         """Проверяет, есть ли у пользователя разрешение на изменение объектов модели BotUser."""
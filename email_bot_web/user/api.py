@@ -5,6 +5,7 @@ from api.v1.schemas import ResponseSchema
 from django.http import HttpRequest
 from email_service.schemas import (
     BoxFiltersOut,
+    BoxProvisioningJobOut,
     EmailBoxesOut,
     EmailBoxIn,
     EmailBoxWithFiltersOut,
@@ -14,12 +15,10 @@ from infrastructure.exceptions import (
     AppliedFiltersNotFound,
     BotUserAlreadyExists,
     BotUserNotFound,
+    BoxProvisioningJobNotFound,
     BoxUserNotEqualToRequestedTelegramUser,
-    EmailBoxAlreadyExists,
     EmailBoxNotFound,
-    EmailCredsInvalid,
     EmailServiceNotFound,
-    IMAPServerTimeout,
     UserBoxesNotFound,
 )
 from ninja import Router
@@ -71,18 +70,18 @@ async def user_exists(request: HttpRequest, telegram_id: int) -> tuple[HTTPStatu
 @user_router.post(
     '/{telegram_id}/boxes',
     response={
-        HTTPStatus.CREATED: ResponseSchema,
-        HTTPStatus.BAD_REQUEST: ResponseSchema,
+        HTTPStatus.ACCEPTED: BoxProvisioningJobOut,
         HTTPStatus.NOT_FOUND: ResponseSchema
     },
-    description='Создание нового почтового ящика для пользователя с {telegram_id}',
+    description='Постановка в очередь создания нового почтового ящика для пользователя с {telegram_id}. '
+                'Проверка учетных данных выполняется в фоне, результат - в /{telegram_id}/boxes/jobs/{job_id}',
     summary='Создание почтового ящика'
 )
 async def create_box(request: HttpRequest, telegram_id: int, payload: EmailBoxIn) -> tuple[HTTPStatus, dict[str, Any]]:
-    """Создание нового почтового ящика для указанного пользователя."""
+    """Постановка в очередь создания нового почтового ящика для указанного пользователя."""
     try:
-        await email_box_service.create_box(telegram_id=telegram_id, payload=payload)
-        return HTTPStatus.CREATED, {'message': 'Email box successfully created'}
+        job = await email_box_service.start_box_provisioning(telegram_id=telegram_id, payload=payload)
+        return HTTPStatus.ACCEPTED, job
     except BotUserNotFound:
         return HTTPStatus.NOT_FOUND, {'message': f'Requested bot user with telegram_id:{telegram_id} doesn\'t exist'}
     except EmailServiceNotFound:
@@ -90,12 +89,29 @@ async def create_box(request: HttpRequest, telegram_id: int, payload: EmailBoxIn
             HTTPStatus.NOT_FOUND,
             {'message': f'Requested email service with id:{payload.email_service} doesn\'t exist'}
         )
-    except EmailBoxAlreadyExists:
-        return HTTPStatus.BAD_REQUEST, {'message': 'This email box already exists'}
-    except EmailCredsInvalid:
-        return HTTPStatus.BAD_REQUEST, {'message': 'Your email credentials are incorrect'}
-    except IMAPServerTimeout:
-        return HTTPStatus.BAD_REQUEST, {'message': 'IMAP server is not responding'}
+
+
+@user_router.get(
+    '/{telegram_id}/boxes/jobs/{job_id}',
+    response={
+        HTTPStatus.OK: BoxProvisioningJobOut,
+        HTTPStatus.NOT_FOUND: ResponseSchema
+    },
+    description='Получение состояния задачи {job_id} создания почтового ящика пользователя {telegram_id}: '
+                'pending, running, done (box_id) или failed (error)',
+    summary='Получение состояния создания почтового ящика'
+)
+async def get_box_provisioning_job(
+        request: HttpRequest,
+        telegram_id: int,
+        job_id: str
+) -> tuple[HTTPStatus, dict[str, Any]]:
+    """Получение состояния задачи создания почтового ящика."""
+    try:
+        job = await email_box_service.get_provisioning_job(telegram_id=telegram_id, job_id=job_id)
+        return HTTPStatus.OK, job
+    except BoxProvisioningJobNotFound:
+        return HTTPStatus.NOT_FOUND, {'message': f'Requested box provisioning job with id:{job_id} not found'}
 
 
 @user_router.get(
@@ -122,7 +138,8 @@ async def get_user_boxes(request: HttpRequest, telegram_id: int) -> tuple[HTTPSt
     '{telegram_id}/boxes/{box_id}',
     response={
         HTTPStatus.OK: EmailBoxWithFiltersOut,
-        HTTPStatus.NOT_FOUND: ResponseSchema
+        HTTPStatus.NOT_FOUND: ResponseSchema,
+        HTTPStatus.BAD_REQUEST: ResponseSchema
     },
     description='Получение почтового ящика {box_id} пользователя {telegram_id}',
     summary='Получение почтового ящика'
@@ -217,6 +234,8 @@ async def pause_box_listening(request: HttpRequest, telegram_id: int, box_id: in
     try:
         await email_box_service.pause_box_listening(telegram_id=telegram_id, box_id=box_id)
         return HTTPStatus.OK, {'message': f'The user:{telegram_id} box:{box_id} listening was paused'}
+    except BotUserNotFound:
+        return HTTPStatus.NOT_FOUND, {'message': f'Requested bot user with telegram_id:{telegram_id} doesn\'t exist'}
     except EmailBoxNotFound:
         return HTTPStatus.NOT_FOUND, {'message': f'Requsted email box with id:{box_id} not found'}
     except BoxUserNotEqualToRequestedTelegramUser:
@@ -242,6 +261,8 @@ async def resume_box_listening(
     try:
         await email_box_service.resume_box_listening(telegram_id=telegram_id, box_id=box_id)
         return HTTPStatus.OK, {'message': f'The user:{telegram_id} box:{box_id} listening was resumed'}
+    except BotUserNotFound:
+        return HTTPStatus.NOT_FOUND, {'message': f'Requested bot user with telegram_id:{telegram_id} doesn\'t exist'}
     except EmailBoxNotFound:
         return HTTPStatus.NOT_FOUND, {'message': f'Requsted email box with id:{box_id} not found'}
     except BoxUserNotEqualToRequestedTelegramUser: